@@ -0,0 +1,201 @@
+"""Caching of expensive query results, using Django's cache framework.
+
+By using the cache framework (e.g. Redis or Memcached), all workers share the results.
+The cached entries can be invalidated per feature type, e.g. after the data is imported::
+
+    from gisserver.cache import clear_feature_type_cache
+
+    clear_feature_type_cache("restaurant")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import typing
+from collections.abc import Callable
+
+from django.core.cache import caches
+from django.db import models
+from django.http import HttpResponse
+from django.utils.translation import get_language
+
+from gisserver import conf
+from gisserver.db import get_bounded_count, get_wgs84_bounding_box
+from gisserver.geometries import WGS84BoundingBox
+
+if typing.TYPE_CHECKING:
+    from gisserver.features import FeatureType
+    from gisserver.types import GeometryXsdElement
+
+__all__ = (
+    "clear_feature_type_cache",
+    "get_cached_bounding_box",
+    "get_cached_capabilities",
+    "get_cached_count",
+)
+
+
+def _get_cache():
+    return caches[conf.GISSERVER_CACHE_ALIAS]
+
+
+def _get_generation_key(feature_type: FeatureType | str) -> str:
+    name = feature_type if isinstance(feature_type, str) else feature_type.name
+    return f"gisserver:generation:{name}"
+
+
+def _get_generations(feature_types: list[FeatureType]) -> list[int]:
+    """Tell how often the cached entries of the feature types were invalidated."""
+    generation_keys = [_get_generation_key(feature_type) for feature_type in feature_types]
+    generations = _get_cache().get_many(generation_keys)
+    return [generations.get(key, 0) for key in generation_keys]
+
+
+def get_cached_count(
+    queryset: models.QuerySet,
+    feature_types: list[FeatureType],
+    limit: int | None = None,
+    calculate: bool = True,
+) -> int | None:
+    """Count the results of a query, and cache the result for ``GISSERVER_COUNT_CACHE_TIMEOUT``.
+
+    The cache key is a fingerprint of the SQL query and its parameters,
+    without ordering, pagination and rendering details.
+    Hence, all pages of the same query (and all output formats) share the same count.
+
+    :param calculate: When disabled, ``None`` is returned when the count isn't cached.
+    """
+    timeout = conf.GISSERVER_COUNT_CACHE_TIMEOUT
+    if not timeout:
+        return get_bounded_count(queryset, limit=limit) if calculate else None
+
+    cache = _get_cache()
+    key = _get_count_key(queryset, feature_types, limit)
+    count = cache.get(key)
+    if count is None:
+        if not calculate:
+            return None
+        count = get_bounded_count(queryset, limit=limit)
+        cache.set(key, count, timeout)
+    return count
+
+
+def get_cached_bounding_box(
+    feature_type: FeatureType,
+    queryset: models.QuerySet,
+    geo_element: GeometryXsdElement,
+    estimated: bool = False,
+) -> WGS84BoundingBox | None:
+    """Calculate the bounding box of a feature type,
+    and cache the result for ``GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT``.
+
+    The cache key is a fingerprint of the SQL query and its parameters,
+    so a different queryset (e.g. filtered for the current user) has its own entry.
+    """
+    timeout = conf.GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT
+    if not timeout:
+        return get_wgs84_bounding_box(queryset, geo_element, estimated=estimated)
+
+    cache = _get_cache()
+    fingerprint = _get_query_fingerprint(
+        queryset.order_by(),
+        geo_element.orm_path,
+        estimated,
+        _get_generations([feature_type]),
+    )
+    key = f"gisserver:bbox:{fingerprint}"
+    coordinates = cache.get(key)
+    if coordinates is None:
+        bbox = get_wgs84_bounding_box(queryset, geo_element, estimated=estimated)
+        # Store plain values, an empty tuple tells there is no bounding box (e.g. empty table).
+        coordinates = (bbox.min_x, bbox.min_y, bbox.max_x, bbox.max_y) if bbox else ()
+        cache.set(key, coordinates, timeout)
+        return bbox
+
+    return WGS84BoundingBox(*coordinates) if coordinates else None
+
+
+def get_cached_capabilities(
+    key_parts: tuple, feature_types: list[FeatureType], render: Callable[[], HttpResponse]
+) -> HttpResponse:
+    """Render the ``GetCapabilities`` response, and cache it for ``GISSERVER_CAPABILITIES_CACHE_TIMEOUT``.
+
+    The active language is part of the cache key, as the document can contain translated texts.
+
+    :param key_parts: Everything else that makes the document different
+        (e.g. the view, service, version, namespaces and absolute URL).
+    :param feature_types: The feature types in the document, to allow invalidating the entry.
+    :param render: The function to render the response.
+    """
+    timeout = conf.GISSERVER_CAPABILITIES_CACHE_TIMEOUT
+    if not timeout:
+        return render()
+
+    cache = _get_cache()
+    fingerprint = hashlib.sha256(
+        repr(
+            (
+                key_parts,
+                get_language(),
+                [feature_type.name for feature_type in feature_types],
+                _get_generations(feature_types),
+            )
+        ).encode()
+    ).hexdigest()
+    key = f"gisserver:capabilities:{fingerprint}"
+    response = cache.get(key)
+    if response is None:
+        response = render()
+        cache.set(key, response, timeout)
+    return response
+
+
+def clear_feature_type_cache(feature_type: FeatureType | str):
+    """Invalidate the cached results of a feature type, e.g. after the data was changed.
+
+    This affects the counts, the bounding box, and the ``GetCapabilities`` documents
+    that include the feature type. This doesn't delete the entries,
+    but lets new requests use a different cache key.
+    """
+    cache = _get_cache()
+    key = _get_generation_key(feature_type)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key did not exist yet (or expired)
+        cache.set(key, 1, timeout=None)
+
+
+def _get_count_key(
+    queryset: models.QuerySet, feature_types: list[FeatureType], limit: int | None
+) -> str:
+    """Generate the fingerprint of a query, which is used as cache key."""
+    # Selecting only the primary key removes all differences in the projection
+    # (e.g. .only(), select_related() and annotations that output formats add).
+    fingerprint = _get_query_fingerprint(
+        queryset.order_by().values("pk"), limit, _get_generations(feature_types)
+    )
+    return f"gisserver:count:{fingerprint}"
+
+
+def _get_query_fingerprint(queryset: models.QuerySet, *extra) -> str:
+    """Generate a hash of the SQL query, its parameters, database and any extra values."""
+    sql, params = queryset.query.sql_with_params()
+    return hashlib.sha256(
+        repr(
+            (
+                queryset.db,
+                sql,
+                [_get_param_key(param) for param in params],
+                *extra,
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def _get_param_key(param):
+    """Give a stable representation of an SQL parameter."""
+    ewkb = getattr(param, "ewkb", None)  # GEOSGeometry / PostGISAdapter
+    if ewkb is not None:
+        return bytes(ewkb).hex()
+    return repr(param)
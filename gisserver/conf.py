@@ -14,10 +14,22 @@ GISSERVER_CAPABILITIES_BOUNDING_BOX = getattr(
     settings, "GISSERVER_CAPABILITIES_BOUNDING_BOX", True
 )
 
+# Whether the bounding box is read from the PostGIS table statistics (ST_EstimatedExtent)
+# instead of reading all geometries. Only used when the feature queryset isn't filtered.
+GISSERVER_ESTIMATED_EXTENT = getattr(settings, "GISSERVER_ESTIMATED_EXTENT", False)
+
 # Whether to use the database for rendering GML / GeoJSON fragments.
 # This gives a better performance overall, but output may vary between database vendors.
 GISSERVER_USE_DB_RENDERING = getattr(settings, "GISSERVER_USE_DB_RENDERING", True)
 
+# Whether features without relations are rendered as a whole by the database.
+# This only has effect when GISSERVER_USE_DB_RENDERING is enabled.
+GISSERVER_USE_DB_FEATURE_RENDERING = getattr(settings, "GISSERVER_USE_DB_FEATURE_RENDERING", False)
+
+# Whether the next chunk of database results is read in a background thread,
+# while the current chunk is rendered. This overlaps the database and rendering work.
+GISSERVER_DB_READ_AHEAD = getattr(settings, "GISSERVER_DB_READ_AHEAD", False)
+
 # The precision to use for DB rendering. (PostGIS stores reliably up till 15 decimals)
 GISSERVER_DB_PRECISION = getattr(settings, "GISSERVER_DB_PRECISION", 15)
 
@@ -27,9 +39,39 @@ GISSERVER_SUPPORTED_CRS_ONLY = getattr(settings, "GISSERVER_SUPPORTED_CRS_ONLY",
 
 # Whether the total results need to be counted.
 # By disabling this, clients just need to fetch more pages
-# 0 = No counting, 1 = all pages, 2 = only for the first page.
+# 0 = No counting, 1 = all pages, 2 = only for the first page, 3 = estimate large results.
 GISSERVER_COUNT_NUMBER_MATCHED = getattr(settings, "GISSERVER_COUNT_NUMBER_MATCHED", 1)
 
+# Stop counting numberMatched after this many results (reported as "unknown" with a lower bound).
+GISSERVER_COUNT_NUMBER_MATCHED_LIMIT = getattr(
+    settings, "GISSERVER_COUNT_NUMBER_MATCHED_LIMIT", None
+)
+
+# Below which estimate an exact count is still performed (for GISSERVER_COUNT_NUMBER_MATCHED=3).
+GISSERVER_COUNT_ESTIMATE_THRESHOLD = getattr(settings, "GISSERVER_COUNT_ESTIMATE_THRESHOLD", 10000)
+
+# Whether the COUNT query runs in a background thread (with a second connection),
+# while the page results are read. Both use the same database snapshot (PostgreSQL only).
+GISSERVER_CONCURRENT_COUNT = getattr(settings, "GISSERVER_CONCURRENT_COUNT", False)
+
+# The number of threads to evaluate the queries of multiple <wfs:Query> elements in parallel.
+# Each thread uses its own database connection. 0 disables this.
+GISSERVER_QUERY_THREADS = getattr(settings, "GISSERVER_QUERY_THREADS", 0)
+GISSERVER_QUERY_THREADS_PER_REQUEST = getattr(settings, "GISSERVER_QUERY_THREADS_PER_REQUEST", 4)
+
+# How long counted numberMatched results are cached (in seconds), 0 disables the cache.
+GISSERVER_COUNT_CACHE_TIMEOUT = getattr(settings, "GISSERVER_COUNT_CACHE_TIMEOUT", 0)
+
+# How long the GetCapabilities document, and the bounding box of each feature type are cached.
+GISSERVER_CAPABILITIES_CACHE_TIMEOUT = getattr(settings, "GISSERVER_CAPABILITIES_CACHE_TIMEOUT", 0)
+GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT = getattr(settings, "GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT", 0)
+
+# Which Django cache (from the CACHES setting) to use for storing results.
+GISSERVER_CACHE_ALIAS = getattr(settings, "GISSERVER_CACHE_ALIAS", "default")
+
+# Whether the "next" links use keyset pagination (a CURSOR position) instead of an OFFSET.
+GISSERVER_KEYSET_PAGINATION = getattr(settings, "GISSERVER_KEYSET_PAGINATION", False)
+
 # -- output rendering
 
 # Following https://docs.geoserver.org/stable/en/user/services/wfs/axis_order.html here:
@@ -48,6 +90,29 @@ GISSERVER_GET_FEATURE_OUTPUT_FORMATS = getattr(
     settings, "GISSERVER_GET_FEATURE_OUTPUT_FORMATS", {}
 )
 
+# Whether GML output is written to a temporary file first, so the page is read in a single pass.
+# This avoids holding all results in memory for the numberReturned header.
+GISSERVER_GML_SPOOLED_OUTPUT = getattr(settings, "GISSERVER_GML_SPOOLED_OUTPUT", False)
+
+# Whether streaming responses are compressed by the renderer (using the Accept-Encoding header).
+# A single compressor is used for the whole response, which gives better results than GZipMiddleware.
+GISSERVER_COMPRESS_STREAMING = getattr(settings, "GISSERVER_COMPRESS_STREAMING", False)
+
+# The supported content-encodings and their level, in order of preference.
+# The "br" and "zstd" encodings require the "brotli" and "zstandard" packages.
+GISSERVER_COMPRESSION_LEVELS = getattr(
+    settings, "GISSERVER_COMPRESSION_LEVELS", {"zstd": 3, "br": 4, "gzip": 6}
+)
+
+# How much output is collected before a chunk is sent to the client, the initial value when it's tuned.
+GISSERVER_CHUNK_SIZE = getattr(settings, "GISSERVER_CHUNK_SIZE", 40_000)
+
+# The time (in seconds) after which collected output is sent to the client with the next written row.
+GISSERVER_CHUNK_MAX_DELAY = getattr(settings, "GISSERVER_CHUNK_MAX_DELAY", 1.0)
+
+# Whether the chunk size is tuned to the measured write throughput.
+GISSERVER_CHUNK_ADAPTIVE = getattr(settings, "GISSERVER_CHUNK_ADAPTIVE", True)
+
 # -- max page size
 
 # Allow tuning the page size without having to override code.
@@ -329,6 +329,26 @@ class CRS:
         else:
             return _get_proj_crs_from_authority(self.authority, self.srid)
 
+    def is_axis_swap_only(
+        self, geometry: GEOSGeometry, axis_order: AxisOrder | None = None
+    ) -> bool:
+        """Tell whether :meth:`apply_to` would only swap the x/y axis of the geometry.
+
+        This happens when the geometry is already in the same spatial reference system,
+        but the output needs to be written in north/east ordering (e.g. ``urn:...:4326``).
+        Output renderers can swap the coordinates while writing them,
+        which avoids a GEOS->GDAL->GEOS roundtrip for every geometry.
+        """
+        if axis_order is None:
+            axis_order = AxisOrder.TRADITIONAL if self.force_xy else AxisOrder.AUTHORITY
+
+        source_axis_order = getattr(geometry, "_axis_order", AxisOrder.TRADITIONAL)
+        return (
+            self.srid == geometry.srid
+            and source_axis_order != axis_order
+            and self.is_north_east_order
+        )
+
     def apply_to(
         self,
         geometry: AnyGeometry,
@@ -2,12 +2,21 @@
 
 from __future__ import annotations
 
+import json
 import logging
+import operator
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache, reduce
+from typing import TypeVar
 
-from django.contrib.gis.db.models import Extent, PolygonField, functions
+from django.contrib.gis.db.models import Extent, GeometryField, PolygonField, functions
 from django.contrib.gis.db.models.fields import ExtentField
-from django.db import connection, connections, models
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DatabaseError, connection, connections, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast
 
 from gisserver import conf
 from gisserver.crs import CRS, WGS84
@@ -15,6 +24,34 @@ from gisserver.geometries import WGS84BoundingBox
 from gisserver.types import GeometryXsdElement
 
 logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+_executor = None
+_executor_workers = None  # the max_workers of _executor
+_executor_lock = threading.Lock()
+
+# Field types that can be compared in a keyset pagination query.
+_KEYSET_FIELD_TYPES = {
+    "AutoField",
+    "BigAutoField",
+    "SmallAutoField",
+    "IntegerField",
+    "BigIntegerField",
+    "SmallIntegerField",
+    "PositiveIntegerField",
+    "PositiveBigIntegerField",
+    "PositiveSmallIntegerField",
+    "BooleanField",
+    "CharField",
+    "TextField",
+    "SlugField",
+    "DateField",
+    "DateTimeField",
+    "TimeField",
+    "DecimalField",
+    "FloatField",
+    "UUIDField",
+}
 
 
 class AsEWKT(functions.GeoFunc):
@@ -43,6 +80,8 @@ class AsGML(functions.AsGML):
         envelope=False,
         is_latlon=False,
         long_urn=False,
+        gml_id=None,
+        srs_name=None,
         **extra,
     ):
         # Note that Django's AsGml the defaults are: version=2, precision=8
@@ -50,6 +89,15 @@ class AsGML(functions.AsGML):
         self.envelope = envelope
         self.is_latlon = is_latlon
         self.long_urn = long_urn
+        self.srs_name = srs_name
+        if gml_id is not None:
+            # The gml:id is the last parameter of ST_AsGML(), added after the options.
+            self.set_source_expressions(
+                [*self.get_source_expressions(), *self._parse_expressions(gml_id)]
+            )
+            self.has_gml_id = True
+        else:
+            self.has_gml_id = False
 
     def as_postgresql(self, compiler, connection, **extra_context):
         # Fill options parameter (https://postgis.net/docs/ST_AsGML.html)
@@ -67,8 +115,95 @@ class AsGML(functions.AsGML):
             # https://github.com/postgis/postgis/blob/81e2bc783b77cc740291445e992658e1db7179e0/liblwgeom/lwout_gml.c#L121
             options |= 16
 
-        template = f"%(function)s(%(expressions)s, {options})"
-        return self.as_sql(compiler, connection, template=template, **extra_context)
+        if self.has_gml_id:
+            # Signature is ST_AsGML(version, geom, precision, options, nprefix, id)
+            clone = self.copy()
+            *expressions, gml_id = clone.get_source_expressions()
+            clone.set_source_expressions([*expressions, Value(options), Value("gml"), gml_id])
+            sql, params = clone.as_sql(compiler, connection, **extra_context)
+        else:
+            template = f"%(function)s(%(expressions)s, {options})"
+            sql, params = self.as_sql(compiler, connection, template=template, **extra_context)
+
+        if self.srs_name:
+            # PostGIS only generates the "EPSG:xxxx" or "urn:ogc:def:crs:EPSG::xxxx" notation.
+            # Replace the first srsName, which is the one of the outer geometry.
+            sql = f"regexp_replace({sql}, %s, %s)"
+            params = (*params, 'srsName="[^"]*"', f'srsName="{self.srs_name}"')
+        return sql, params
+
+
+class XmlElement(models.Func):
+    """PostgreSQL ``xmlelement()`` function, to let the database write (and escape) an XML tag.
+    The result is cast to text, so it can be concatenated with other output.
+    """
+
+    function = "xmlelement"
+    template = '%(function)s(name "%(xml_qname)s", %(expressions)s)::text'
+    output_field = models.TextField()
+
+    def __init__(self, xml_qname: str, expression, **extra):
+        if '"' in xml_qname or "%" in xml_qname:
+            raise ValueError(f"Invalid XML name: {xml_qname}")
+        super().__init__(expression, xml_qname=xml_qname, **extra)
+
+
+class JsonBuildObject(models.Func):
+    """PostgreSQL ``json_build_object()`` function.
+    Unlike Django's ``JSONObject`` (which uses ``jsonb_build_object()``),
+    this keeps the ordering of the keys.
+    """
+
+    function = "json_build_object"
+    output_field = models.JSONField()
+
+    def __init__(self, **fields):
+        expressions = []
+        for key, value in fields.items():
+            # Typed literals, as the function arguments are untyped ("variadic any")
+            expressions.extend((Cast(Value(key), models.TextField()), value))
+        super().__init__(*expressions)
+
+
+class FloatRepr(models.Func):
+    """Format a float as text, like Python's ``repr(float)`` does.
+
+    PostgreSQL writes "5.0" as "5", and switches to the exponent notation at 1e15 instead of 1e16.
+    The formatting happens in a subquery, so the expression is only evaluated once.
+    With ``as_json=True``, the notation of :mod:`orjson` is followed instead: 1e-05 becomes "0.00001",
+    1e-06 becomes "1e-6" and NaN/Infinity become "null". The result is a JSON value then.
+    """
+
+    template = (
+        "(SELECT CASE"
+        " WHEN t = 'NaN' THEN 'nan'"
+        " WHEN t = 'Infinity' THEN 'inf'"
+        " WHEN t = '-Infinity' THEN '-inf'"
+        " WHEN t ~ 'e\\+15$' THEN regexp_replace(rtrim("
+        "(split_part(t, 'e', 1)::numeric * 1e15)::numeric(32, 16)::text, '0'), '\\.$', '.0')"
+        " WHEN t ~ '^-?[0-9]+$' THEN t || '.0'"
+        " ELSE t END"
+        " FROM (SELECT (%(expressions)s)::float8::text AS t) AS float_repr)"
+    )
+    json_template = (
+        "(SELECT CASE"
+        " WHEN t IN ('NaN', 'Infinity', '-Infinity') THEN 'null'"
+        " WHEN t ~ 'e\\+15$' THEN regexp_replace(rtrim("
+        "(split_part(t, 'e', 1)::numeric * 1e15)::numeric(32, 16)::text, '0'), '\\.$', '.0')"
+        " WHEN t ~ 'e-05$' THEN (split_part(t, 'e', 1)::numeric * 0.00001)::text"
+        " WHEN t ~ 'e-0' THEN replace(t, 'e-0', 'e-')"
+        " WHEN t ~ '^-?[0-9]+$' THEN t || '.0'"
+        " ELSE t END"
+        " FROM (SELECT (%(expressions)s)::float8::text AS t) AS float_repr)::json"
+    )
+
+    def __init__(self, expression, as_json=False, **extra):
+        if as_json:
+            extra.setdefault("template", self.json_template)
+            extra.setdefault("output_field", models.JSONField())
+        else:
+            extra.setdefault("output_field", models.TextField())
+        super().__init__(expression, **extra)
 
 
 class ST_SetSRID(functions.Transform):
@@ -108,13 +243,21 @@ class ST_Union(functions.Union):
 
 
 def get_wgs84_bounding_box(
-    queryset: models.QuerySet, geo_element: GeometryXsdElement
+    queryset: models.QuerySet, geo_element: GeometryXsdElement, estimated: bool = False
 ) -> WGS84BoundingBox:
     """Calculate the WGS84 bounding box for a feature.
 
     Note that the ``<ows:WGS84BoundingBox>`` element
     always uses longitude/latitude, and doesn't describe a CRS.
+
+    :param estimated: Use the PostGIS table statistics when the queryset isn't filtered.
+        This avoids reading all geometries, but the result can be slightly larger.
     """
+    if estimated:
+        box = get_estimated_wgs84_bounding_box(queryset, geo_element)
+        if box is not None:
+            return box
+
     if connections[queryset.db].vendor == "postgresql":
         # Allow a more efficient way to combine geometry first, transform once later
         box = queryset.aggregate(
@@ -132,6 +275,201 @@ def get_wgs84_bounding_box(
     return WGS84BoundingBox(*box) if box else None
 
 
+def get_estimated_wgs84_bounding_box(
+    queryset: models.QuerySet, geo_element: GeometryXsdElement
+) -> WGS84BoundingBox | None:
+    """Read the WGS84 bounding box from the PostGIS table statistics, using ``ST_EstimatedExtent``.
+
+    This is only possible when the queryset reads the whole table, and the geometry is a column
+    of that table. ``None`` is returned when no estimate can be made (e.g. the table was never
+    analyzed), so the caller can calculate the exact extent instead.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    field = geo_element.source
+    if (
+        connection.vendor != "postgresql"
+        or query.where
+        or query.distinct
+        or query.combinator
+        or query.is_sliced
+        or not isinstance(field, GeometryField)
+        or field.geography
+        or field.model is not queryset.model._meta.concrete_model
+    ):
+        return None
+
+    try:
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            # The schema is passed explicitly, as the 2-argument form can't address tables
+            # outside the search_path. The table is resolved the same way Django queries it.
+            cursor.execute(
+                "SELECT ST_XMin(box), ST_YMin(box), ST_XMax(box), ST_YMax(box) FROM ("
+                "SELECT Box2D(ST_Transform(ST_SetSRID("
+                "ST_EstimatedExtent(n.nspname::text, c.relname::text, %s)::geometry, %s), %s))"
+                " AS box FROM pg_class c INNER JOIN pg_namespace n ON n.oid = c.relnamespace"
+                " WHERE c.oid = to_regclass(%s)) AS extent",
+                [
+                    field.column,
+                    geo_element.source_srid,
+                    WGS84.srid,
+                    _get_regclass_name(connection, field.model._meta.db_table),
+                ],
+            )
+            row = cursor.fetchone()
+    except DatabaseError as e:
+        # Older PostGIS versions raise an error when there are no statistics.
+        logger.debug("Unable to estimate the extent of %s: %s", field.model._meta.db_table, e)
+        return None
+
+    if row is None or row[0] is None:
+        return None
+    return WGS84BoundingBox(*row)
+
+
+def get_bounded_count(queryset: models.QuerySet, limit: int | None = None) -> int:
+    """Count the number of results, but stop counting after the limit.
+
+    This executes ``SELECT COUNT(*) FROM (SELECT ... LIMIT n)``, so the database can stop
+    scanning early. A result above the limit means there are *at least* that many results.
+    """
+    if not limit:
+        return queryset.count()
+    return queryset.order_by()[: limit + 1].count()
+
+
+def get_estimated_count(queryset: models.QuerySet, exact_below: int = 0) -> int:
+    """Estimate the number of results, using the PostgreSQL planner statistics.
+
+    This avoids a slow ``COUNT`` on large tables. Unfiltered queries read the table size
+    from ``pg_class.reltuples``, other queries use the row estimate of ``EXPLAIN``.
+    An exact count is performed when the estimate is below ``exact_below``,
+    or when the database doesn't provide an estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    query = queryset.query
+    estimate = None
+    if (
+        not query.where
+        and not query.distinct
+        and not query.combinator
+        and query.group_by is None
+        and not query.is_sliced
+    ):
+        # Use the table statistics, that are updated by VACUUM/ANALYZE.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples, relkind FROM pg_class WHERE oid = to_regclass(%s)",
+                [_get_regclass_name(connection, queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            # The table name can't be resolved, don't guess which table is meant.
+            return queryset.count()
+        elif row[0] >= 0 and row[1] in ("r", "m"):  # -1 means the table was never analyzed.
+            estimate = int(row[0])
+
+    if estimate is None:
+        plan = json.loads(queryset.explain(format="json"))
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+def _get_regclass_name(connection, db_table: str) -> str:
+    """Tell how ``to_regclass()`` finds the table, the same way the queries of Django do.
+    The name is quoted, so it's not case-folded. A schema-qualified ``db_table``
+    (written as ``'schema"."table'``) becomes ``"schema"."table"``,
+    and other names are resolved through the ``search_path``.
+    """
+    return connection.ops.quote_name(db_table)
+
+
+def get_table_change_count(queryset: models.QuerySet) -> int | None:
+    """Tell how many rows of the table were inserted, updated or deleted (PostgreSQL only).
+
+    This reads the statistics counters of ``pg_stat_user_tables``, which makes it a cheap
+    data version for :meth:`FeatureType.get_data_version() <gisserver.features.FeatureType.get_data_version>`.
+    Note these counters are updated with a small delay, they don't include ``TRUNCATE``
+    and they are reset when the statistics are reset (which still gives a different value).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables"
+            " WHERE relid = to_regclass(%s)",
+            [_get_regclass_name(connection, queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def run_concurrently(funcs: list[Callable[[], T]], using: list[str]) -> list[T]:
+    """Run the database operations in parallel, each on its own database connection.
+
+    This uses a shared thread pool of ``GISSERVER_QUERY_THREADS``, where each call
+    uses at most ``GISSERVER_QUERY_THREADS_PER_REQUEST`` connections at the same time.
+    The results are returned in the same order as the functions.
+    When this is not enabled (or not possible), the functions run sequentially.
+
+    :param using: The database alias of each function.
+    """
+    if (
+        len(funcs) < 2
+        or conf.GISSERVER_QUERY_THREADS < 2
+        # Other connections won't see the uncommitted data of a transaction.
+        or any(connections[alias].in_atomic_block for alias in set(using))
+    ):
+        return [func() for func in funcs]
+
+    executor = _get_executor()
+    slots = threading.BoundedSemaphore(max(conf.GISSERVER_QUERY_THREADS_PER_REQUEST, 1))
+    futures = []
+    for func, alias in zip(funcs, using, strict=True):
+        slots.acquire()
+        future = executor.submit(_run_in_thread, func, alias)
+        future.add_done_callback(lambda f: slots.release())
+        futures.append(future)
+
+    return [future.result() for future in futures]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Provide the thread pool that is shared between requests."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        max_workers = conf.GISSERVER_QUERY_THREADS
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="gisserver-query"
+            )
+            _executor_workers = max_workers
+        return _executor
+
+
+def _run_in_thread(func: Callable[[], T], using: str) -> T:
+    """Run the function in a pool thread, which has its own database connection.
+    Like Django does between requests, the connection is only closed when it's unusable
+    or exceeded the ``CONN_MAX_AGE``. Otherwise, the next call of this thread reuses it.
+    """
+    connection = connections[using]
+    connection.close_if_unusable_or_obsolete()
+    try:
+        return func()
+    finally:
+        connection.close_if_unusable_or_obsolete()
+
+
 def get_geometries_union(
     expressions: list[str | functions.GeoFunc], using="default"
 ) -> str | functions.Union:
@@ -156,11 +494,13 @@ def replace_queryset_geometries(
     geo_elements: list[GeometryXsdElement],
     output_crs: CRS,
     wrapper_func: type[functions.GeoFunc],
+    element_kwargs: dict[GeometryXsdElement, dict] | None = None,
     **wrapper_kwargs,
 ) -> models.QuerySet:
     """Replace the queryset geometry retrieval with a database-rendered version.
 
     This uses absolute paths in the queryset, but can use relative paths for related querysets.
+    The ``element_kwargs`` can provide additional arguments for a specific element.
     """
     defer_names = []
     as_geo_map = {}
@@ -168,9 +508,11 @@ def replace_queryset_geometries(
         if geo_element.source is not None:  # excludes GmlBoundedByElement
             defer_names.append(geo_element.local_orm_path)
             annotation_name = _as_annotation_name(geo_element.local_orm_path, wrapper_func)
+            extra_kwargs = element_kwargs.get(geo_element, {}) if element_kwargs else {}
             as_geo_map[annotation_name] = wrapper_func(
                 get_db_geometry_target(geo_element, output_crs, use_relative_path=True),
                 **wrapper_kwargs,
+                **extra_kwargs,
             )
 
     if not defer_names:
@@ -219,3 +561,76 @@ def get_db_geometry_target(
         return functions.Transform(orm_path, srid=output_crs.srid)
     else:
         return orm_path
+
+
+def get_keyset_ordering(queryset: models.QuerySet) -> list[str] | None:
+    """Tell which ordering keyset pagination can use for the queryset.
+    The primary key is added to make the ordering deterministic.
+    This returns ``None`` when a sort field can't be compared in a ``WHERE`` clause,
+    e.g. when sorting on relations, annotations or nullable fields.
+    """
+    query = queryset.query
+    opts = queryset.model._meta
+    ordering = query.order_by or (opts.ordering if query.default_ordering else ())
+
+    keyset = []
+    for name in ordering:
+        if not isinstance(name, str) or name == "?":
+            return None  # expressions or random ordering
+
+        descending = name.startswith("-")
+        field_name = name.lstrip("-")
+        try:
+            field = opts.pk if field_name == "pk" else opts.get_field(field_name)
+        except FieldDoesNotExist:
+            return None  # relation path or annotation
+
+        if (
+            field.is_relation
+            or not field.concrete
+            or field.null
+            or field.get_internal_type() not in _KEYSET_FIELD_TYPES
+        ):
+            return None
+
+        keyset.append(f"-{field.attname}" if descending else field.attname)
+        if field.primary_key:
+            return keyset  # already unique, any remaining fields have no effect.
+
+    keyset.append(opts.pk.attname)
+    return keyset
+
+
+def get_keyset_filter(ordering: list[str], values: list) -> Q:
+    """Build the ``WHERE (a, b) > (x, y)`` condition that starts after the given sort values.
+    This is expanded as ``a > x OR (a = x AND b > y)``, which also supports mixed sort directions.
+    """
+    conditions = []
+    equal = {}
+    for name, value in zip(ordering, values, strict=True):
+        field_name = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") else "gt"
+        conditions.append(Q(**equal, **{f"{field_name}__{lookup}": value}))
+        equal[field_name] = value
+    return reduce(operator.or_, conditions)
+
+
+def add_keyset_annotations(queryset: models.QuerySet, ordering: list[str]) -> models.QuerySet:
+    """Select the sort values of each record, so the next keyset page can start after it.
+    These are available as ``_keyset_0``, ``_keyset_1``, etc.
+    """
+    annotations = {
+        f"_keyset_{i}": F(name.lstrip("-"))
+        for i, name in enumerate(ordering)
+        if f"_keyset_{i}" not in queryset.query.annotations
+    }
+    return queryset.annotate(**annotations) if annotations else queryset
+
+
+def get_keyset_values(instance, ordering: list[str]) -> list:
+    """Read the sort values that :func:`add_keyset_annotations` selected."""
+    if isinstance(instance, dict):
+        # .values() query, as used by GetPropertyValue
+        return [instance[f"_keyset_{i}"] for i in range(len(ordering))]
+    else:
+        return [getattr(instance, f"_keyset_{i}") for i in range(len(ordering))]
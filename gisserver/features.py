@@ -22,7 +22,7 @@ import itertools
 import logging
 from dataclasses import dataclass
 from functools import cached_property, lru_cache
-from typing import TYPE_CHECKING, Literal
+from typing import TYPE_CHECKING, Any, Literal
 
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.db.models import GeometryField
@@ -31,9 +31,9 @@ from django.db import models
 from django.http import HttpRequest
 
 from gisserver import conf
+from gisserver.cache import get_cached_bounding_box
 from gisserver.compat import ArrayField, GeneratedField
 from gisserver.crs import CRS
-from gisserver.db import get_wgs84_bounding_box
 from gisserver.exceptions import ExternalValueError, InvalidParameterValue
 from gisserver.geometries import WGS84BoundingBox
 from gisserver.parsers.xml import parse_qname, xmlns
@@ -503,6 +503,7 @@ class FeatureType:
         # Settings
         show_name_field: bool = True,
         xml_namespace: str | None = None,
+        estimated_extent: bool | None = None,
     ):
         """
         :param queryset: The queryset to retrieve the data.
@@ -520,6 +521,8 @@ class FeatureType:
         :param show_name_field: Whether to show the ``gml:name`` or the GeoJSON ``geometry_name``
             field. Default is to show a field when ``name_field`` is given.
         :param xml_namespace: The XML namespace to use, will be set by :meth:`bind_namespace` otherwise.
+        :param estimated_extent: Whether the bounding box is read from the PostGIS table statistics.
+            The default is the ``GISSERVER_ESTIMATED_EXTENT`` setting.
         """
         if isinstance(queryset, models.QuerySet):
             self.queryset = queryset
@@ -545,6 +548,7 @@ class FeatureType:
         # Settings
         self.show_name_field = show_name_field
         self.xml_namespace = xml_namespace
+        self.estimated_extent = estimated_extent
 
         # Validate that the name doesn't require XML escaping.
         if html.escape(self.name) != self.name or " " in self.name or ":" in self.name:
@@ -728,7 +732,31 @@ class FeatureType:
         if not self.main_geometry_element:
             return None
 
-        return get_wgs84_bounding_box(self.get_queryset(), self.main_geometry_element)
+        estimated = (
+            conf.GISSERVER_ESTIMATED_EXTENT
+            if self.estimated_extent is None
+            else self.estimated_extent
+        )
+
+        # Cached when GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT is set.
+        return get_cached_bounding_box(
+            self, self.get_queryset(), self.main_geometry_element, estimated=estimated
+        )
+
+    def get_data_version(self) -> Any:
+        """Hook to tell which version of the data this feature type serves.
+
+        When this returns a value, the ``GetFeature``, ``GetPropertyValue`` and
+        ``GetCapabilities`` responses receive an ``ETag`` header, so clients can revalidate
+        their cached copy with ``If-None-Match``. A ``304 Not Modified`` response is then returned
+        before any query is constructed. When a ``datetime`` is returned (e.g. the latest
+        ``updated_at`` value), it's also used for the ``Last-Modified`` header.
+
+        This can for example return ``self.queryset.aggregate(v=Max("updated_at"))["v"]``,
+        the value of a version counter table, or :func:`~gisserver.db.get_table_change_count`.
+        The default is ``None``, which disables conditional requests.
+        """
+        return None
 
     def get_display_value(self, instance: models.Model) -> str:
         """Generate the display name value"""
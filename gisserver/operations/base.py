@@ -15,6 +15,7 @@ import logging
 import math
 import re
 import typing
+from collections.abc import Iterable
 from dataclasses import dataclass
 from functools import cached_property
 
@@ -183,6 +184,23 @@ class WFSOperation:
         """Default call implementation: render an XML template."""
         raise NotImplementedError()
 
+    def get_data_versions(self) -> list | None:
+        """Tell which versions of the data the response depends on.
+        This is used for the ``ETag`` and ``Last-Modified`` headers.
+        When this returns ``None``, the operation doesn't support conditional requests.
+        """
+        return None
+
+    def _get_feature_data_versions(self, feature_types: Iterable[FeatureType]) -> list | None:
+        """Collect the data versions of the feature types (only when all of them provide one)."""
+        versions = []
+        for feature_type in feature_types:
+            version = feature_type.get_data_version()
+            if version is None:
+                return None
+            versions.append((feature_type.name, version))
+        return versions or None
+
     @cached_property
     def all_feature_types_by_name(self) -> dict[str, FeatureType]:
         """Create a lookup for feature types by name.
@@ -17,12 +17,19 @@ import logging
 import math
 import re
 import typing
+from datetime import date, time
+from decimal import Decimal
+from functools import partial
 from urllib.parse import urlencode
+from uuid import UUID
 
+from django.core import signing
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.module_loading import import_string
 
 from gisserver import conf, output
+from gisserver.cache import get_cached_capabilities, get_cached_count
+from gisserver.db import run_concurrently
 from gisserver.exceptions import (
     InvalidParameterValue,
     VersionNegotiationFailed,
@@ -40,6 +47,7 @@ logger = logging.getLogger(__name__)
 
 SAFE_VERSION = re.compile(r"\A[0-9.]+\Z")
 RE_SAFE_FILENAME = re.compile(r"\A[A-Za-z0-9]+[A-Za-z0-9.]*")  # no dot at the start.
+CURSOR_SALT = "gisserver.cursor"
 
 __all__ = [
     "GetCapabilities",
@@ -110,6 +118,25 @@ class GetCapabilities(XmlTemplateMixin, OutputFormatMixin, WFSOperation):
         self.view.set_version(ows_request.service, requested_version)
         return requested_version
 
+    def process_request(self, ows_request: wfs20.GetCapabilities):
+        """Render the capabilities, which can be cached by ``GISSERVER_CAPABILITIES_CACHE_TIMEOUT``."""
+        view = self.view
+        return get_cached_capabilities(
+            key_parts=(
+                f"{view.__class__.__module__}.{view.__class__.__qualname__}",
+                ows_request.service,
+                view.version,
+                view.get_xml_namespaces_to_prefixes(),
+                view.server_url,  # absolute URL, includes the scheme and host.
+            ),
+            feature_types=view.get_bound_feature_types(),
+            render=lambda: super(GetCapabilities, self).process_request(ows_request),
+        )
+
+    def get_data_versions(self) -> list | None:
+        """The capabilities include the bounding box of all feature types."""
+        return self._get_feature_data_versions(self.view.get_bound_feature_types())
+
     def get_context_data(self) -> dict:
         # The 'service' is not read from 'params' to avoid dependency on get_parameters()
         service_operations = self.view.accept_operations[self.ows_request.service]
@@ -255,6 +282,15 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         """Allow to be overwritten in GetFeatureValue"""
         query.bind(feature_types)
 
+    def get_data_versions(self) -> list | None:
+        """The results depend on the data of all queried feature types."""
+        feature_types = {
+            feature_type.name: feature_type
+            for query in self.ows_request.queries
+            for feature_type in query.feature_types
+        }
+        return self._get_feature_data_versions(feature_types.values())
+
     def process_request(self, ows_request: wfs20.GetFeature | wfs20.GetPropertyValue):
         """Process the query, and generate the output."""
         # Initialize the collection, which constructs the ORM querysets.
@@ -272,7 +308,7 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         # such as converting geometries to the correct CRS or add prefetch_related logic.
         renderer = self.output_format.renderer_class(operation=self, collection=collection)
 
-        # Fixing pagination will invoke the query,
+        # Fixing pagination may invoke the query,
         # hence this is done at the end
         self.set_pagination_links(collection)
 
@@ -284,25 +320,44 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         This creates the QuerySet and counts the number of results.
         """
         start, count = self.get_pagination()
-        results = []
+        querysets = []
         for query in self.ows_request.queries:
             with wrap_filter_errors(query):
-                queryset = query.get_queryset()
-
-            results.append(
-                output.SimpleFeatureCollection(
-                    source_query=query,
-                    feature_types=query.feature_types,
-                    queryset=queryset.none(),
-                    start=start,
-                    stop=start + count,  # yes, count can be passed for hits
-                    number_matched=queryset.count(),
+                querysets.append(query.get_queryset())
+
+        # Multiple queries are counted in parallel when this is enabled.
+        number_matched = run_concurrently(
+            [
+                partial(
+                    get_cached_count,
+                    queryset,
+                    query.feature_types,
+                    limit=conf.GISSERVER_COUNT_NUMBER_MATCHED_LIMIT,
                 )
+                for query, queryset in zip(self.ows_request.queries, querysets, strict=True)
+            ],
+            using=[queryset.db for queryset in querysets],
+        )
+
+        results = [
+            output.SimpleFeatureCollection(
+                source_query=query,
+                feature_types=query.feature_types,
+                queryset=queryset.none(),
+                start=start,
+                stop=start + count,  # yes, count can be passed for hits
+                number_matched=query_number_matched,
             )
+            for query, queryset, query_number_matched in zip(
+                self.ows_request.queries, querysets, number_matched, strict=True
+            )
+        ]
 
+        # Counts above the GISSERVER_COUNT_NUMBER_MATCHED_LIMIT are reported as "unknown".
+        counts = [r.number_matched for r in results]
         return output.FeatureCollection(
             results=results,
-            number_matched=sum(r.number_matched for r in results),
+            number_matched=None if None in counts else sum(counts),
         )
 
     def get_results(self) -> output.FeatureCollection:
@@ -310,21 +365,31 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         This creates the queryset, allowing to read over all results.
         """
         start, count = self.get_pagination()
+        cursor = self.get_cursor()
         results = []
         for query in self.ows_request.queries:
             # The querysets are not executed yet, until the output is reading them.
             with wrap_filter_errors(query):
                 queryset = query.get_queryset()
 
-            results.append(
-                output.SimpleFeatureCollection(
-                    source_query=query,
-                    feature_types=query.feature_types,
-                    queryset=queryset,
-                    start=start,
-                    stop=start + count,
-                )
+            sub_collection = output.SimpleFeatureCollection(
+                source_query=query,
+                feature_types=query.feature_types,
+                queryset=queryset,
+                start=start,
+                stop=start + count,
+                keyset=cursor["values"] if cursor is not None else None,
             )
+            if cursor is not None and (
+                len(self.ows_request.queries) > 1
+                or cursor["ordering"] != sub_collection.keyset_ordering
+            ):
+                # Cursor of a different query, e.g. the SORTBY was changed.
+                raise InvalidParameterValue(
+                    "The cursor does not match this query.", locator="cursor"
+                )
+
+            results.append(sub_collection)
 
         # number_matched is not given here, so some rendering formats can count it instead.
         # For GML it need to be printed at the start, but for GeoJSON it can be rendered
@@ -344,6 +409,18 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         count = min(max_page_size, self.ows_request.count or default_page_size)
         return start, count
 
+    def get_cursor(self) -> dict | None:
+        """Tell which keyset pagination position is requested with the ``CURSOR`` parameter."""
+        if not conf.GISSERVER_KEYSET_PAGINATION or not self.ows_request.cursor:
+            return None
+
+        try:
+            ordering, values = signing.loads(self.ows_request.cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidParameterValue("Invalid cursor value.", locator="cursor") from None
+
+        return {"ordering": ordering, "values": values}
+
     def set_pagination_links(self, collection: output.FeatureCollection):
         """Assign the pagination links to the collection.
         This happens within the operation logic, as it can access the original GET request.
@@ -355,21 +432,61 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         stop = start + count
         if stop != math.inf:
             if start > 0:
+                # Keyset pagination only works forwards, the previous page uses an offset.
                 collection.previous = self._replace_url_params(
                     STARTINDEX=max(0, start - count),
                     COUNT=count,
+                    remove=self._get_cursor_params(),
                 )
 
             # Note that reading collection.has_next will invoke the query!
-            if collection.has_next:
-                # TODO: fix this when returning multiple typeNames:
-                collection.next = self._replace_url_params(
-                    STARTINDEX=start + count,
-                    COUNT=count,
+            # Hence, it's resolved when the output renderer reads the link.
+            collection.next = partial(self._get_next_link, collection, start, count)
+
+    def _get_next_link(
+        self, collection: output.FeatureCollection, start: int, count: int
+    ) -> str | None:
+        """Tell what the URL of the next page is."""
+        if collection.has_next:
+            # TODO: fix this when returning multiple typeNames:
+            cursor = self._get_next_cursor(collection)
+            if cursor is not None:
+                return self._replace_url_params(
+                    STARTINDEX=start + count, COUNT=count, CURSOR=cursor
+                )
+            else:
+                return self._replace_url_params(
+                    STARTINDEX=start + count, COUNT=count, remove=self._get_cursor_params()
                 )
+        return None
+
+    def _get_cursor_params(self) -> tuple[str, ...]:
+        """Tell which parameters no longer apply when a page is read with ``STARTINDEX``."""
+        return ("CURSOR",) if conf.GISSERVER_KEYSET_PAGINATION else ()
+
+    def _get_next_cursor(self, collection: output.FeatureCollection) -> str | None:
+        """Tell the keyset pagination position of the next page.
+        The ``STARTINDEX`` is still included in the URL, so the numbering stays consistent.
+        """
+        if len(collection.results) != 1:
+            return None
 
-    def _replace_url_params(self, **updates) -> str | None:
-        """Replace a query parameter in the URL"""
+        sub_collection = collection.results[0]
+        keyset = sub_collection.next_keyset
+        if keyset is None:
+            return None
+
+        # The ordering is included to detect a cursor that is reused for another query.
+        return signing.dumps(
+            [sub_collection.keyset_ordering, [_to_json_value(value) for value in keyset]],
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    def _replace_url_params(self, *, remove=(), **updates) -> str | None:
+        """Replace a query parameter in the URL.
+        The (uppercase) names in ``remove`` are omitted from the URL.
+        """
         new_params = self.view.request.GET.copy()  # preserve lowercase fields too
         if self.view.request.method != "GET":
             # CITE compliance testing wants to see a 'next' link for POST requests too.
@@ -381,9 +498,11 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
                 return None
 
         # Replace any lower/mixed case variants of the previous names:
-        for name in new_params:
+        for name in list(new_params):
             upper = name.upper()
-            if upper in updates:
+            if upper in remove:
+                del new_params[name]
+            elif upper in updates:
                 new_params[name] = updates.pop(upper)
 
         # Override/replace with new remaining uppercase variants
@@ -391,6 +510,18 @@ class BaseWFSGetDataOperation(OutputFormatMixin, WFSOperation):
         return f"{self.view.server_url}?{urlencode(new_params)}"
 
 
+def _to_json_value(value):
+    """Convert a sort value into a JSON value, that the ORM parses back when it's filtered on.
+    This keeps the microseconds which the DjangoJSONEncoder would strip.
+    """
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    elif isinstance(value, (Decimal, UUID)):
+        return str(value)
+    else:
+        return value
+
+
 class GetFeature(BaseWFSGetDataOperation):
     """This returns all properties of the feature.
 
@@ -2,22 +2,30 @@ from __future__ import annotations
 
 import logging
 import math
+import time
 import typing
 from collections.abc import Iterator
+from dataclasses import dataclass
 from io import BytesIO, StringIO
 from itertools import chain
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.db.models.query import ModelIterable
 from django.http import HttpResponse, StreamingHttpResponse
 from django.http.response import HttpResponseBase  # Django 3.2 import location
+from django.utils.cache import patch_vary_headers
 
+from gisserver import conf
 from gisserver.exceptions import wrap_filter_errors
 from gisserver.features import FeatureType
 from gisserver.parsers.values import fix_type_name
 from gisserver.parsers.xml import split_ns
 from gisserver.types import XsdAnyType, XsdNode
 
+from .compression import StreamCompressor, get_compressor
+from .iters import FeatureRowIterable
 from .utils import render_xmlns_attributes, to_qname
 
 logger = logging.getLogger(__name__)
@@ -40,6 +48,10 @@ class OutputRenderer:
     #: Default content type for the HTTP response
     content_type = "application/octet-stream"
 
+    #: The compression levels per content-encoding, for streaming responses.
+    #: By default, this uses ``GISSERVER_COMPRESSION_LEVELS``.
+    compression_levels: dict[str, int] | None = None
+
     def __init__(self, operation: WFSOperation):
         """Base method for all output rendering."""
         self.operation = operation
@@ -64,12 +76,33 @@ class OutputRenderer:
             except StopIteration:
                 pass
 
+            headers = self.get_headers()
+            compressor = self.get_compressor()
+            if compressor is not None:
+                stream = compressor.compress_stream(stream)
+                headers = {**headers, "Content-Encoding": compressor.encoding}
+
             # Handover to WSGI server (starts streaming when reading the contents)
-            return StreamingHttpResponse(
+            response = StreamingHttpResponse(
                 streaming_content=stream,
                 content_type=self.content_type,
-                headers=self.get_headers(),
+                headers=headers,
             )
+            if conf.GISSERVER_COMPRESS_STREAMING:
+                patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+
+    def get_compressor(self) -> StreamCompressor | None:
+        """Select the compression for the streaming response.
+        This follows the ``Accept-Encoding`` header of the client,
+        when ``GISSERVER_COMPRESS_STREAMING`` is enabled.
+        """
+        if not conf.GISSERVER_COMPRESS_STREAMING:
+            return None
+
+        accept_encoding = self.operation.view.request.headers.get("Accept-Encoding", "")
+        levels = self.compression_levels or conf.GISSERVER_COMPRESSION_LEVELS
+        return get_compressor(accept_encoding, levels)
 
     def get_headers(self) -> dict[str, str]:
         """Override to define HTTP headers to add."""
@@ -146,6 +179,27 @@ class XmlOutputRenderer(OutputRenderer):
             return to_qname(ns, localname, self.app_namespaces)
 
 
+@dataclass
+class ChunkStats:
+    """Statistics of the chunks that are sent to the client."""
+
+    #: Number of flushed chunks
+    count: int = 0
+    #: Total size of all chunks
+    total_size: int = 0
+    #: Size of the smallest chunk
+    min_size: int = 0
+    #: Size of the largest chunk
+    max_size: int = 0
+
+    def add(self, size: int):
+        """Record a flushed chunk."""
+        self.min_size = min(self.min_size, size) if self.count else size
+        self.max_size = max(self.max_size, size)
+        self.count += 1
+        self.total_size += size
+
+
 class CollectionOutputRenderer(OutputRenderer):
     """Base class to create streaming responses."""
 
@@ -156,6 +210,33 @@ class CollectionOutputRenderer(OutputRenderer):
     #: An optional content-disposition header to output
     content_disposition = None
 
+    #: The amount of output to collect before sending a chunk to the client.
+    #: When :attr:`chunk_adaptive` is set, this is the initial value.
+    #: By default, this uses ``GISSERVER_CHUNK_SIZE``.
+    chunk_size: int | None = None
+
+    #: The maximum time (in seconds) to hold back collected output.
+    #: This is checked when a row is written, so once the delay has passed,
+    #: the output is sent with the next row. This lets clients receive data
+    #: while a slow query is still being read, but doesn't interrupt a slow fetch.
+    #: By default, this uses ``GISSERVER_CHUNK_MAX_DELAY``.
+    chunk_max_delay: float | None = None
+
+    #: Whether to tune the chunk size based on the measured write throughput.
+    #: By default, this uses ``GISSERVER_CHUNK_ADAPTIVE``.
+    chunk_adaptive: bool | None = None
+
+    #: The limits for the adaptive chunk size.
+    chunk_size_range = (8_000, 1_000_000)
+
+    #: The time (in seconds) between chunks that the adaptive chunk size aims for.
+    chunk_target_interval = 0.1
+
+    #: Whether flat features are read as lightweight rows instead of model instances.
+    #: These rows only provide the selected fields, ``pk`` and ``_meta``.
+    #: Disable this when the rendering needs other model attributes or methods.
+    read_feature_rows = False
+
     def __init__(self, operation: WFSOperation, collection: FeatureCollection):
         """
         Receive the collected data to render.
@@ -165,6 +246,19 @@ class CollectionOutputRenderer(OutputRenderer):
         """
         super().__init__(operation)
         self.collection = collection
+        self.chunk_stats = ChunkStats()
+        self._flush_size = self.chunk_size or conf.GISSERVER_CHUNK_SIZE
+        self._max_delay = (
+            self.chunk_max_delay
+            if self.chunk_max_delay is not None
+            else conf.GISSERVER_CHUNK_MAX_DELAY
+        )
+        self._adaptive = (
+            self.chunk_adaptive
+            if self.chunk_adaptive is not None
+            else conf.GISSERVER_CHUNK_ADAPTIVE
+        )
+        self._last_flush = None  # starts at the first row
         self.apply_projection()
 
     def apply_projection(self):
@@ -184,6 +278,79 @@ class CollectionOutputRenderer(OutputRenderer):
             if queryset is not None:
                 sub_collection.queryset = queryset
 
+    def is_flush_needed(self, output: StringIO | BytesIO) -> bool:
+        """Tell whether the collected output should be sent to the client.
+        This happens when enough data is collected, or when it's held back for too long.
+        """
+        size = output.tell()
+        if not size:
+            return False
+        elif self._last_flush is None:
+            # The first row is written. Start timing here, so the time to execute
+            # the query isn't seen as time that was spent on writing the output.
+            self.start_flush_timer()
+            return size >= self._flush_size
+
+        return size >= self._flush_size or time.monotonic() - self._last_flush >= self._max_delay
+
+    def start_flush_timer(self):
+        """Start measuring the write throughput, which tunes the chunk size.
+        By default, this starts when :meth:`is_flush_needed` sees the first written output.
+        """
+        self._last_flush = time.monotonic()
+
+    def flush_output(self, output: StringIO | BytesIO) -> bytes:
+        """Return the collected output as chunk, clear the buffer and update the statistics."""
+        chunk = self.take_output(output)
+        self.record_flush(len(chunk))
+        return chunk
+
+    def take_output(self, output: StringIO | BytesIO) -> bytes:
+        """Return the collected output as UTF-8 encoded bytes, and clear the buffer.
+
+        The built-in renderers write bytes into a ``BytesIO`` buffer. Its ``getvalue()``
+        shares the internal buffer without copying it, and the truncated buffer starts empty again.
+        A ``StringIO`` buffer of a custom renderer is still supported, its text is encoded here.
+        """
+        chunk = output.getvalue()
+        output.seek(0)
+        output.truncate(0)
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        return chunk
+
+    def record_flush(self, size: int):
+        """Update the statistics, and tune the chunk size for the measured throughput."""
+        self.chunk_stats.add(size)
+        if self._last_flush is None:
+            return  # No rows were written yet (e.g. only a header), nothing to measure.
+
+        now = time.monotonic()
+        elapsed = now - self._last_flush
+        self._last_flush = now
+
+        if self._adaptive and size and elapsed > 0:
+            # Aim for the size that can be written in the target interval,
+            # averaged with the previous size to avoid large swings.
+            min_size, max_size = self.chunk_size_range
+            target_size = size / elapsed * self.chunk_target_interval
+            self._flush_size = int(
+                min(max((self._flush_size + target_size) / 2, min_size), max_size)
+            )
+
+    def log_chunk_stats(self):
+        """Log how the response was streamed."""
+        stats = self.chunk_stats
+        logger.debug(
+            "%s streamed %d chunks of %d total size (min %d, max %d, tuned chunk size %d)",
+            self.__class__.__name__,
+            stats.count,
+            stats.total_size,
+            stats.min_size,
+            stats.max_size,
+            self._flush_size,
+        )
+
     def decorate_queryset(
         self, projection: FeatureProjection, queryset: models.QuerySet
     ) -> models.QuerySet:
@@ -209,12 +376,57 @@ class CollectionOutputRenderer(OutputRenderer):
             )
             queryset = queryset.prefetch_related(*prefetches)
 
+        only_fields = projection.only_fields
+        use_feature_rows = self.use_feature_rows(projection, queryset)
+        if use_feature_rows:
+            # Rows can't load deferred fields, so anything that's read needs to be selected.
+            only_fields = only_fields + self._get_feature_row_fields(projection)
+
         logger.debug(
             "QuerySet for %s only retrieves: %r",
             queryset.model._meta.label,
-            projection.only_fields,
+            only_fields,
         )
-        return queryset.only("pk", *projection.only_fields)
+        queryset = queryset.only("pk", *only_fields)
+        if use_feature_rows:
+            # Avoid constructing model instances, read the selected columns as rows.
+            queryset._iterable_class = FeatureRowIterable
+        return queryset
+
+    def use_feature_rows(self, projection: FeatureProjection, queryset: models.QuerySet) -> bool:
+        """Tell whether the features can be read as rows, instead of model instances.
+
+        This is only possible for flat features, that don't access any relations
+        and don't produce their values in Python (including ``str(instance)`` for the name).
+        """
+        feature_type = projection.feature_type
+        return (
+            self.read_feature_rows
+            and projection.is_flat
+            and queryset._iterable_class is ModelIterable
+            and not queryset.query.select_related
+            and not queryset._prefetch_related_lookups
+            and not queryset._known_related_objects
+            and (
+                not feature_type.show_name_field
+                or _is_local_column(feature_type.model, feature_type.display_field_name)
+            )
+            and (
+                # The bounding box is calculated from all geometries of the feature.
+                not projection.has_bounded_by
+                or not any(e.is_flattened for e in feature_type.all_geometry_elements)
+            )
+        )
+
+    def _get_feature_row_fields(self, projection: FeatureProjection) -> list[str]:
+        """Tell which extra fields are read by the renderer, besides the projected elements."""
+        feature_type = projection.feature_type
+        fields = []
+        if feature_type.show_name_field:
+            fields.append(feature_type.display_field_name)
+        if projection.has_bounded_by:
+            fields.extend(e.orm_path for e in feature_type.all_geometry_elements)
+        return fields
 
     def _get_prefetch_related(self, projection: FeatureProjection) -> list[models.Prefetch]:
         """Summarize which fields read data from relations.
@@ -281,3 +493,14 @@ class CollectionOutputRenderer(OutputRenderer):
         """A wrapper to read features from a collection, while raising WFS exceptions on query errors."""
         with wrap_filter_errors(sub_collection.source_query):
             yield from sub_collection
+
+
+def _is_local_column(model: type[models.Model], name: str | None) -> bool:
+    """Tell whether the name refers to a column of the model, which has the same attribute name."""
+    if not name:
+        return False
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and not field.is_relation and field.attname == name
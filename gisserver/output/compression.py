@@ -0,0 +1,166 @@
+"""Streaming compression of the output.
+
+A single compressor is used for the whole response, so the compression ratio
+is much better than compressing each chunk separately (like Django's ``GZipMiddleware`` does).
+Each chunk is still flushed, so clients receive the data while it's being rendered.
+
+The ``br`` and ``zstd`` encodings are only offered when the ``brotli``
+or ``zstandard`` packages are installed.
+"""
+
+from __future__ import annotations
+
+import zlib
+from collections.abc import Iterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = (
+    "StreamCompressor",
+    "get_compressor",
+)
+
+
+class StreamCompressor:
+    """Base class for compressing a stream of chunks."""
+
+    #: The value for the ``Content-Encoding`` header.
+    encoding = None
+
+    def __init__(self, level: int):
+        self.level = level
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Tell whether the library for this compression is installed."""
+        return True
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress the chunk, and flush it so the client can decode it."""
+        raise NotImplementedError()
+
+    def finish(self) -> bytes:
+        """Write the end of the compressed stream."""
+        raise NotImplementedError()
+
+    def compress_stream(self, stream: Iterator[bytes | str]) -> Iterator[bytes]:
+        """Compress all chunks of a stream."""
+        try:
+            for chunk in stream:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()  # output formats render in utf-8
+                if chunk:
+                    yield self.compress(chunk)
+        except Exception:
+            # Complete the compressed data, so the rendered exception message can be read.
+            yield self.finish()
+            raise
+        else:
+            yield self.finish()
+
+
+class GzipCompressor(StreamCompressor):
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(StreamCompressor):
+    encoding = "br"
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self._compressor = brotli.Compressor(quality=level)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return brotli is not None
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor(StreamCompressor):
+    encoding = "zstd"
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return zstandard is not None
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+COMPRESSORS: dict[str, type[StreamCompressor]] = {
+    compressor.encoding: compressor
+    for compressor in (GzipCompressor, BrotliCompressor, ZstdCompressor)
+}
+
+
+def get_compressor(accept_encoding: str, levels: dict[str, int]) -> StreamCompressor | None:
+    """Select the compression based on the ``Accept-Encoding`` header of the client.
+
+    :param accept_encoding: The HTTP header, e.g. ``gzip, deflate, br;q=0.9``.
+    :param levels: The supported encodings and their compression level,
+        in the order of preference (e.g. ``{"zstd": 3, "br": 4, "gzip": 6}``).
+    """
+    accepted = _parse_accept_encoding(accept_encoding)
+    candidates = [
+        (accepted[encoding], -preference, encoding)
+        for preference, encoding in enumerate(levels)
+        if accepted.get(encoding, 0) > 0
+        and encoding in COMPRESSORS
+        and COMPRESSORS[encoding].is_available()
+    ]
+    if not candidates:
+        return None
+
+    # Highest quality value of the client first, then the preference of the server.
+    encoding = max(candidates)[2]
+    return COMPRESSORS[encoding](levels[encoding])
+
+
+def _parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Parse the ``Accept-Encoding`` header into ``{encoding: quality}``."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        encoding, *params = item.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if encoding:
+            accepted[encoding.strip().lower()] = quality
+    return accepted
@@ -4,16 +4,46 @@ from __future__ import annotations
 
 import csv
 from datetime import datetime, timezone
-from io import StringIO
+from io import BytesIO
 
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models
+from django.db.models import Case, F, Func, Value, When
+from django.db.models.functions import Cast, Coalesce
 
 from gisserver import conf
-from gisserver.db import AsEWKT, get_db_rendered_geometry, replace_queryset_geometries
+from gisserver.db import (
+    AsEWKT,
+    FloatRepr,
+    get_db_geometry_target,
+    get_db_rendered_geometry,
+    replace_queryset_geometries,
+)
+from gisserver.exceptions import wrap_filter_errors
 from gisserver.projection import FeatureProjection, FeatureRelation
 from gisserver.types import GeometryXsdElement, XsdElement, XsdTypes
 
 from .base import CollectionOutputRenderer
+from .results import SimpleFeatureCollection
+
+# Formats a timestamp like str(datetime.astimezone(timezone.utc)) does in Python.
+# The microseconds are only written when these are not zero.
+_DB_DATETIME_TEMPLATE = (
+    "regexp_replace(to_char(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US'),"
+    " '\\.000000$', '') || '+00:00'"
+)
+
+
+class _EncodingWriter:
+    """Let the :mod:`csv` module write into a bytes buffer.
+    Each row is encoded once, when the writer writes it.
+    """
+
+    def __init__(self, output: BytesIO):
+        self._write = output.write
+
+    def write(self, text: str) -> int:
+        return self._write(text.encode())
 
 
 class CSVRenderer(CollectionOutputRenderer):
@@ -25,7 +55,7 @@ class CSVRenderer(CollectionOutputRenderer):
     content_type = "text/csv; charset=utf-8"
     content_disposition = 'attachment; filename="{typenames} {page} {date}.csv"'
     max_page_size = conf.GISSERVER_CSV_MAX_PAGE_SIZE
-    chunk_size = 40_000
+    read_feature_rows = True
 
     #: The outputted CSV dialect. This can be a csv.Dialect subclass
     #: or one of the registered names like: "unix", "excel", "excel-tab"
@@ -49,40 +79,47 @@ class CSVRenderer(CollectionOutputRenderer):
         return super().decorate_queryset(projection, queryset)
 
     def render_stream(self):
-        self.output = output = StringIO()
-        writer = csv.writer(output, dialect=self.dialect)
+        self.output = output = BytesIO()
+        writer = csv.writer(_EncodingWriter(output), dialect=self.dialect)
 
         is_first_collection = True
         for sub_collection in self.collection.results:
-            projection = sub_collection.projection
             if is_first_collection:
                 is_first_collection = False
             else:
                 # Multiple feature types requested, add newlines to separate them
-                output.write("\n\n")
+                output.write(b"\n\n")
+
+            yield from self.render_sub_collection(sub_collection, writer)
 
-            # Write the header
-            xsd_elements = projection.xsd_root_elements
-            writer.writerow(self.get_header(projection, xsd_elements))
+        csv_chunk = self.flush_output(output)
+        self.log_chunk_stats()
+        yield csv_chunk
 
-            # Write all rows
-            for instance in self.read_features(sub_collection):
-                writer.writerow(self.get_row(instance, projection, xsd_elements))
+    def render_sub_collection(self, sub_collection: SimpleFeatureCollection, writer):
+        """Write the header and all rows of a single feature type.
+        This yields the chunks that need to be sent to the client.
+        """
+        output = self.output
+        projection = sub_collection.projection
+
+        # Write the header
+        xsd_elements = projection.xsd_root_elements
+        writer.writerow(self.get_header(projection, xsd_elements))
 
-                # Only perform a 'yield' every once in a while,
-                # as it goes back-and-forth for writing it to the client.
-                if output.tell() > self.chunk_size:
-                    csv_chunk = output.getvalue()
-                    output.seek(0)
-                    output.truncate(0)
-                    yield csv_chunk
+        # Write all rows
+        for instance in self.read_features(sub_collection):
+            writer.writerow(self.get_row(instance, projection, xsd_elements))
 
-        yield output.getvalue()
+            # Only perform a 'yield' every once in a while,
+            # as it goes back-and-forth for writing it to the client.
+            if self.is_flush_needed(output):
+                yield self.flush_output(output)
 
     def render_exception(self, exception: Exception):
         """Render the exception in a format that fits with the output."""
         message = super().render_exception(exception)
-        buffer = self.output.getvalue()
+        buffer = self.output.getvalue().decode()
         return f"{buffer}\n\n{message}\n"
 
     def get_header(
@@ -182,3 +219,101 @@ class DBCSVRenderer(CSVRenderer):
     ):
         """Render the geometry using a database-rendered version."""
         return get_db_rendered_geometry(instance, geo_element, AsEWKT)
+
+    def render_sub_collection(self, sub_collection: SimpleFeatureCollection, writer):
+        """Write the rows of a single feature type, using COPY when possible."""
+        if not self.use_db_copy(sub_collection):
+            yield from super().render_sub_collection(sub_collection, writer)
+            return
+
+        # Write the header, and send everything that's collected so far.
+        output = self.output
+        projection = sub_collection.projection
+        writer.writerow(self.get_header(projection, projection.xsd_root_elements))
+        yield self.flush_output(output)
+
+        with wrap_filter_errors(sub_collection.source_query):
+            yield from self.read_db_copy(sub_collection)
+
+    def use_db_copy(self, sub_collection: SimpleFeatureCollection) -> bool:
+        """Tell whether the database can write the CSV rows using ``COPY ... TO STDOUT``.
+
+        This is only possible for flat features, that don't access any relations
+        and don't produce their values in Python. It also requires psycopg 3,
+        as psycopg2 only returns the data once the whole ``COPY`` has finished.
+        """
+        if not (
+            conf.GISSERVER_USE_DB_FEATURE_RENDERING
+            and self.dialect == "unix"  # what COPY writes with FORCE_QUOTE.
+            and connections[sub_collection.queryset.db].vendor == "postgresql"
+            and sub_collection.projection.is_flat
+        ):
+            return False
+
+        # Imported here, as psycopg is only installed when PostgreSQL is used.
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        return is_psycopg3
+
+    def get_db_copy_sql(self, sub_collection: SimpleFeatureCollection) -> tuple[str, tuple]:
+        """Generate the ``COPY (SELECT ...) TO STDOUT`` statement for the feature type."""
+        projection = sub_collection.projection
+        queryset = sub_collection.get_paginated_queryset().values(
+            **{
+                f"_csv{i}": self.get_db_csv_value(projection, xsd_element)
+                for i, xsd_element in enumerate(projection.xsd_root_elements)
+            }
+        )
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        return f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, FORCE_QUOTE *)", params
+
+    def get_db_csv_value(
+        self, projection: FeatureProjection, xsd_element: XsdElement
+    ) -> models.Expression:
+        """Generate the database expression that formats a value like :meth:`get_row` does."""
+        if xsd_element.type.is_geometry:
+            value = AsEWKT(get_db_geometry_target(xsd_element, projection.output_crs))
+        else:
+            field = F(xsd_element.orm_path)
+            if xsd_element.is_array:
+                value = Func(
+                    field, Value(","), function="array_to_string", output_field=models.TextField()
+                )
+            elif isinstance(xsd_element.source, models.BooleanField):
+                value = Case(
+                    When(**{xsd_element.orm_path: True}, then=Value("True")),
+                    When(**{xsd_element.orm_path: False}, then=Value("False")),
+                    output_field=models.TextField(),
+                )
+            elif isinstance(xsd_element.source, models.DateTimeField):
+                value = Func(
+                    field, template=_DB_DATETIME_TEMPLATE, output_field=models.TextField()
+                )
+            elif isinstance(xsd_element.source, models.FloatField):
+                # Written like str(float) does, PostgreSQL would write "5.0" as "5".
+                value = FloatRepr(field)
+            else:
+                value = Cast(field, models.TextField())
+
+        # Empty values are written as "", like the csv module does for None.
+        return Coalesce(value, Value(""), output_field=models.TextField())
+
+    def read_db_copy(self, sub_collection: SimpleFeatureCollection):
+        """Stream the output of the ``COPY`` statement in chunks."""
+        try:
+            sql, params = self.get_db_copy_sql(sub_collection)
+        except EmptyResultSet:
+            return  # e.g. filter on an empty list of identifiers
+
+        db_alias = sub_collection.queryset.db
+        buffer = BytesIO()
+        with (
+            connections[db_alias].cursor() as cursor,
+            cursor.cursor.copy(sql, params) as copy,
+        ):
+            # psycopg 3 streams the COPY output
+            for data in copy:
+                buffer.write(data)
+                if self.is_flush_needed(buffer):
+                    yield self.flush_output(buffer)
+        yield self.flush_output(buffer)
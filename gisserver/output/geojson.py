@@ -8,15 +8,41 @@ import orjson
 from django.contrib.gis.db.models.functions import AsGeoJSON
 from django.contrib.gis.gdal import AxisOrder
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Concat
 from django.utils.functional import Promise
 
 from gisserver import conf
 from gisserver.crs import CRS84, WGS84
-from gisserver.db import get_db_geometry_target
+from gisserver.db import FloatRepr, JsonBuildObject, get_db_geometry_target
 from gisserver.projection import FeatureProjection
 from gisserver.types import XsdElement
 
-from .base import CollectionOutputRenderer
+from .base import CollectionOutputRenderer, _is_local_column
+from .results import SimpleFeatureCollection
+
+# Model fields which values json_build_object() writes in the same notation as orjson.
+# Decimals and floats are formatted separately, datetime/time fields are excluded
+# as PostgreSQL doesn't write trailing zeros in the fractional seconds.
+_DB_JSON_FIELD_TYPES = {
+    "AutoField",
+    "BigAutoField",
+    "BigIntegerField",
+    "BooleanField",
+    "CharField",
+    "DateField",
+    "DecimalField",
+    "FloatField",
+    "IntegerField",
+    "PositiveBigIntegerField",
+    "PositiveIntegerField",
+    "PositiveSmallIntegerField",
+    "SlugField",
+    "SmallAutoField",
+    "SmallIntegerField",
+    "TextField",
+    "UUIDField",
+}
 
 
 def _json_default(obj):
@@ -40,7 +66,7 @@ class GeoJsonRenderer(CollectionOutputRenderer):
     content_type = "application/geo+json; charset=utf-8"
     content_disposition = 'inline; filename="{typenames} {page} {date}.geojson"'
     max_page_size = conf.GISSERVER_GEOJSON_MAX_PAGE_SIZE
-    chunk_size = 40_000
+    read_feature_rows = True
 
     def decorate_queryset(
         self,
@@ -84,6 +110,7 @@ class GeoJsonRenderer(CollectionOutputRenderer):
             else:
                 output.write(b",\n")
 
+            self.start_collection(sub_collection)
             is_first = True
             for instance in self.read_features(sub_collection):
                 if is_first:
@@ -97,11 +124,8 @@ class GeoJsonRenderer(CollectionOutputRenderer):
 
                 # Only perform a 'yield' every once in a while,
                 # as it goes back-and-forth for writing it to the client.
-                if output.tell() > self.chunk_size:
-                    json_chunk = output.getvalue()
-                    output.seek(0)
-                    output.truncate(0)
-                    yield json_chunk
+                if self.is_flush_needed(output):
+                    yield self.flush_output(output)
 
         # Instead of performing an expensive .count() on the start of the page,
         # write this as a last field at the end of the response.
@@ -110,7 +134,12 @@ class GeoJsonRenderer(CollectionOutputRenderer):
         footer = self.get_footer()
         output.write(orjson.dumps(footer)[1:])
         output.write(b"\n")
-        yield output.getvalue()
+        json_chunk = self.flush_output(output)
+        self.log_chunk_stats()
+        yield json_chunk
+
+    def start_collection(self, sub_collection: SimpleFeatureCollection):
+        """Hook to allow initialization per feature type"""
 
     def render_exception(self, exception: Exception):
         """Render the exception in a format that fits with the output."""
@@ -185,12 +214,18 @@ class GeoJsonRenderer(CollectionOutputRenderer):
         While the draft suggests to put these fields first, there is no such
         requirement in JSON.
         """
-        return {
+        footer = {
             "links": self.get_links(),
             "numberReturned": self.collection.number_returned,
             "numberMatched": self.collection.number_matched,
         }
 
+        # Extension to tell there are "at least N" results, when counting stopped at the limit.
+        lower_bound = self.collection.number_matched_lower_bound
+        if lower_bound is not None:
+            footer["numberMatchedLowerBound"] = lower_bound
+        return footer
+
     def get_links(self) -> list:
         """Generate the pagination links"""
         links = []
@@ -259,14 +294,22 @@ class DBGeoJsonRenderer(GeoJsonRenderer):
     This is even more efficient than calling the C-API for each feature.
     """
 
+    _use_db_feature_json = False
+
     def decorate_queryset(self, projection: FeatureProjection, queryset):
         """Update the queryset to let the database render the GML output.
         This is far more efficient than GeoDjango's logic, which performs a
         C-API call for every single coordinate of a geometry.
         """
         queryset = super().decorate_queryset(projection, queryset)
-        # If desired, the entire FeatureCollection could be rendered
-        # in PostgreSQL as well: https://postgis.net/docs/ST_AsGeoJSON.html
+
+        if self.use_db_feature_rendering(projection):
+            # The entire feature is rendered in PostgreSQL,
+            # no need to retrieve the fields themselves.
+            return queryset.only("pk").annotate(
+                _as_db_feature=self.get_db_feature_json(projection)
+            )
+
         main_geo_element = projection.feature_type.main_geometry_element
         if main_geo_element is not None:
             queryset = queryset.defer(main_geo_element.orm_path).annotate(
@@ -278,6 +321,89 @@ class DBGeoJsonRenderer(GeoJsonRenderer):
 
         return queryset
 
+    def use_db_feature_rendering(self, projection: FeatureProjection) -> bool:
+        """Tell whether the database can render the complete feature.
+
+        This is only possible for flat features, that don't access any relations
+        and don't produce their values in Python (including ``str(instance)`` for the name).
+        All fields need to be plain types, which the database writes in the same notation.
+        """
+        if not conf.GISSERVER_USE_DB_FEATURE_RENDERING or not projection.is_flat:
+            return False
+
+        feature_type = projection.feature_type
+        if feature_type.show_name_field:
+            if not _is_local_column(feature_type.model, feature_type.display_field_name):
+                return False
+            if not _is_db_json_field(feature_type.display_field):
+                return False
+
+        return all(
+            _is_db_json_field(xsd_element.source)
+            for xsd_element in projection.xsd_root_elements
+            if not xsd_element.type.is_geometry
+        )
+
+    def get_db_feature_json(self, projection: FeatureProjection) -> Cast:
+        """Let the database render the complete GeoJSON feature.
+
+        This produces the same structure as :meth:`render_feature` does.
+        """
+        feature_type = projection.feature_type
+        properties = {}
+        for xsd_element in projection.xsd_root_elements:
+            if not xsd_element.type.is_geometry:
+                value = F(xsd_element.orm_path)
+                if isinstance(xsd_element.source, models.DecimalField):
+                    # Written as string, like _json_default() does.
+                    value = Cast(value, models.TextField())
+                elif isinstance(xsd_element.source, models.FloatField):
+                    # Written like orjson does, PostgreSQL would write "5.0" as "5".
+                    value = FloatRepr(value, as_json=True)
+                properties[xsd_element.name] = value
+
+        fields = {
+            "type": Cast(Value("Feature"), models.TextField()),
+            "id": Concat(
+                Value(f"{feature_type.name}."),
+                Cast("pk", models.TextField()),
+                output_field=models.TextField(),
+            ),
+        }
+        if feature_type.show_name_field:
+            name = F(feature_type.display_field_name)
+            if isinstance(feature_type.display_field, models.FloatField):
+                name = FloatRepr(name, as_json=True)
+            elif isinstance(feature_type.display_field, models.DecimalField):
+                name = Cast(name, models.TextField())
+            fields["geometry_name"] = name
+
+        main_geo_element = projection.main_geometry_element
+        if main_geo_element is not None:
+            fields["geometry"] = Cast(
+                AsGeoJSON(
+                    get_db_geometry_target(main_geo_element, projection.output_crs),
+                    precision=conf.GISSERVER_DB_PRECISION,
+                ),
+                models.JSONField(),
+            )
+        else:
+            fields["geometry"] = Cast(Value(None), models.JSONField())
+
+        fields["properties"] = JsonBuildObject(**properties)
+        return Cast(JsonBuildObject(**fields), models.TextField())
+
+    def render_feature(self, projection: FeatureProjection, instance: models.Model) -> bytes:
+        """Write the feature, using the pre-rendered JSON from the database when possible."""
+        if self._use_db_feature_json:
+            return b"    %b" % instance._as_db_feature.encode()
+        return super().render_feature(projection, instance)
+
+    def start_collection(self, sub_collection: SimpleFeatureCollection):
+        """Detect whether the features are pre-rendered by the database."""
+        super().start_collection(sub_collection)
+        self._use_db_feature_json = self.use_db_feature_rendering(sub_collection.projection)
+
     def render_geometry(self, projection: FeatureProjection, instance: models.Model) -> bytes:
         """Generate the proper GeoJSON notation for a geometry"""
         # Database server rendering
@@ -286,3 +412,13 @@ class DBGeoJsonRenderer(GeoJsonRenderer):
 
         geojson = instance._as_db_geojson
         return b"null" if geojson is None else geojson.encode()
+
+
+def _is_db_json_field(field) -> bool:
+    """Tell whether the database writes the field value like the Python rendering does."""
+    return (
+        isinstance(field, models.Field)
+        and field.concrete
+        and not field.is_relation
+        and field.get_internal_type() in _DB_JSON_FIELD_TYPES
+    )
@@ -10,23 +10,31 @@ much extra method calls per field. Some bits are non-DRY inlined for this reason
 
 from __future__ import annotations
 
-import itertools
 import re
+import struct
 from collections import defaultdict
 from datetime import date, datetime, time, timezone
 from decimal import Decimal as D
-from io import StringIO
+from functools import lru_cache
+from io import BytesIO, StringIO
 from operator import itemgetter
-from typing import cast
+from tempfile import SpooledTemporaryFile
+from typing import Callable, cast
 
 from django.contrib.gis import geos
+from django.contrib.gis.shortcuts import numpy
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast, Concat
+from django.db.models.lookups import IsNull
 from django.http import HttpResponse
 
+from gisserver import conf
 from gisserver.crs import CRS84
 from gisserver.db import (
     AsGML,
+    XmlElement,
     get_db_geometry_target,
     get_db_rendered_geometry,
     get_geometries_union,
@@ -41,6 +49,7 @@ from gisserver.types import GeometryXsdElement, GmlBoundedByElement, XsdElement,
 from .base import CollectionOutputRenderer, XmlOutputRenderer
 from .results import SimpleFeatureCollection
 from .utils import (
+    AUTO_STR,
     attr_escape,
     tag_escape,
     value_to_text,
@@ -49,6 +58,10 @@ from .utils import (
 
 GML_RENDER_FUNCTIONS = {}
 RE_SRS_NAME = re.compile(r'srsName="([^"]+)"')
+_SWAP_XY_COLUMNS = {2: [1, 0], 3: [1, 0, 2]}
+
+FeatureWriter = Callable[["GML32Renderer", FeatureProjection, models.Model], None]
+ElementWriter = Callable[["GML32Renderer", FeatureProjection, XsdElement, models.Model], None]
 
 
 def register_geos_type(geos_type):
@@ -59,6 +72,36 @@ def register_geos_type(geos_type):
     return _inc
 
 
+def render_pos_list(value: geos.LineString, dim: int, swap_xy=False) -> str:
+    """Render the coordinates of a LineString/LinearRing as ``<gml:posList>`` value.
+
+    Instead of reading ``value.tuple`` (which performs a C-API call for every point),
+    the WKB data is read once and all coordinates are decoded in a single pass.
+    When numpy is installed, the coordinates are decoded using a vectorized operation.
+
+    :param value: The linestring or ring to render.
+    :param dim: The coordinate dimension (2 or 3).
+    :param swap_xy: Whether to write the coordinates in y/x ordering.
+    """
+    # WKB layout: byte order (1 byte), geometry type (uint32), number of points (uint32),
+    # followed by all coordinates as doubles. The SRID is not included in plain WKB.
+    wkb = value.wkb
+    byte_order = "<" if wkb[0] else ">"
+    (num_points,) = struct.unpack_from(f"{byte_order}I", wkb, 5)
+    if numpy:
+        coords = numpy.frombuffer(wkb, dtype=f"{byte_order}f8", count=num_points * dim, offset=9)
+        if swap_xy:
+            coords = coords.reshape(num_points, dim)[:, _SWAP_XY_COLUMNS[dim]]
+        coords = coords.ravel().tolist()
+    else:
+        coords = struct.unpack_from(f"{byte_order}{num_points * dim}d", wkb, 9)
+        if swap_xy:
+            coords = list(coords)
+            coords[0::dim], coords[1::dim] = coords[1::dim], coords[0::dim]
+
+    return " ".join(map(str, coords))
+
+
 class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
     """Render the GetFeature XML output in GML 3.2 format"""
 
@@ -66,8 +109,20 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
     content_disposition = 'inline; filename="{typenames} {page} {date}.xml"'
     xml_collection_tag = "FeatureCollection"
     xml_sub_collection_tag = "FeatureCollection"  # Mapserver does not use SimpleFeatureCollection
-    chunk_size = 40_000
     gml_seq = 0
+    read_feature_rows = True
+
+    #: Whether the members are written to a temporary file first,
+    #: so the results can be counted while reading them in a single pass.
+    #: By default, this follows the ``GISSERVER_GML_SPOOLED_OUTPUT`` setting.
+    use_spooled_output = None
+
+    #: The maximum size of the temporary file to keep in memory, before it's moved to disk.
+    spool_max_size = 10_000_000
+
+    #: Whether the geometry coordinates are written in y/x ordering.
+    #: This avoids a GDAL transformation when only the axis ordering needs to change.
+    gml_swap_xy = False
 
     # Aliases to use for XML namespaces
     xml_namespaces = {
@@ -133,7 +188,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
             raise NotFound("Feature not found.")
 
         self.app_namespaces.pop(xmlns.wfs20.value)  # not rendering wfs tags.
-        self.output = StringIO()
+        self.output = BytesIO()
         self._write = self.output.write
         self.write_by_id_response(
             sub_collection, instance, extra_xmlns=f" {self.render_xmlns_attributes()}"
@@ -143,7 +198,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
 
     def write_by_id_response(self, sub_collection: SimpleFeatureCollection, instance, extra_xmlns):
         """Default behavior for standalone response is writing a feature (can be changed by GetPropertyValue)"""
-        self._write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self._write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
         self.write_feature(
             projection=sub_collection.projection,
             instance=instance,
@@ -178,7 +233,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
         to inform the client an error happened during rendering.
         """
         message = super().render_exception(exception)
-        buffer = self.output.getvalue()
+        buffer = self.output.getvalue().decode()
 
         # Wrap into <ows:ExceptionReport> tag.
         if not isinstance(exception, WFSException):
@@ -204,12 +259,108 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
         This renders the standard <wfs:FeatureCollection> / <wfs:ValueCollection>
         """
         collection = self.collection
-        self.output = output = StringIO()
+        self.output = output = BytesIO()
         self._write = self.output.write
 
+        use_spooled_output = self.use_spooled_output
+        if use_spooled_output is None:
+            use_spooled_output = conf.GISSERVER_GML_SPOOLED_OUTPUT
+
+        if use_spooled_output:
+            yield from self.render_spooled_stream()
+            return
+
         # The base class peaks the generator and handles early exceptions.
         # Any database exceptions during calculating the number of results
         # are all handled by the main WFS view.
+        # As the header reads the page results, the COUNT can run meanwhile.
+        with collection.concurrent_count():
+            self.write_collection_start()
+
+        if collection.number_returned:
+            has_multiple_collections = len(collection.results) > 1
+
+            for sub_collection in collection.results:
+                self.start_collection(sub_collection)
+                self.write_sub_collection_start(sub_collection, has_multiple_collections)
+
+                for instance in self.read_features(sub_collection):
+                    self.write_member(sub_collection.projection, instance)
+
+                    # Only perform a 'yield' every once in a while,
+                    # as it goes back-and-forth for writing it to the client.
+                    if self.is_flush_needed(output):
+                        yield self.flush_output(output)
+
+                if has_multiple_collections:
+                    self._write(f"</wfs:{self.xml_sub_collection_tag}>\n</wfs:member>\n".encode())
+
+        self._write(f"</wfs:{self.xml_collection_tag}>\n".encode())
+        xml_chunk = self.flush_output(output)
+        self.log_chunk_stats()
+        yield xml_chunk
+
+    def render_spooled_stream(self):
+        """Render the XML, while reading all results in a single streaming pass.
+
+        As the XML header needs to mention the number of results, the members are
+        written to a temporary file first. This keeps the memory usage bounded,
+        instead of reading the whole page in memory to count the results.
+        """
+        collection = self.collection
+        output = self.output
+        sections = []
+
+        with SpooledTemporaryFile(max_size=self.spool_max_size) as spool_file:
+            # The COUNT can run while the results are spooled.
+            with collection.concurrent_count():
+                for sub_collection in collection.results:
+                    self.start_collection(sub_collection)
+                    start_pos = spool_file.tell()
+                    for instance in self.read_features(sub_collection):
+                        self.write_member(sub_collection.projection, instance)
+                        if output.tell() >= self._flush_size:
+                            spool_file.write(self.take_output(output))
+
+                    spool_file.write(self.take_output(output))
+                    sections.append((sub_collection, start_pos, spool_file.tell()))
+
+                # All results are counted, now the header can be written.
+                self.write_collection_start()
+
+            # Nothing was sent while spooling, measure the write throughput from here.
+            self.start_flush_timer()
+
+            if collection.number_returned:
+                has_multiple_collections = len(collection.results) > 1
+                for sub_collection, start_pos, end_pos in sections:
+                    self.write_sub_collection_start(sub_collection, has_multiple_collections)
+                    yield self.flush_output(output)
+
+                    # Copy the members from the temporary file.
+                    spool_file.seek(start_pos)
+                    remaining = end_pos - start_pos
+                    while remaining > 0:
+                        xml_chunk = spool_file.read(min(self._flush_size, remaining))
+                        remaining -= len(xml_chunk)
+                        self.record_flush(len(xml_chunk))
+                        yield xml_chunk
+
+                    if has_multiple_collections:
+                        self._write(
+                            f"</wfs:{self.xml_sub_collection_tag}>\n</wfs:member>\n".encode()
+                        )
+
+        self._write(f"</wfs:{self.xml_collection_tag}>\n".encode())
+        xml_chunk = self.flush_output(output)
+        self.log_chunk_stats()
+        yield xml_chunk
+
+    def write_collection_start(self):
+        """Write the XML header and the opening <wfs:FeatureCollection> tag.
+        Note this reads the number of results, which may execute the query.
+        """
+        collection = self.collection
         number_matched = collection.number_matched
         number_matched = int(number_matched) if number_matched is not None else "unknown"
         number_returned = collection.number_returned
@@ -227,55 +378,44 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
             f' timeStamp="{collection.timestamp}"'
             f' numberMatched="{number_matched}"'
             f' numberReturned="{int(number_returned)}"'
-            f"{next}{previous}>\n"
+            f"{next}{previous}>\n".encode()
         )
 
-        if number_returned:
-            has_multiple_collections = len(collection.results) > 1
-
-            for sub_collection in collection.results:
-                projection = sub_collection.projection
-                if projection.output_crs.force_xy and projection.output_crs.is_north_east_order:
-                    self._write(
-                        "<!--\n"
-                        f" NOTE: you are requesting the legacy projection notation '{tag_escape(projection.output_crs.origin)}'."
-                        f" Please use '{tag_escape(projection.output_crs.urn)}' instead.\n\n"
-                        " This also means output coordinates are ordered in legacy the 'west, north' axis ordering.\n"
-                        "\n-->\n"
-                    )
-
-                self.start_collection(sub_collection)
-                if has_multiple_collections:
-                    self._write(
-                        f"<wfs:member>\n"
-                        f"<wfs:{self.xml_sub_collection_tag}"
-                        f' timeStamp="{collection.timestamp}"'
-                        f' numberMatched="{int(sub_collection.number_matched)}"'
-                        f' numberReturned="{int(sub_collection.number_returned)}">\n'
-                    )
-
-                for instance in self.read_features(sub_collection):
-                    self.gml_seq = 0  # need to increment this between write_xml_field calls
-                    self._write("<wfs:member>\n")
-                    self.write_feature(projection, instance)
-                    self._write("</wfs:member>\n")
-
-                    # Only perform a 'yield' every once in a while,
-                    # as it goes back-and-forth for writing it to the client.
-                    if output.tell() > self.chunk_size:
-                        xml_chunk = output.getvalue()
-                        output.seek(0)
-                        output.truncate(0)
-                        yield xml_chunk
+    def write_sub_collection_start(
+        self, sub_collection: SimpleFeatureCollection, has_multiple_collections: bool
+    ):
+        """Write the notes and opening tags before the members of a feature type."""
+        projection = sub_collection.projection
+        if projection.output_crs.force_xy and projection.output_crs.is_north_east_order:
+            self._write(
+                "<!--\n"
+                f" NOTE: you are requesting the legacy projection notation '{tag_escape(projection.output_crs.origin)}'."
+                f" Please use '{tag_escape(projection.output_crs.urn)}' instead.\n\n"
+                " This also means output coordinates are ordered in legacy the 'west, north' axis ordering.\n"
+                "\n-->\n".encode()
+            )
 
-                if has_multiple_collections:
-                    self._write(f"</wfs:{self.xml_sub_collection_tag}>\n</wfs:member>\n")
+        if has_multiple_collections:
+            number_matched = sub_collection.number_matched
+            number_matched = int(number_matched) if number_matched is not None else "unknown"
+            self._write(
+                f"<wfs:member>\n"
+                f"<wfs:{self.xml_sub_collection_tag}"
+                f' timeStamp="{self.collection.timestamp}"'
+                f' numberMatched="{number_matched}"'
+                f' numberReturned="{int(sub_collection.number_returned)}">\n'.encode()
+            )
 
-        self._write(f"</wfs:{self.xml_collection_tag}>\n")
-        yield output.getvalue()
+    def write_member(self, projection: FeatureProjection, instance):
+        """Write a single <wfs:member> element."""
+        self.gml_seq = 0  # need to increment this between write_xml_field calls
+        self._write(b"<wfs:member>\n")
+        self.write_feature(projection, instance)
+        self._write(b"</wfs:member>\n")
 
     def start_collection(self, sub_collection: SimpleFeatureCollection):
         """Hook to allow initialization per feature type"""
+        self._write_fields = self.get_feature_writer(sub_collection.projection)
 
     def write_feature(
         self, projection: FeatureProjection, instance: models.Model, extra_xmlns=""
@@ -290,25 +430,34 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
 
         # Write <app:FeatureTypeName> start node
         pk = tag_escape(str(instance.pk))
-        self._write(f'<{feature_xml_qname} gml:id="{feature_type.name}.{pk}"{extra_xmlns}>\n')
+        self._write(
+            f'<{feature_xml_qname} gml:id="{feature_type.name}.{pk}"{extra_xmlns}>\n'.encode()
+        )
+
         # Write all fields, both base class and local elements.
-        for xsd_element in projection.xsd_root_elements:
-            # Note that writing 5000 features with 30 tags means this code make 150.000 method calls.
-            # Hence, branching to different rendering styles is branched here instead of making such
-            # call into a generic "write_field()" function and stepping out from there.
+        # Note that writing 5000 features with 30 tags means this code make 150.000 method calls.
+        # Hence, the branching to different rendering styles is done once per feature type,
+        # instead of checking the element type for each field of every feature.
+        self._write_fields(self, projection, instance)
 
-            if xsd_element.type.is_geometry:
-                # Separate call which can be optimized (no need to overload write_xml_field() for all calls).
-                self.write_gml_field(projection, xsd_element, instance)
-            else:
-                value = xsd_element.get_value(instance)
-                if xsd_element.is_many:
-                    self.write_many(projection, xsd_element, value)
-                else:
-                    # e.g. <gml:name>, or all other <app:...> nodes.
-                    self.write_xml_field(projection, xsd_element, value)
+        self._write(f"</{feature_xml_qname}>\n".encode())
 
-        self._write(f"</{feature_xml_qname}>\n")
+    def get_feature_writer(self, projection: FeatureProjection) -> FeatureWriter:
+        """Provide the function that writes all elements of a feature.
+        This function is reused between requests that render the same tags.
+        """
+        # Subclasses that override write_xml_field() or write_many() still have these called.
+        inline_scalars = (
+            self.__class__.write_xml_field is GML32Renderer.write_xml_field
+            and self.__class__.write_many is GML32Renderer.write_many
+        )
+        xml_qnames = self.xml_qnames
+        return _compile_feature_writer(
+            tuple(
+                _get_element_shape(xsd_element, xml_qnames[xsd_element], inline_scalars)
+                for xsd_element in projection.xsd_root_elements
+            )
+        )
 
     def write_many(self, projection: FeatureProjection, xsd_element: XsdElement, value) -> None:
         """Write a node that has multiple values (e.g. array or queryset)."""
@@ -317,7 +466,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
             # No tag for optional element (see PropertyIsNull), otherwise xsi:nil node.
             if xsd_element.min_occurs:
                 xml_qname = self.xml_qnames[xsd_element]
-                self._write(f'<{xml_qname} xsi:nil="true"/>\n')
+                self._write(f'<{xml_qname} xsi:nil="true"/>\n'.encode())
         else:
             for item in value:
                 self.write_xml_field(projection, xsd_element, value=item)
@@ -328,7 +477,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
         """Write the value of a single field."""
         xml_qname = self.xml_qnames[xsd_element]
         if value is None:
-            self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n')
+            self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n'.encode())
         elif xsd_element.type.is_complex_type:
             # Expanded foreign relation / dictionary
             self.write_xml_complex_type(projection, xsd_element, value, extra_xmlns=extra_xmlns)
@@ -353,14 +502,14 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
                 # Any of the other types have a faster f"{value}" translation that produces the correct text.
                 value = value_to_xml_string(value)
 
-            self._write(f"<{xml_qname}{extra_xmlns}>{value}</{xml_qname}>\n")
+            self._write(f"<{xml_qname}{extra_xmlns}>{value}</{xml_qname}>\n".encode())
 
     def write_xml_complex_type(
         self, projection: FeatureProjection, xsd_element: XsdElement, value, extra_xmlns=""
     ) -> None:
         """Write a single field, that consists of sub elements"""
         xml_qname = self.xml_qnames[xsd_element]
-        self._write(f"<{xml_qname}{extra_xmlns}>\n")
+        self._write(f"<{xml_qname}{extra_xmlns}>\n".encode())
         for sub_element in projection.xsd_child_nodes[xsd_element]:
             if sub_element.type.is_geometry:
                 # Separate call which can be optimized (no need to overload write_xml_field() for all calls).
@@ -371,7 +520,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
                     self.write_many(projection, sub_element, sub_value)
                 else:
                     self.write_xml_field(projection, sub_element, sub_value)
-        self._write(f"</{xml_qname}>\n")
+        self._write(f"</{xml_qname}>\n".encode())
 
     def write_gml_field(
         self,
@@ -388,14 +537,14 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
                 instance, crs=projection.output_crs
             )
             if envelope is not None:
-                self._write(self.render_gml_bounds(envelope))
+                self._write(self.render_gml_bounds(envelope).encode())
         else:
             # Regular geometry elements.
             xml_qname = self.xml_qnames[geo_element]
             value = geo_element.get_value(instance)
             if value is None:
                 # Avoid incrementing gml_seq
-                self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n')
+                self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n'.encode())
             else:
                 gml_id = self.get_gml_id(instance._meta.object_name, instance.pk)
 
@@ -405,7 +554,7 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
                 # gml = f"{gml[:pos]} gml:id="{attr_escape(gml_id)}"{gml[pos:]}"
 
                 gml = self.render_gml_value(projection, gml_id, value)
-                self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n")
+                self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n".encode())
 
     def get_gml_id(self, prefix: str, object_id) -> str:
         """Generate the gml:id value, which is required for GML 3.2 objects."""
@@ -431,8 +580,14 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
     ) -> str:
         """Normal case: 'value' is raw geometry data.."""
         # In case this is a standalone response, this will be the top-level element, hence includes the xmlns.
-        base_attrs = f' gml:id="{attr_escape(gml_id)}" srsName="{attr_escape(str(projection.output_crs))}"{extra_xmlns}'
-        projection.output_crs.apply_to(value)
+        output_crs = projection.output_crs
+        base_attrs = f' gml:id="{attr_escape(gml_id)}" srsName="{attr_escape(str(output_crs))}"{extra_xmlns}'
+
+        # When only the axis ordering changes (e.g. EPSG:4326 to urn:...:4326),
+        # the coordinates are swapped while writing. Otherwise, transform the geometry.
+        self.gml_swap_xy = output_crs.is_axis_swap_only(value)
+        if not self.gml_swap_xy:
+            output_crs.apply_to(value)
         return self._render_gml_type(value, base_attrs=base_attrs)
 
     def _render_gml_type(self, value: geos.GEOSGeometry, base_attrs=""):
@@ -446,12 +601,13 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
 
     @register_geos_type(geos.Point)
     def render_gml_point(self, value: geos.Point, base_attrs=""):
-        coords = " ".join(map(str, value.coords))
+        coords = value.coords
+        if self.gml_swap_xy:
+            coords = (coords[1], coords[0], *coords[2:])
+        coords = " ".join(map(str, coords))
         dim = 3 if value.hasz else 2
         return (
-            f"<gml:Point{base_attrs}>"
-            f'<gml:pos srsDimension="{dim}">{coords}</gml:pos>'
-            f"</gml:Point>"
+            f'<gml:Point{base_attrs}><gml:pos srsDimension="{dim}">{coords}</gml:pos></gml:Point>'
         )
 
     @register_geos_type(geos.Polygon)
@@ -501,9 +657,8 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
 
     @register_geos_type(geos.LinearRing)
     def render_gml_linear_ring(self, value: geos.LinearRing, base_attrs=""):
-        # NOTE: this is super slow. value.tuple performs a C-API call for every point!
-        coords = " ".join(map(str, itertools.chain.from_iterable(value.tuple)))
-        dim = "3" if value.hasz else "2"
+        dim = 3 if value.hasz else 2
+        coords = render_pos_list(value, dim, swap_xy=self.gml_swap_xy)
         # <gml:coordinates> is still valid in GML3, but deprecated (part of GML2).
         return (
             f"<gml:LinearRing{base_attrs}>"
@@ -513,9 +668,8 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
 
     @register_geos_type(geos.LineString)
     def render_gml_line_string(self, value: geos.LineString, base_attrs=""):
-        # NOTE: this is super slow. value.tuple performs a C-API call for every point!
-        coords = " ".join(map(str, itertools.chain.from_iterable(value.tuple)))
-        dim = "3" if value.hasz else "2"
+        dim = 3 if value.hasz else 2
+        coords = render_pos_list(value, dim, swap_xy=self.gml_swap_xy)
         return (
             f"<gml:LineString{base_attrs}>"
             f'<gml:posList srsDimension="{dim}">{coords}</gml:posList>'
@@ -523,21 +677,221 @@ class GML32Renderer(CollectionOutputRenderer, XmlOutputRenderer):
         )
 
 
+def _format_xml_text(value) -> str:
+    """Format any value as XML text, same logic as :meth:`GML32Renderer.write_xml_field`."""
+    value_cls = value.__class__
+    if value_cls is str:  # most cases
+        return tag_escape(value)
+    elif value_cls is datetime:
+        return value.astimezone(timezone.utc).isoformat()
+    elif value_cls is bool:
+        return "true" if value else "false"
+    elif value_cls in AUTO_STR:
+        return f"{value}"
+    else:
+        return value_to_xml_string(value)
+
+
+def _format_xml_str(value) -> str:
+    """Format the value of a text field, only escaping is needed."""
+    return tag_escape(value) if value.__class__ is str else _format_xml_text(value)
+
+
+def _format_xml_auto_str(value) -> str:
+    """Format the value of a number or date field, these need no escaping."""
+    return f"{value}" if value.__class__ in AUTO_STR else _format_xml_text(value)
+
+
+# Which value formatter to use for the model field type.
+# Each formatter still checks the value type, as custom fields may return other values.
+_XML_VALUE_FORMATTERS = {
+    "CharField": _format_xml_str,
+    "EmailField": _format_xml_str,
+    "SlugField": _format_xml_str,
+    "TextField": _format_xml_str,
+    "URLField": _format_xml_str,
+    "AutoField": _format_xml_auto_str,
+    "BigAutoField": _format_xml_auto_str,
+    "BigIntegerField": _format_xml_auto_str,
+    "DateField": _format_xml_auto_str,
+    "DecimalField": _format_xml_auto_str,
+    "FloatField": _format_xml_auto_str,
+    "IntegerField": _format_xml_auto_str,
+    "PositiveBigIntegerField": _format_xml_auto_str,
+    "PositiveIntegerField": _format_xml_auto_str,
+    "PositiveSmallIntegerField": _format_xml_auto_str,
+    "SmallAutoField": _format_xml_auto_str,
+    "SmallIntegerField": _format_xml_auto_str,
+    "TimeField": _format_xml_auto_str,
+}
+
+
+def _get_element_shape(
+    xsd_element: XsdElement, xml_qname: str, inline_scalars: bool
+) -> tuple[str, str | None, Callable[[object], str] | None, bool]:
+    """Tell how an element is written, as hashable key for :func:`_compile_feature_writer`.
+    This doesn't reference the element itself, so features with the same tags share a writer.
+    """
+    if xsd_element.type.is_geometry:
+        return ("gml", None, None, False)
+    elif xsd_element.type.is_complex_type or not inline_scalars:
+        return ("many" if xsd_element.is_many else "field", None, None, False)
+
+    field = xsd_element.source
+    if xsd_element.is_array:
+        field = field.base_field
+    internal_type = field.get_internal_type() if isinstance(field, models.Field) else None
+    format_value = _XML_VALUE_FORMATTERS.get(internal_type, _format_xml_text)
+    if xsd_element.is_many:
+        # No tag for optional element (see PropertyIsNull), otherwise xsi:nil node.
+        return ("scalar_many", xml_qname, format_value, bool(xsd_element.min_occurs))
+    else:
+        return ("scalar", xml_qname, format_value, True)
+
+
+@lru_cache(maxsize=200)
+def _compile_feature_writer(
+    element_shapes: tuple[tuple[str, str | None, Callable[[object], str] | None, bool], ...],
+) -> FeatureWriter:
+    """Generate the function that writes all elements of a feature.
+
+    The element types are checked only once here, so the generated function
+    can call the right writer for each element without any further branching.
+    Scalar elements have their tags and value formatting prepared.
+    """
+    element_writers = []
+    for kind, xml_qname, format_value, write_nil in element_shapes:
+        if kind == "gml":
+            element_writers.append(_write_gml_element)
+        elif kind == "many":
+            element_writers.append(_write_many_element)
+        elif kind == "field":
+            # e.g. complex elements, or a subclass that overrides write_xml_field().
+            element_writers.append(_write_field_element)
+        elif kind == "scalar_many":
+            element_writers.append(_compile_scalar_many_writer(xml_qname, format_value, write_nil))
+        else:
+            # e.g. <gml:name>, or all other <app:...> nodes.
+            element_writers.append(_compile_scalar_writer(xml_qname, format_value))
+
+    def write_fields(renderer: GML32Renderer, projection: FeatureProjection, instance):
+        for xsd_element, write_element in zip(projection.xsd_root_elements, element_writers):
+            write_element(renderer, projection, xsd_element, instance)
+
+    return write_fields
+
+
+def _write_gml_element(
+    renderer: GML32Renderer, projection: FeatureProjection, geo_element, instance
+):
+    renderer.write_gml_field(projection, geo_element, instance)
+
+
+def _write_many_element(
+    renderer: GML32Renderer, projection: FeatureProjection, xsd_element, instance
+):
+    renderer.write_many(projection, xsd_element, xsd_element.get_value(instance))
+
+
+def _write_field_element(
+    renderer: GML32Renderer, projection: FeatureProjection, xsd_element, instance
+):
+    renderer.write_xml_field(projection, xsd_element, xsd_element.get_value(instance))
+
+
+def _compile_scalar_writer(xml_qname: str, format_value: Callable[[object], str]) -> ElementWriter:
+    """Generate the writer for a scalar element.
+    This has the same output as :meth:`GML32Renderer.write_xml_field`, with the tags prepared.
+    """
+    nil_tag = f'<{xml_qname} xsi:nil="true"/>\n'.encode()
+    start_tag = f"<{xml_qname}>"
+    end_tag = f"</{xml_qname}>\n"
+
+    def write_scalar(renderer: GML32Renderer, projection, xsd_element, instance):
+        value = xsd_element.get_value(instance)
+        if value is None:
+            renderer._write(nil_tag)
+        else:
+            renderer._write(f"{start_tag}{format_value(value)}{end_tag}".encode())
+
+    return write_scalar
+
+
+def _compile_scalar_many_writer(
+    xml_qname: str, format_value: Callable[[object], str], write_nil: bool
+) -> ElementWriter:
+    """Generate the writer for an array of scalar values.
+    This has the same output as :meth:`GML32Renderer.write_many`, with the tags prepared.
+    """
+    nil_tag = f'<{xml_qname} xsi:nil="true"/>\n'.encode()
+    start_tag = f"<{xml_qname}>"
+    end_tag = f"</{xml_qname}>\n"
+
+    def write_scalar_many(renderer: GML32Renderer, projection, xsd_element, instance):
+        value = xsd_element.get_value(instance)
+        if value is None:
+            if write_nil:
+                renderer._write(nil_tag)
+        else:
+            for item in value:
+                if item is None:
+                    renderer._write(nil_tag)
+                else:
+                    renderer._write(f"{start_tag}{format_value(item)}{end_tag}".encode())
+
+    return write_scalar_many
+
+
 class DBGMLRenderingMixin:
+    """Common logic for renderers that let the database render the GML geometries."""
+
+    #: Whether the database already writes the gml:id, so the GML can be written as-is.
+    _use_db_gml_id = False
+
+    def get_db_gml_options(self, projection: FeatureProjection) -> dict:
+        """Tell which :class:`~gisserver.db.AsGML` options produce the expected notation."""
+        output_crs = projection.output_crs
+        use_modern = not output_crs.force_xy
+        if output_crs.force_xy:
+            # When legacy output is used, make sure the srsName matches the input.
+            # PostgreSQL will still generate the EPSG:xxxx notation.
+            srs_name = output_crs.legacy
+        elif output_crs == CRS84:
+            # Fix PostgreSQL not knowing it's CRS84 or WGS84 (both srid 4326)
+            srs_name = "urn:ogc:def:crs:OGC::CRS84"
+        else:
+            srs_name = None
+
+        return {
+            "is_latlon": use_modern and output_crs.is_north_east_order,
+            "long_urn": use_modern,
+            "srs_name": srs_name,
+        }
+
+    def use_db_gml_id(self, projection: FeatureProjection) -> bool:
+        """Tell whether the database can generate the gml:id of the geometries.
+        The gml:id contains the primary key, which the database writes differently
+        than Python would for non-integer keys.
+        """
+        return isinstance(projection.feature_type.model._meta.pk, models.IntegerField)
 
     def render_gml_value(self, projection, gml_id, value: str, extra_xmlns=""):
         """DB optimized: 'value' is pre-rendered GML XML string."""
+        if self._use_db_gml_id and not extra_xmlns:
+            # The gml:id and srsName are already written by the database.
+            return value
+
         # Write the gml:id inside the first tag
         end_pos = value.find(">")
         gml_tag = value[:end_pos]
         id_pos = gml_tag.find("gml:id=")
         if id_pos == -1:
             # Inject
-            gml = f'{gml_tag} gml:id="{attr_escape(gml_id)}"{extra_xmlns}{value[end_pos:]}'
+            return f'{gml_tag} gml:id="{attr_escape(gml_id)}"{extra_xmlns}{value[end_pos:]}'
         else:
             # Replace
             end_pos1 = gml_tag.find('"', id_pos + 8)
-            gml = (
+            return (
                 f"{gml_tag[:id_pos]}"
                 f'gml:id="{attr_escape(gml_id)}'
                 f"{value[end_pos1:end_pos]}"  # from " right until >
@@ -545,27 +899,12 @@ class DBGMLRenderingMixin:
                 f"{value[end_pos:]}"  # from > and beyond
             )
 
-        return self._fix_db_crs_name(projection, gml)
-
-    def _fix_db_crs_name(self, projection: FeatureProjection, gml: str) -> str:
-        if projection.output_crs.force_xy:
-            # When legacy output is used, make sure the srsName matches the input.
-            # PostgreSQL will still generate the EPSG:xxxx notation.
-            return gml.replace(
-                'srsName="EPSG:', 'srsName="http://www.opengis.net/gml/srs/epsg.xml#', 1
-            )
-        elif projection.output_crs == CRS84:
-            # Fix PostgreSQL not knowing it's CRS84 or WGS84 (both srid 4326)
-            return gml.replace(
-                'srsName="urn:ogc:def:crs:EPSG::4326"', 'srsName="urn:ogc:def:crs:OGC::CRS84"', 1
-            )
-        else:
-            return gml
-
 
 class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
     """Faster GetFeature renderer that uses the database to render GML 3.2"""
 
+    _use_db_feature_xml = False
+
     def decorate_queryset(self, projection: FeatureProjection, queryset: models.QuerySet):
         """Update the queryset to let the database render the GML output.
         This is far more efficient than GeoDjango's logic, which performs a
@@ -573,6 +912,12 @@ class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
         """
         queryset = super().decorate_queryset(projection, queryset)
 
+        if self.use_db_feature_rendering(projection):
+            # The database renders all elements, no need to retrieve the fields themselves.
+            return queryset.only("pk").annotate(
+                _as_feature_xml=self.get_db_feature_xml(projection, queryset)
+            )
+
         # Retrieve gml:boundedBy in pre-rendered format.
         if projection.has_bounded_by:
             queryset = queryset.annotate(
@@ -582,14 +927,21 @@ class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
         # Retrieve geometries as pre-rendered instead.
         # Only take the geometries of the current level.
         # The annotations for relations will be handled by prefetches and get_prefetch_queryset()
-        use_modern = not projection.output_crs.force_xy
+        if self.use_db_gml_id(projection):
+            element_kwargs = {
+                geo_element: {"gml_id": gml_id}
+                for geo_element, gml_id in self.get_db_gml_ids(projection, queryset).items()
+            }
+        else:
+            element_kwargs = None
+
         return replace_queryset_geometries(
             queryset,
             projection.geometry_elements,
             projection.output_crs,
             AsGML,
-            is_latlon=use_modern and projection.output_crs.is_north_east_order,
-            long_urn=use_modern,
+            element_kwargs=element_kwargs,
+            **self.get_db_gml_options(projection),
         )
 
     def get_prefetch_queryset(
@@ -603,14 +955,129 @@ class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
             return None
 
         # Find which fields are GML elements
-        use_modern = not projection.output_crs.force_xy
         return replace_queryset_geometries(
             queryset,
             feature_relation.geometry_elements,
             projection.output_crs,
             AsGML,
-            is_latlon=use_modern and projection.output_crs.is_north_east_order,
-            long_urn=use_modern,
+            **self.get_db_gml_options(projection),
+        )
+
+    def use_db_feature_rendering(self, projection: FeatureProjection) -> bool:
+        """Tell whether the database can render the complete feature contents.
+
+        This is only possible for flat features, that don't access any relations
+        and don't produce their values in Python. Note that ``<gml:id>`` attributes
+        are generated in the database, which is only supported for integer primary keys.
+        Float fields are excluded too, as PostgreSQL would write "5.0" as "5".
+        Array fields are excluded as these are written as repeated elements.
+        """
+        return (
+            conf.GISSERVER_USE_DB_FEATURE_RENDERING
+            and projection.is_flat
+            and isinstance(projection.feature_type.model._meta.pk, models.IntegerField)
+            and not any(
+                xsd_element.is_array or isinstance(xsd_element.source, models.FloatField)
+                for xsd_element in projection.xsd_root_elements
+            )
+        )
+
+    def get_db_feature_xml(self, projection: FeatureProjection, queryset) -> Concat:
+        """Let the database render all elements of the feature as a single XML fragment.
+
+        This produces the same output as :meth:`write_feature` would do,
+        but avoids formatting and escaping each field in Python.
+        """
+        gml_ids = self.get_db_gml_ids(projection, queryset)
+        gml_options = self.get_db_gml_options(projection)
+        parts = []
+
+        for xsd_element in projection.xsd_root_elements:
+            xml_qname = self.to_qname(xsd_element)
+            if xsd_element.type is XsdTypes.gmlBoundingShapeType:
+                # No tag at all when there are no geometries to take the bounds from.
+                gml = self.get_db_envelope_as_gml(projection, queryset)
+                parts.append(_db_xml_tag(xml_qname, gml, nil=""))
+            elif xsd_element.type.is_geometry:
+                gml = AsGML(
+                    get_db_geometry_target(xsd_element, projection.output_crs),
+                    gml_id=gml_ids[xsd_element],
+                    **gml_options,
+                )
+                is_null = IsNull(F(xsd_element.orm_path), True)
+                parts.append(_db_xml_tag(xml_qname, gml, is_null=is_null))
+            else:
+                # Let xmlelement() write the tag, which also escapes and formats the value.
+                value = F(xsd_element.orm_path)
+                parts.append(
+                    Case(
+                        When(IsNull(value, True), then=Value(f'<{xml_qname} xsi:nil="true"/>\n')),
+                        default=Concat(
+                            XmlElement(xml_qname, value),
+                            Value("\n"),
+                            output_field=models.TextField(),
+                        ),
+                        output_field=models.TextField(),
+                    )
+                )
+
+        if len(parts) == 1:
+            return parts[0]
+        return Concat(*parts, output_field=models.TextField())
+
+    def use_db_gml_id(self, projection: FeatureProjection) -> bool:
+        """Tell whether the database can generate the gml:id of the geometries.
+        This is not possible when related objects have geometries,
+        as these share the same sequence number within the feature.
+        """
+        return super().use_db_gml_id(projection) and not any(
+            xsd_element.type.is_geometry
+            for xsd_elements in projection.xsd_child_nodes.values()
+            for xsd_element in xsd_elements
+        )
+
+    def get_db_gml_ids(
+        self, projection: FeatureProjection, queryset
+    ) -> dict[GeometryXsdElement, Concat]:
+        """Generate the gml:id values of the root-level geometries, like :meth:`get_gml_id` does.
+        The sequence number is only incremented for geometries that are not null.
+        """
+        object_name = queryset.model._meta.object_name
+        gml_seq = Value(1)
+        gml_ids = {}
+        for geo_element in projection.geometry_elements:
+            gml_ids[geo_element] = Concat(
+                Value(f"{object_name}."),
+                Cast("pk", models.TextField()),
+                Value("."),
+                Cast(gml_seq, models.TextField()),
+                output_field=models.TextField(),
+            )
+            is_null = IsNull(F(geo_element.orm_path), True)
+            gml_seq = gml_seq + Case(When(is_null, then=Value(0)), default=Value(1))
+        return gml_ids
+
+    def start_collection(self, sub_collection: SimpleFeatureCollection):
+        """Detect whether the features are pre-rendered by the database."""
+        super().start_collection(sub_collection)
+        self._use_db_feature_xml = self.use_db_feature_rendering(sub_collection.projection)
+        self._use_db_gml_id = self.use_db_gml_id(sub_collection.projection)
+
+    def write_feature(
+        self, projection: FeatureProjection, instance: models.Model, extra_xmlns=""
+    ) -> None:
+        """Write the feature, using the pre-rendered XML from the database when possible."""
+        if not self._use_db_feature_xml:
+            super().write_feature(projection, instance, extra_xmlns=extra_xmlns)
+            return
+
+        feature_type = projection.feature_type
+        feature_xml_qname = self.feature_qnames[feature_type]
+        pk = tag_escape(str(instance.pk))
+        self._write(
+            f'<{feature_xml_qname} gml:id="{feature_type.name}.{pk}"{extra_xmlns}>\n'
+            f"{instance._as_feature_xml}"
+            f"</{feature_xml_qname}>\n".encode()
         )
 
     def get_db_envelope_as_gml(self, projection: FeatureProjection, queryset) -> AsGML:
@@ -619,13 +1086,7 @@ class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
         This also avoids offloads the geometry union calculation to the DB.
         """
         geo_fields_union = self._get_geometries_union(projection, queryset)
-        use_modern = not projection.output_crs.force_xy
-        return AsGML(
-            geo_fields_union,
-            envelope=True,
-            is_latlon=use_modern and projection.output_crs.is_north_east_order,
-            long_urn=use_modern,
-        )
+        return AsGML(geo_fields_union, envelope=True, **self.get_db_gml_options(projection))
 
     def _get_geometries_union(self, projection: FeatureProjection, queryset):
         """Combine all geometries of the model in a single SQL function."""
@@ -655,20 +1116,36 @@ class DBGML32Renderer(DBGMLRenderingMixin, GML32Renderer):
             gml = instance._as_envelope_gml
             if gml is None:
                 return
-
-            gml = self._fix_db_crs_name(projection, gml)
         else:
             value = get_db_rendered_geometry(instance, geo_element, AsGML)
             if value is None:
                 # Avoid incrementing gml_seq, make nil tag.
-                self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n')
+                self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n'.encode())
                 return
 
             # Get gml tag to write as value.
             gml_id = self.get_gml_id(instance._meta.object_name, instance.pk)
             gml = self.render_gml_value(projection, gml_id, value, extra_xmlns=extra_xmlns)
 
-        self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n")
+        self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n".encode())
+
+
+def _db_xml_tag(xml_qname: str, content, is_null=None, nil=None) -> Case:
+    """Database expression to wrap pre-rendered content in an XML tag.
+    When the content is null, the ``nil`` value is written instead (default a ``xsi:nil`` tag).
+    """
+    if nil is None:
+        nil = f'<{xml_qname} xsi:nil="true"/>\n'
+    return Case(
+        When(is_null if is_null is not None else IsNull(content, True), then=Value(nil)),
+        default=Concat(
+            Value(f"<{xml_qname}>"),
+            content,
+            Value(f"</{xml_qname}>\n"),
+            output_field=models.TextField(),
+        ),
+        output_field=models.TextField(),
+    )
 
 
 class GML32ValueRenderer(GML32Renderer):
@@ -686,6 +1163,7 @@ class GML32ValueRenderer(GML32Renderer):
     xml_collection_tag = "ValueCollection"
     xml_sub_collection_tag = "ValueCollection"
     _escape_value = staticmethod(value_to_xml_string)
+
     gml_value_getter = itemgetter("member")
 
     def decorate_queryset(self, projection: FeatureProjection, queryset: models.QuerySet):
@@ -703,7 +1181,7 @@ class GML32ValueRenderer(GML32Renderer):
             self.content_disposition = self.content_disposition_plain
             self._escape_value = value_to_text  # avoid XML escaping
         else:
-            self._write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            self._write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
 
         # Write the single tag, no <wfs:member> around it.
         self.write_feature(sub_collection.projection, instance, extra_xmlns=extra_xmlns)
@@ -725,7 +1203,7 @@ class GML32ValueRenderer(GML32Renderer):
             if value is not None:
                 value = xsd_node.format_raw_value(instance["member"])  # for gml:id
                 value = self._escape_value(value)
-                self._write(value)
+                self._write(value.encode())
         elif xsd_node.is_array:
             if (value := instance["member"]) is not None:
                 # <wfs:member> doesn't allow multiple items as children, for new render as separate members.
@@ -734,10 +1212,10 @@ class GML32ValueRenderer(GML32Renderer):
                 for item in value:
                     if item is not None:
                         if not first:
-                            self._write("</wfs:member>\n<wfs:member>")
+                            self._write(b"</wfs:member>\n<wfs:member>")
 
                         item = self._escape_value(item)
-                        self._write(f"<{xml_qname}>{item}</{xml_qname}>\n")
+                        self._write(f"<{xml_qname}>{item}</{xml_qname}>\n".encode())
                         first = False
         elif xsd_node.type.is_complex_type:
             raise NotImplementedError("GetPropertyValue with complex types is not implemented")
@@ -767,12 +1245,12 @@ class GML32ValueRenderer(GML32Renderer):
         xml_qname = self.xml_qnames[geo_element]
         if value is None:
             # Avoid incrementing gml_seq
-            self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n')
+            self._write(f'<{xml_qname} xsi:nil="true"{extra_xmlns}/>\n'.encode())
             return
 
         gml_id = self.get_gml_id(geo_element.source.model._meta.object_name, instance["pk"])
         gml = self.render_gml_value(projection, gml_id, value, extra_xmlns=extra_xmlns)
-        self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n")
+        self._write(f"<{xml_qname}{extra_xmlns}>{gml}</{xml_qname}>\n".encode())
 
 
 class DBGML32ValueRenderer(DBGMLRenderingMixin, GML32ValueRenderer):
@@ -787,14 +1265,29 @@ class DBGML32ValueRenderer(DBGMLRenderingMixin, GML32ValueRenderer):
         if element.type.is_geometry:
             # Add 'gml_member' to point to the pre-rendered GML version.
             geo_element = cast(GeometryXsdElement, element)
-            use_modern = not projection.output_crs.force_xy
+            if self.use_db_gml_id(projection):
+                # Each value is written as the first geometry of the member.
+                gml_id = Concat(
+                    Value(f"{geo_element.source.model._meta.object_name}."),
+                    Cast("pk", models.TextField()),
+                    Value(".1"),
+                    output_field=models.TextField(),
+                )
+            else:
+                gml_id = None
+
             return queryset.values(
                 "pk",
                 gml_member=AsGML(
                     get_db_geometry_target(geo_element, projection.output_crs),
-                    is_latlon=use_modern and projection.output_crs.is_north_east_order,
-                    long_urn=use_modern,
+                    gml_id=gml_id,
+                    **self.get_db_gml_options(projection),
                 ),
             )
         else:
             return queryset
+
+    def start_collection(self, sub_collection: SimpleFeatureCollection):
+        """Detect whether the gml:id is written by the database."""
+        super().start_collection(sub_collection)
+        self._use_db_gml_id = self.use_db_gml_id(sub_collection.projection)
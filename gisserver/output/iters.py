@@ -1,16 +1,32 @@
 from __future__ import annotations
 
 import logging
-from collections.abc import Iterable
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
 from itertools import islice
+from operator import itemgetter
 from typing import TypeVar
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import connections, models
+from django.db.models import OuterRef
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import BaseIterable
 from lru import LRU
 
+from gisserver.db import (
+    add_keyset_annotations,
+    get_keyset_filter,
+    get_keyset_ordering,
+    get_keyset_values,
+)
+
 M = TypeVar("M", bound=models.Model)
 
 DEFAULT_SQL_CHUNK_SIZE = 2000  # allow unit tests to alter this.
+_END = object()
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +40,7 @@ class CountingIterator(Iterable[M]):
         self._in_iterator = False
         self._max_results = max_results
         self._has_more = None
+        self._last_item = None
 
     def __iter__(self):
         # Count the number of returned items while reading them.
@@ -36,6 +53,7 @@ class CountingIterator(Iterable[M]):
                     self._has_more = True
                     break
                 self._number_returned += 1
+                self._last_item = instance
                 yield instance
         finally:
             if self._max_results and self._has_more is None:
@@ -53,6 +71,127 @@ class CountingIterator(Iterable[M]):
     def has_more(self) -> bool | None:
         return self._has_more
 
+    @property
+    def last_item(self) -> M | None:
+        """Tell which object was returned last (e.g. to continue the next page from)."""
+        return self._last_item
+
+
+class FeatureRowIterable(BaseIterable):
+    """Iterable that yields a lightweight row for each record, instead of a model instance.
+
+    Constructing model instances (``Model.from_db()``, ``__init__()``, ``_state``)
+    is a large part of the costs per record. Instead, the row is a tuple where each
+    selected field and annotation can be read by attribute name, like a model instance.
+    Only the selected columns, ``pk`` and ``_meta`` are available.
+    Use it as ``queryset._iterable_class``.
+    """
+
+    def __iter__(self):
+        queryset = self.queryset
+        compiler = queryset.query.get_compiler(using=queryset.db)
+        results = compiler.execute_sql(
+            chunked_fetch=self.chunked_fetch, chunk_size=self.chunk_size
+        )
+
+        # Same logic as Django's ModelIterable to find the positions of each column.
+        select, klass_info = compiler.select, compiler.klass_info
+        names = [None] * len(select)
+        for col_pos in klass_info["select_fields"]:
+            names[col_pos] = select[col_pos][0].target.attname
+        for attr_name, col_pos in compiler.annotation_col_map.items():
+            names[col_pos] = attr_name
+
+        row_class = _get_row_class(klass_info["model"], tuple(names))
+        yield from map(row_class, compiler.results_iter(results))
+
+
+@lru_cache(maxsize=200)
+def _get_row_class(model: type[models.Model], names: tuple[str | None, ...]) -> type[tuple]:
+    """Construct the tuple subclass that reads each attribute from its position in the row."""
+    attrs = {name: property(itemgetter(i)) for i, name in enumerate(names) if name is not None}
+    attrs.update(
+        pk=attrs[model._meta.pk.attname],
+        _meta=model._meta,
+        __slots__=(),
+        __repr__=lambda self: f"<{self.__class__.__name__}: {self.pk}>",
+    )
+    return type(f"{model.__name__}Row", (tuple,), attrs)
+
+
+class _Failure:
+    """Wrapper to pass an exception from the read-ahead thread to the consumer."""
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class ReadAheadIterator(Iterable[list[M]]):
+    """Read the next chunks of results in a background thread.
+
+    While the consumer processes (e.g. renders) the current chunk, the next chunk
+    is already fetched from the database. This lets the database and the Python code
+    work at the same time, instead of waiting for each other.
+
+    As Django connections are thread-local, the background thread runs the queries
+    on its own database connection. This leaves the connection of the consumer free
+    for other queries. The queue is bounded, so at most ``max_chunks`` are held
+    in memory ahead of the consumer.
+    """
+
+    def __init__(self, chunks: Iterator[list[M]], using: str, max_chunks=1):
+        """
+        :param chunks: The generator that fetches each chunk. This runs in the background thread.
+        :param using: The database alias that the background thread reads from.
+        :param max_chunks: How many chunks may be read ahead.
+        """
+        self.chunks = chunks
+        self.using = using
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._stop = threading.Event()
+
+    def __iter__(self):
+        thread = threading.Thread(target=self._read_chunks, name="gisserver-read-ahead")
+        thread.start()
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is _END:
+                    break
+                elif isinstance(chunk, _Failure):
+                    raise chunk.exception
+                yield chunk
+        finally:
+            # Also stop the thread when the consumer stopped early, or failed.
+            # Waiting for it ensures the server-side cursor is closed.
+            self._stop.set()
+            thread.join()
+
+    def _read_chunks(self):
+        """The body of the background thread."""
+        try:
+            for chunk in self.chunks:
+                if not self._put(chunk):
+                    return
+        except BaseException as e:
+            self._put(_Failure(e))
+        else:
+            self._put(_END)
+        finally:
+            # Closing the generator also closes the database cursor.
+            self.chunks.close()
+            connections[self.using].close()
+
+    def _put(self, item) -> bool:
+        """Add an item to the queue, unless the consumer stopped reading."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
 
 class lru_dict(dict):
     """A 'defaultdict' with LRU items for each value."""
@@ -84,29 +223,81 @@ class ChunkedQuerySetIterator(Iterable[M]):
     As extra performance benefit, a local cache avoids prefetching the same records
     again when the next chunk is analysed. It has a "least recently used" cache to avoid
     flooding the caches when foreign keys constantly point to different unique objects.
+    The cache of each foreign key grows when its records are frequently reused,
+    and shrinks when it has no effect.
+
+    Many-to-many relations are cached the same way on PostgreSQL. The main query
+    selects the keys of the related objects as an array, so only the objects
+    that are not cached yet have to be fetched.
     """
 
-    def __init__(self, queryset: models.QuerySet, chunk_size=None, sql_chunk_size=None):
+    #: The hit ratio of a chunk that makes the cache grow.
+    cache_grow_ratio = 0.5
+
+    #: The hit ratio of a chunk that makes the cache shrink.
+    cache_shrink_ratio = 0.05
+
+    def __init__(
+        self,
+        queryset: models.QuerySet,
+        chunk_size=None,
+        sql_chunk_size=None,
+        read_ahead=False,
+        cache_size=None,
+    ):
         """
         :param queryset: The queryset to iterate over, that has ``prefetch_related()`` data.
         :param chunk_size: The size of each segment to analyse in-memory for related objects.
         :param sql_chunk_size: The size of each segment to fetch from the database,
             used when server-side cursors are not available. The default follows Django behavior.
+        :param read_ahead: Whether the next chunk (and its prefetches) is read
+            in a background thread, while the current chunk is processed.
+            The thread uses its own database connection.
+        :param cache_size: The initial size of the prefetch cache for each relation.
         """
-        self.queryset = queryset
+        self._m2m_lookups = {}
+        self.queryset = self._add_many_to_many_keys(queryset)
         self.sql_chunk_size = sql_chunk_size or DEFAULT_SQL_CHUNK_SIZE
         self.chunk_size = chunk_size or self.sql_chunk_size
-        self._fk_caches = lru_dict(self.chunk_size // 2)
+        self.read_ahead = read_ahead
+        self.cache_size_range = (max(self.chunk_size // 8, 1), self.chunk_size * 4)
+        cache_size = cache_size or max(self.chunk_size // 2, 1)
+        self._fk_caches = lru_dict(cache_size)
+        self._m2m_caches = lru_dict(cache_size)
         self._number_returned = 0
         self._in_iterator = False
+        self._last_item = None
+
+        #: The number of related objects that were restored from the caches.
+        self.cache_hits = 0
+        #: The number of related objects that had to be prefetched again.
+        self.cache_misses = 0
 
     def __iter__(self):
-        # Using iter() ensures the ModelIterable is resumed with the next chunk.
         self._number_returned = 0
         self._in_iterator = True
+        chunks = self._read_chunks()
+        if self.read_ahead and not connections[self.queryset.db].in_atomic_block:
+            # Other connections can't see the uncommitted data of a transaction,
+            # hence the results are only read ahead outside a transaction.
+            chunks = iter(ReadAheadIterator(chunks, using=self.queryset.db))
+
         try:
-            qs_iter = iter(self._get_queryset_iterator())
+            for instances in chunks:
+                # Return to parent loop
+                yield from instances
+                self._number_returned += len(instances)
+                self._last_item = instances[-1]
+        finally:
+            # When the consumer stops early, make sure the cursor/thread is cleaned up.
+            chunks.close()
+            self._in_iterator = False
 
+    def _read_chunks(self) -> Iterator[list[M]]:
+        """Fetch the chunks, and perform the prefetches for each chunk."""
+        # Using iter() ensures the ModelIterable is resumed with the next chunk.
+        qs_iter = iter(self._get_queryset_iterator())
+        try:
             # Keep fetching chunks
             while True:
                 instances = list(islice(qs_iter, self.chunk_size))
@@ -114,14 +305,12 @@ class ChunkedQuerySetIterator(Iterable[M]):
                     break
 
                 # Perform prefetches on this chunk:
-                if self.queryset._prefetch_related_lookups:
+                if self.queryset._prefetch_related_lookups or self._m2m_lookups:
                     self._add_prefetches(instances)
 
-                # And return to parent loop
-                yield from instances
-                self._number_returned += len(instances)
+                yield instances
         finally:
-            self._in_iterator = False
+            qs_iter.close()
 
     def _get_queryset_iterator(self) -> Iterable:
         """The body of queryset.iterator(), while circumventing prefetching."""
@@ -133,12 +322,55 @@ class ChunkedQuerySetIterator(Iterable[M]):
         use_chunked_fetch = not connections[self.queryset.db].settings_dict.get(
             "DISABLE_SERVER_SIDE_CURSORS"
         )
+        if not use_chunked_fetch:
+            # Without server-side cursors (e.g. behind pgbouncer in transaction mode),
+            # the database driver reads all results into memory before returning anything.
+            # When possible, read the results with keyset pagination queries instead.
+            ordering = get_keyset_ordering(self.queryset)
+            if ordering is not None and not self.queryset.query.distinct_fields:
+                yield from self._get_keyset_iterator(ordering)
+                return
+
         iterable = self.queryset._iterable_class(
             self.queryset, chunked_fetch=use_chunked_fetch, chunk_size=self.sql_chunk_size
         )
 
         yield from iterable
 
+    def _get_keyset_iterator(self, ordering: list[str]) -> Iterable:
+        """Read the results with successive ``WHERE (sortkey, pk) > (...) LIMIT n`` queries.
+        This keeps the memory usage flat when server-side cursors are not available.
+        """
+        # The page is typically sliced already, which doesn't allow ordering or filtering.
+        # Take the limits from a clone, and apply these to the keyset queries instead.
+        queryset = self.queryset.all()
+        offset, high_mark = queryset.query.low_mark, queryset.query.high_mark
+        queryset.query.clear_limits()
+        queryset = add_keyset_annotations(queryset.order_by(*ordering), ordering)
+        remaining = None if high_mark is None else high_mark - offset
+
+        keyset = None
+        while remaining is None or remaining > 0:
+            size = (
+                self.sql_chunk_size if remaining is None else min(remaining, self.sql_chunk_size)
+            )
+            chunk_qs = queryset
+            if keyset is not None:
+                # Continue after the last record of the previous chunk.
+                chunk_qs = queryset.filter(get_keyset_filter(ordering, keyset))
+            chunk_qs = chunk_qs[offset : offset + size]
+
+            # Like the normal iterator, this circumvents the prefetching of QuerySet._fetch_all().
+            records = list(chunk_qs._iterable_class(chunk_qs))
+            yield from records
+            if len(records) < size:
+                break
+
+            offset = 0
+            keyset = get_keyset_values(records[-1], ordering)
+            if remaining is not None:
+                remaining -= size
+
     @property
     def number_returned(self) -> int:
         """Tell how many objects the iterator processed"""
@@ -146,8 +378,79 @@ class ChunkedQuerySetIterator(Iterable[M]):
             raise RuntimeError("Can't read number of returned results during iteration")
         return self._number_returned
 
+    @property
+    def last_item(self) -> M | None:
+        """Tell which object was returned last (e.g. to continue the next page from)."""
+        return self._last_item
+
+    @property
+    def cache_sizes(self) -> dict[str, int]:
+        """Tell the current size of the prefetch cache for each relation."""
+        return {
+            lookup: cache.get_size()
+            for caches in (self._fk_caches, self._m2m_caches)
+            for lookup, cache in caches.items()
+        }
+
+    def _add_many_to_many_keys(self, queryset: models.QuerySet) -> models.QuerySet:
+        """Let the main query select the keys of the prefetched many-to-many relations.
+
+        With these keys, the related objects can be restored from the cache in the next chunks.
+        This replaces the ``prefetch_related()`` lookups that :meth:`_restore_many_to_many` handles.
+        """
+        if (
+            not queryset._prefetch_related_lookups
+            or connections[queryset.db].vendor != "postgresql"
+        ):
+            return queryset
+
+        # Imported here, as psycopg is only installed when PostgreSQL is used.
+        from django.contrib.postgres.expressions import ArraySubquery
+
+        lookups = [
+            lookup if isinstance(lookup, models.Prefetch) else models.Prefetch(lookup)
+            for lookup in queryset._prefetch_related_lookups
+        ]
+        nested = {
+            lookup.prefetch_through.split(LOOKUP_SEP, 1)[0]
+            for lookup in lookups
+            if LOOKUP_SEP in lookup.prefetch_through
+        }
+
+        keys = {}
+        other_lookups = []
+        for lookup in lookups:
+            name = lookup.prefetch_through
+            field = _get_many_to_many_field(queryset.model, name)
+            if field is None or lookup.to_attr or name in nested:
+                # Let standard prefetch_related() handle this.
+                other_lookups.append(lookup)
+                continue
+
+            related_qs = lookup.queryset
+            if related_qs is None:
+                related_qs = field.related_model._default_manager.all()
+
+            # The ordering of the subquery is the ordering that the prefetch would have.
+            key_name = f"_prefetch_keys_{name}"
+            keys[key_name] = ArraySubquery(
+                related_qs.filter(**{field.related_query_name(): OuterRef("pk")}).values("pk")
+            )
+            self._m2m_lookups[name] = (key_name, related_qs.order_by())
+
+        if not keys:
+            return queryset
+
+        logger.debug("QuerySet selects the keys of: %r", list(self._m2m_lookups))
+        return queryset.annotate(**keys).prefetch_related(None).prefetch_related(*other_lookups)
+
     def _add_prefetches(self, instances: list[M]):
         """Merge the prefetched objects for this batch with the model instances."""
+        if self._m2m_lookups:
+            self._restore_many_to_many(instances)
+            if not self.queryset._prefetch_related_lookups:
+                return
+
         if self._fk_caches:
             # Make sure prefetch_related_objects() doesn't have
             # to fetch items again that infrequently changes.
@@ -170,6 +473,55 @@ class ChunkedQuerySetIterator(Iterable[M]):
                     cache = self._fk_caches[lookup]
                     cache[obj.pk] = obj
 
+    def _restore_many_to_many(self, instances: list[M]):
+        """Assign the many-to-many objects, only fetching the objects that are not cached."""
+        for name, (key_name, related_qs) in self._m2m_lookups.items():
+            logger.debug("Restoring prefetches for '%s'", name)
+            cache = self._m2m_caches[name]
+            found, missing = self._find_cached_objects(instances, key_name, cache)
+
+            if cache:
+                # Like the foreign keys, the statistics start after the first prefetch.
+                hits = len(found)
+                misses = len(missing)
+                self.cache_hits += hits
+                self.cache_misses += misses
+                self._resize_cache(name, cache, hits, misses)
+
+            if missing:
+                logger.debug(
+                    "Perform additional prefetches for %d '%s' objects", len(missing), name
+                )
+                for obj in related_qs.filter(pk__in=sorted(missing)):
+                    found[obj.pk] = cache[obj.pk] = obj
+
+            for instance in instances:
+                # The same way prefetch_related_objects() stores the results.
+                manager = getattr(instance, name)
+                qs = manager.get_queryset()
+                qs._result_cache = [found[pk] for pk in getattr(instance, key_name) if pk in found]
+                qs._prefetch_done = True
+                if not hasattr(instance, "_prefetched_objects_cache"):
+                    instance._prefetched_objects_cache = {}
+                instance._prefetched_objects_cache[manager.prefetch_cache_name] = qs
+
+    def _find_cached_objects(self, instances: list[M], key_name: str, cache) -> tuple[dict, set]:
+        """Tell which of the selected many-to-many keys are found in the cache."""
+        found = {}
+        missing = set()
+        for instance in instances:
+            for pk in getattr(instance, key_name):
+                if pk in found or pk in missing:
+                    continue
+
+                obj = cache.get(pk, None)
+                if obj is not None:
+                    found[pk] = obj
+                else:
+                    missing.add(pk)
+
+        return found, missing
+
     def _restore_caches(self, instances) -> bool:
         """Restore prefetched data to the new set of instances.
         This avoids unneeded prefetching of the same ForeignKey relation.
@@ -193,6 +545,7 @@ class ChunkedQuerySetIterator(Iterable[M]):
                 continue
 
             logger.debug("Restoring prefetches for '%s'", lookup)
+            hits = misses = 0
             for instance in instances:
                 id_value = getattr(instance, field.attname)
                 if id_value is None:
@@ -201,7 +554,59 @@ class ChunkedQuerySetIterator(Iterable[M]):
                 obj = cache.get(id_value, None)
                 if obj is not None:
                     instance._state.fields_cache[lookup] = obj
+                    hits += 1
                 else:
                     all_restored = False
+                    misses += 1
+
+            self.cache_hits += hits
+            self.cache_misses += misses
+            self._resize_cache(lookup, cache, hits, misses)
 
         return all_restored
+
+    def _resize_cache(self, lookup: str, cache: LRU, hits: int, misses: int):
+        """Adapt the cache size to its hit ratio in the last chunk."""
+        if not (hits + misses):
+            return
+
+        hit_ratio = hits / (hits + misses)
+        min_size, max_size = self.cache_size_range
+        size = cache.get_size()
+        if hit_ratio >= self.cache_grow_ratio:
+            # Records are frequently reused, allow keeping more of them.
+            new_size = min(size * 2, max_size)
+        elif hit_ratio <= self.cache_shrink_ratio:
+            # Records are unique, the cache only takes memory.
+            new_size = max(size // 2, min_size)
+        else:
+            return
+
+        if new_size != size:
+            logger.debug(
+                "Resizing prefetch cache for '%s' to %d items (hit ratio %.2f)",
+                lookup,
+                new_size,
+                hit_ratio,
+            )
+            # Shrinking drops the least recently used items.
+            cache.set_size(new_size)
+
+
+def _get_many_to_many_field(model: type[models.Model], name: str) -> models.ManyToManyField | None:
+    """Find the many-to-many field which related objects can be cached by their primary key."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+    if (
+        not field.many_to_many
+        or not field.concrete  # reverse relations are not handled
+        or (field.remote_field.related_name or "").endswith("+")  # no query name to filter on
+    ):
+        return None
+
+    # The keys are selected by the primary key of the model.
+    through_field = field.remote_field.through._meta.get_field(field.m2m_field_name())
+    return field if through_field.target_field.primary_key else None
@@ -8,14 +8,25 @@ from __future__ import annotations
 
 import math
 import typing
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import timezone
-from functools import cached_property
+from functools import cached_property, partial
 
-from django.db import models
+from django.db import connections, models, transaction
 from django.utils.timezone import now
 
 from gisserver import conf
+from gisserver.cache import get_cached_count
+from gisserver.db import (
+    add_keyset_annotations,
+    get_estimated_count,
+    get_keyset_filter,
+    get_keyset_ordering,
+    get_keyset_values,
+    run_concurrently,
+)
 from gisserver.exceptions import wrap_filter_errors
 from gisserver.features import FeatureType
 
@@ -43,12 +54,24 @@ class SimpleFeatureCollection:
         start: int,
         stop: int,
         number_matched: int | None = CALCULATE,
+        keyset: list | None = None,
     ):
+        """
+        :param source_query: The query that generated this output.
+        :param feature_types: The feature types of this collection.
+        :param queryset: The unpaginated queryset.
+        :param start: The first item to return (``STARTINDEX``).
+        :param stop: The last item to return (``STARTINDEX + COUNT``).
+        :param number_matched: The known number of matches (for ``resultType=hits``).
+        :param keyset: The sort values of the last feature of the previous page (``CURSOR``),
+            to read the page with keyset pagination instead of an ``OFFSET``.
+        """
         self.source_query = source_query
         self.feature_types = feature_types
         self.queryset = queryset
         self.start = start
         self.stop = stop
+        self.keyset = keyset
         self._number_matched = number_matched
 
         self._result_cache = None
@@ -61,6 +84,10 @@ class SimpleFeatureCollection:
         # Detecting that queryset.none() is provided won't work, as that can be used by IdOperator too.
         self._is_hits_request = number_matched is not None and number_matched != CALCULATE
 
+        # Tell that number_matched was counted with get_bounded_count(), as resultType=hits does.
+        self._is_counted = self._is_hits_request
+        self._count_future = None
+
     def __iter__(self) -> Iterable[models.Model]:
         """Iterate through all results.
 
@@ -99,24 +126,50 @@ class SimpleFeatureCollection:
             return iter([])
         else:
             if self._use_sentinel_record:
-                model_iter = self._paginated_queryset(add_sentinel=True).iterator()
+                model_iter = self._model_iterator(self._paginated_queryset(add_sentinel=True))
                 self._result_iterator = CountingIterator(
                     model_iter, max_results=(self.stop - self.start)
                 )
             else:
-                model_iter = self._paginated_queryset().iterator()
+                # Counting happens separately, there is no need to read the sentinel row.
+                model_iter = self._model_iterator(self._paginated_queryset(add_sentinel=False))
                 self._result_iterator = CountingIterator(model_iter)
             return iter(self._result_iterator)
 
+    def _model_iterator(self, queryset: models.QuerySet) -> Iterable[models.Model]:
+        """Stream the results of the queryset."""
+        if conf.GISSERVER_DB_READ_AHEAD:
+            # Let a background thread fetch the next chunk while the current one is rendered.
+            return ChunkedQuerySetIterator(queryset, read_ahead=True)
+        elif connections[queryset.db].settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"):
+            # Avoid reading all results into memory, the chunked iterator uses keyset pagination.
+            return ChunkedQuerySetIterator(queryset)
+        else:
+            return queryset.iterator()
+
     def _chunked_iterator(self):
         """Generate an interator that processes results in chunks."""
         # Private function so the same logic of .iterator() is not repeated.
-        self._result_iterator = ChunkedQuerySetIterator(self._paginated_queryset())
+        if self._use_sentinel_record:
+            self._result_iterator = CountingIterator(
+                ChunkedQuerySetIterator(
+                    self._paginated_queryset(add_sentinel=True),
+                    read_ahead=conf.GISSERVER_DB_READ_AHEAD,
+                ),
+                max_results=(self.stop - self.start),
+            )
+        else:
+            self._result_iterator = ChunkedQuerySetIterator(
+                self._paginated_queryset(add_sentinel=False),
+                read_ahead=conf.GISSERVER_DB_READ_AHEAD,
+            )
         return iter(self._result_iterator)
 
     def _paginated_queryset(self, add_sentinel=True) -> models.QuerySet:
         """Apply the pagination to the queryset."""
-        if self.stop == math.inf:
+        if self.keyset_ordering is not None:
+            return self._keyset_queryset(add_sentinel=add_sentinel)
+        elif self.stop == math.inf:
             # Infinite page requested
             if self.start:
                 return self.queryset[self.start :]
@@ -125,6 +178,53 @@ class SimpleFeatureCollection:
         else:
             return self.queryset[self.start : self.stop + (1 if add_sentinel else 0)]
 
+    def _keyset_queryset(self, add_sentinel=True) -> models.QuerySet:
+        """Apply keyset pagination to the queryset.
+        The ordering is made deterministic, and the sort values are selected,
+        so the next page can continue with ``WHERE (sortkey, pk) > (...)`` instead of an OFFSET.
+        """
+        ordering = self.keyset_ordering
+        queryset = add_keyset_annotations(self.queryset.order_by(*ordering), ordering)
+        start = self.start
+        if self.keyset is not None:
+            # Continue after the last feature of the previous page.
+            queryset = queryset.filter(get_keyset_filter(ordering, self.keyset))
+            start = 0
+
+        page_size = self.stop - self.start
+        return queryset[start : start + page_size + (1 if add_sentinel else 0)]
+
+    @cached_property
+    def keyset_ordering(self) -> list[str] | None:
+        """The deterministic ordering that keyset pagination uses.
+        This is ``None`` when keyset pagination is disabled, or can't be used for this query.
+        """
+        if not conf.GISSERVER_KEYSET_PAGINATION or self._is_hits_request or self.stop == math.inf:
+            return None
+        return get_keyset_ordering(self.queryset)
+
+    @property
+    def next_keyset(self) -> list | None:
+        """The sort values of the last returned feature, to start the next page from."""
+        if self.keyset_ordering is None:
+            return None
+        elif self._result_cache:
+            last = self._result_cache[-1]
+        elif self._result_iterator is not None:
+            last = self._result_iterator.last_item
+        else:
+            return None  # output format executed the query itself.
+
+        return None if last is None else get_keyset_values(last, self.keyset_ordering)
+
+    def get_paginated_queryset(self) -> models.QuerySet:
+        """Return the queryset of the requested page.
+        This is used by output formats that execute the query themselves.
+        """
+        if self._is_hits_request:
+            return self.queryset.none()
+        return self._paginated_queryset(add_sentinel=False)
+
     def first(self):
         with wrap_filter_errors(self.source_query):
             try:
@@ -148,16 +248,12 @@ class SimpleFeatureCollection:
             # since QuerySet.iterator() is avoided.
             if self.stop == math.inf:
                 # Infinite page requested, see if start is still requested
-                qs = self.queryset[self.start :] if self.start else self.queryset.all()
-
                 with wrap_filter_errors(self.source_query):
-                    self._result_cache = list(qs)
+                    self._result_cache = list(self._paginated_queryset())
             elif self._use_sentinel_record:
                 # No counting, but instead fetch an extra item as sentinel to see if there are more results.
-                qs = self.queryset[self.start : self.stop + 1]
-
                 with wrap_filter_errors(self.source_query):
-                    page_results = list(qs)
+                    page_results = list(self._paginated_queryset(add_sentinel=True))
 
                 # The stop + 1 sentinel allows checking if there is a next page.
                 # This means no COUNT() is needed to detect that.
@@ -171,18 +267,18 @@ class SimpleFeatureCollection:
             else:
                 # Fetch exactly the page size, no more is needed.
                 # Will use a COUNT on the total table, so it can be used to see if there are more pages.
-                qs = self.queryset[self.start : self.stop]
-
                 with wrap_filter_errors(self.source_query):
-                    self._result_cache = list(qs)
+                    self._result_cache = list(self._paginated_queryset(add_sentinel=False))
 
     @cached_property
     def _use_sentinel_record(self) -> bool:
         """Tell whether a sentinel record should be included in the result set.
         This is used to determine whether there are more results, without having to perform a COUNT query
         """
-        return conf.GISSERVER_COUNT_NUMBER_MATCHED == 0 or (
-            conf.GISSERVER_COUNT_NUMBER_MATCHED == 2 and self.start
+        return (
+            conf.GISSERVER_COUNT_NUMBER_MATCHED in (0, 3)
+            or (conf.GISSERVER_COUNT_NUMBER_MATCHED == 2 and self.start)
+            or bool(conf.GISSERVER_COUNT_NUMBER_MATCHED_LIMIT)
         )
 
     @cached_property
@@ -196,13 +292,37 @@ class SimpleFeatureCollection:
         else:
             # Count by fetching all data. Otherwise, the results are queried twice.
             # For GML/XML, it's not possible the stream the queryset results
-            # as the first tag needs to describe the number of results.
+            # as the first tag needs to describe the number of results
+            # (unless the renderer spools the output, see GISSERVER_GML_SPOOLED_OUTPUT).
             self.fetch_results()
             return len(self._result_cache)
 
     @property
-    def number_matched(self) -> int:
-        """Return the total number of matches across all pages."""
+    def number_matched(self) -> int | None:
+        """Return the total number of matches across all pages.
+        This is ``None`` when the count exceeded ``GISSERVER_COUNT_NUMBER_MATCHED_LIMIT``.
+        """
+        number_matched = self._get_number_matched()
+        return None if self._is_count_limited(number_matched) else number_matched
+
+    @property
+    def number_matched_lower_bound(self) -> int | None:
+        """Tell the minimum number of matches, when the count exceeded the limit.
+        Note this only returns a value after :attr:`number_matched` was read.
+        """
+        if self._number_matched in (None, CALCULATE) or not self._is_count_limited(
+            self._get_number_matched()
+        ):
+            return None
+        return conf.GISSERVER_COUNT_NUMBER_MATCHED_LIMIT
+
+    def _is_count_limited(self, number_matched: int) -> bool:
+        """Tell whether counting stopped at the limit of ``GISSERVER_COUNT_NUMBER_MATCHED_LIMIT``."""
+        limit = conf.GISSERVER_COUNT_NUMBER_MATCHED_LIMIT
+        return bool(limit) and self._is_counted and number_matched > limit
+
+    def _get_number_matched(self) -> int:
+        """Calculate the number of matches, which may be limited."""
         if self._is_hits_request:
             if self.stop:
                 # resulttype=hits&COUNT=n should minimize how many are "matched".
@@ -216,8 +336,32 @@ class SimpleFeatureCollection:
         if self._is_surely_last_page:
             # For resulttype=results, an expensive COUNT query can be avoided
             # when this is the first and only page or the last page.
+            if self._count_future is not None:
+                self._count_future.cancel()  # skips the COUNT when it didn't start yet.
             return self.start + self.number_returned
 
+        if self._count_future is not None and not self._count_future.cancelled():
+            # Counted in a background thread, see FeatureCollection.concurrent_count()
+            self._number_matched = self._count_future.result()
+            self._is_counted = True
+            return self._number_matched
+
+        # Calculate, cache and return
+        qs = self._get_count_queryset()
+        with wrap_filter_errors(self.source_query):
+            if conf.GISSERVER_COUNT_NUMBER_MATCHED == 3:
+                # Estimate, but never report fewer results than this page already has.
+                estimate = get_estimated_count(
+                    qs, exact_below=conf.GISSERVER_COUNT_ESTIMATE_THRESHOLD
+                )
+                self._number_matched = max(estimate, self.start + self.number_returned)
+            else:
+                self._number_matched = self._count()
+                self._is_counted = True
+        return self._number_matched
+
+    def _get_count_queryset(self) -> models.QuerySet:
+        """Tell which queryset to count the number of matches with."""
         qs = self.queryset
         clean_annotations = {
             # HACK: remove database optimizations from output renderer.
@@ -229,11 +373,57 @@ class SimpleFeatureCollection:
         if clean_annotations != qs.query.annotations:
             qs = self.queryset.all()  # make a clone to allow editing
             qs.query.annotations = clean_annotations
+        return qs
+
+    def _count(self, calculate=True) -> int | None:
+        """Perform the COUNT query.
+        With ``calculate=False``, only a cached count is returned (or ``None``).
+        """
+        return get_cached_count(
+            self._get_count_queryset(),
+            self.feature_types,
+            limit=conf.GISSERVER_COUNT_NUMBER_MATCHED_LIMIT,
+            calculate=calculate,
+        )
+
+    def _count_in_snapshot(self, snapshot_id: str) -> int:
+        """Perform the COUNT query in a background thread, using the snapshot of the main connection.
+        As database connections are thread-local in Django, this uses a separate connection.
+        """
+        using = self.queryset.db
+        try:
+            with wrap_filter_errors(self.source_query), transaction.atomic(using=using):
+                with connections[using].cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+                return self._count()
+        finally:
+            connections[using].close()
+
+    def _needs_count(self) -> bool:
+        """Tell whether an exact COUNT query is likely needed for :attr:`number_matched`.
+        A count that is found in the cache is applied directly.
+        """
+        if (
+            self._is_hits_request
+            or self._number_matched != CALCULATE
+            or self.stop == math.inf
+            or not (
+                conf.GISSERVER_COUNT_NUMBER_MATCHED == 1
+                or (conf.GISSERVER_COUNT_NUMBER_MATCHED == 2 and not self.start)
+            )
+        ):
+            return False
+        elif self._result_cache is not None and self._is_surely_last_page:
+            return False  # The page was already read, and has fewer results than requested.
 
-        # Calculate, cache and return
         with wrap_filter_errors(self.source_query):
-            self._number_matched = qs.count()
-        return self._number_matched
+            count = self._count(calculate=False)
+        if count is not None:
+            self._number_matched = count
+            self._is_counted = True
+            return False
+        return True
 
     @property
     def _is_surely_last_page(self):
@@ -270,6 +460,11 @@ class SimpleFeatureCollection:
             return False
         elif self._has_more is not None:
             return self._has_more  # did page+1 record check, answer is known.
+        elif (
+            isinstance(self._result_iterator, CountingIterator)
+            and self._result_iterator.has_more is not None
+        ):
+            return self._result_iterator.has_more  # did page+1 record check while streaming.
         elif self._is_surely_last_page:
             return False  # Fewer results than expected, answer is known.
 
@@ -277,7 +472,7 @@ class SimpleFeatureCollection:
             return self.stop <= self._number_matched
         else:
             # This will perform an slow COUNT() query...
-            return self.stop < self.number_matched
+            return self.stop < self._get_number_matched()
 
     @cached_property
     def projection(self) -> FeatureProjection:
@@ -309,16 +504,89 @@ class FeatureCollection:
         """
         self.results = results
         self._number_matched = number_matched
-        self.next = next
+        self._next = next
         self.previous = previous
         self.date = now()
         self.timestamp = self.date.astimezone(timezone.utc).isoformat()
 
+    @property
+    def next(self) -> str | None:
+        """URL of the next page.
+        This can be assigned as callable, as detecting whether there is a next page
+        may execute the query. This allows output formats to read the results first.
+        """
+        if callable(self._next):
+            self._next = self._next()
+        return self._next
+
+    @next.setter
+    def next(self, value: str | Callable[[], str | None] | None):
+        self._next = value
+
     @cached_property
     def number_returned(self) -> int:
         """Return the total number of returned features"""
+        unread = [
+            c
+            for c in self.results
+            if not c._is_hits_request and c._result_cache is None and c._result_iterator is None
+        ]
+        if len(unread) > 1:
+            # Let multiple queries fetch their results in parallel.
+            run_concurrently(
+                [partial(getattr, c, "number_returned") for c in unread],
+                using=[c.queryset.db for c in unread],
+            )
         return sum(c.number_returned for c in self.results)
 
+    @contextmanager
+    def concurrent_count(self):
+        """Perform the COUNT queries in a background thread, while the results are read.
+
+        This is used when ``GISSERVER_CONCURRENT_COUNT`` is enabled. Both database connections
+        use the same ``REPEATABLE READ`` snapshot (via ``pg_export_snapshot()``),
+        so the counts match the data. The results need to be read within this block.
+        """
+        if not conf.GISSERVER_CONCURRENT_COUNT or self._number_matched != CALCULATE:
+            yield  # disabled, or the number of matches is already known.
+            return
+
+        sub_collections = [c for c in self.results if c._needs_count()]
+        using = self.results[0].queryset.db if self.results else None
+        if (
+            not sub_collections
+            or any(c.queryset.db != using for c in self.results)
+            or connections[using].vendor != "postgresql"
+            or connections[using].in_atomic_block
+        ):
+            # Can't change the isolation level when a transaction is already started.
+            yield
+            return
+
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cursor.execute("SELECT pg_export_snapshot()")
+                snapshot_id = cursor.fetchone()[0]
+
+            # The counts run one after another, so a count can still be skipped
+            # when the results of that collection turn out to be a short page.
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gisserver-count")
+            for sub_collection in sub_collections:
+                sub_collection._count_future = executor.submit(
+                    sub_collection._count_in_snapshot, snapshot_id
+                )
+
+            # The snapshot can only be imported while this transaction is still open,
+            # so all counts are finished before the block ends.
+            try:
+                yield
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            else:
+                executor.shutdown(wait=True)
+
     @cached_property
     def number_matched(self) -> int | None:
         """The number of features matched, None means "unknown"."""
@@ -335,11 +603,35 @@ class FeatureCollection:
                 # Most clients don't need this metadata, and thus we avoid a COUNT query.
                 return None
 
-            return sum(c.number_matched for c in self.results)
+            # Multiple queries are counted (and read) in parallel when this is enabled.
+            # Any collection that exceeded GISSERVER_COUNT_NUMBER_MATCHED_LIMIT makes it "unknown".
+            counts = run_concurrently(
+                [partial(getattr, c, "number_matched") for c in self.results],
+                using=[c.queryset.db for c in self.results],
+            )
+            return None if None in counts else sum(counts)
         else:
             # Evaluate any lazy attributes
             return int(self._number_matched)
 
+    @property
+    def number_matched_lower_bound(self) -> int | None:
+        """The minimum number of features matched, when :attr:`number_matched` is "unknown"
+        because counting stopped at the ``GISSERVER_COUNT_NUMBER_MATCHED_LIMIT``.
+        """
+        if self.number_matched is not None:
+            return None
+
+        lower_bounds = [c.number_matched_lower_bound for c in self.results]
+        if all(bound is None for bound in lower_bounds):
+            return None  # unknown for other reasons.
+
+        counts = [
+            c.number_matched if bound is None else bound
+            for c, bound in zip(self.results, lower_bounds, strict=True)
+        ]
+        return None if None in counts else sum(counts)
+
     @property
     def has_next(self) -> bool:
         """Efficient way to see if a next link needs to be written.
@@ -200,6 +200,9 @@ class StandardPresentationParameters(BaseOwsRequest):
     resultType: ResultType = ResultType.results
     startIndex: int = 0
 
+    #: Vendor-specific parameter, holding the keyset pagination position of the next page.
+    cursor: str | None = None
+
     @classmethod
     def base_xml_init_parameters(cls, element: NSElement) -> dict:
         """Parse the XML POST request."""
@@ -221,6 +224,7 @@ class StandardPresentationParameters(BaseOwsRequest):
             outputFormat=kvp.get_str("outputFormat", default="application/gml+xml; version=3.2"),
             resultType=ResultType[kvp.get_str("resultType", default="results").lower()],
             startIndex=kvp.get_int("startIndex", default=0),
+            cursor=kvp.get_str("cursor", default=None),
         )
 
     def as_kvp(self) -> dict:
@@ -234,6 +238,8 @@ class StandardPresentationParameters(BaseOwsRequest):
             params["STARTINDEX"] = self.startIndex
         if self.count is not None:
             params["COUNT"] = self.count
+        if self.cursor:
+            params["CURSOR"] = self.cursor
         return params
 
 
@@ -16,8 +16,11 @@ from collections.abc import Callable
 from dataclasses import dataclass
 from functools import cached_property
 
+from django.db import models
+
 from gisserver.types import (
     GeometryXsdElement,
+    GmlNameElement,
     XPathMatch,
     XsdElement,
     XsdNode,
@@ -27,7 +30,6 @@ from gisserver.types import (
 
 if typing.TYPE_CHECKING:
     from django.contrib.gis.geos import GEOSGeometry
-    from django.db import models
 
     from gisserver.crs import CRS
     from gisserver.features import FeatureType
@@ -40,6 +42,31 @@ __all__ = (
 
 logger = logging.getLogger(__name__)
 
+# Model fields which values can be written by the database without a noticeable difference.
+# Note PostgreSQL formats floats as "5" instead of "5.0", which output formats may need to check.
+_DB_COLUMN_TYPES = {
+    "AutoField",
+    "BigAutoField",
+    "BigIntegerField",
+    "BooleanField",
+    "CharField",
+    "DateField",
+    "DateTimeField",
+    "DecimalField",
+    "FloatField",
+    "ForeignKey",
+    "IntegerField",
+    "OneToOneField",
+    "PositiveBigIntegerField",
+    "PositiveIntegerField",
+    "PositiveSmallIntegerField",
+    "SlugField",
+    "SmallAutoField",
+    "SmallIntegerField",
+    "TextField",
+    "TimeField",
+}
+
 
 class FeatureProjection:
     """Tell which fields to access and render for a single feature.
@@ -211,6 +238,17 @@ class FeatureProjection:
         """Tell whether the <gml:boundedBy> element is included for rendering."""
         return any(e.type is XsdTypes.gmlBoundingShapeType for e in self.xsd_root_elements)
 
+    @cached_property
+    def is_flat(self) -> bool:
+        """Tell whether all root elements are read from database columns of the main model.
+
+        This is the case when no relations are accessed, and none of the elements
+        produce their value in Python (e.g. with a custom ``value_from_object()``).
+        Array fields are included, as these are still a single column.
+        Such projection can be rendered entirely by the database.
+        """
+        return not self.xsd_child_nodes and all(map(_is_db_column, self.xsd_root_elements))
+
     @cached_property
     def main_geometry_element(self) -> GeometryXsdElement | None:
         """Return the field used to describe the geometry of the feature.
@@ -351,6 +389,32 @@ class FeatureRelation:
         return [f for f in self.sub_fields if f.type.is_geometry]
 
 
+def _is_db_column(xsd_element: XsdElement) -> bool:
+    """Tell whether the element value is a database column that can be written as-is."""
+    if xsd_element.type is XsdTypes.gmlBoundingShapeType:
+        return True  # Calculated from the geometry columns.
+
+    field = xsd_element.source
+    if (
+        not isinstance(field, models.Field)
+        or (xsd_element.is_many and not xsd_element.is_array)
+        or xsd_element.is_flattened
+        or xsd_element.type.is_complex_type
+        or field.value_from_object.__func__ is not models.Field.value_from_object
+    ):
+        return False
+
+    if isinstance(xsd_element, GmlNameElement):
+        # Unless a display field is given, str(instance) is used as name.
+        return bool(xsd_element.feature_type and xsd_element.feature_type.display_field_name)
+    elif xsd_element.__class__.get_value is not XsdNode.get_value:
+        return False  # Custom subclass produces the value.
+
+    if xsd_element.is_array:
+        field = field.base_field
+    return xsd_element.type.is_geometry or field.get_internal_type() in _DB_COLUMN_TYPES
+
+
 def _partition(predicate, items: list) -> tuple[list, set]:
     """Semi-efficient way to split a list into items that match/don't match the condition."""
     # more_itertools.partition() is faster, but that can be neglected with a short list.
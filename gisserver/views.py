@@ -2,13 +2,17 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import re
+from datetime import datetime
 from urllib.parse import unquote_plus, urlencode
 
 from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
 from django.core.exceptions import PermissionDenied as Django_PermissionDenied
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date, quote_etag
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
@@ -309,7 +313,63 @@ class OWSView(View):
 
         wfs_operation = wfs_operation_cls(self, self.ows_request)
         wfs_operation.validate_request(self.ows_request)
-        return wfs_operation.process_request(self.ows_request)
+
+        # Let clients revalidate their cached copy, before any query is constructed.
+        conditional_headers = self.get_conditional_headers(wfs_operation)
+        if conditional_headers:
+            last_modified = conditional_headers.get("Last-Modified")
+            response = get_conditional_response(
+                self.request,
+                etag=conditional_headers["ETag"],
+                last_modified=parse_http_date(last_modified) if last_modified else None,
+            )
+            if response is not None:
+                response.headers.update(conditional_headers)
+                return response
+
+        response = wfs_operation.process_request(self.ows_request)
+        for name, value in conditional_headers.items():
+            response.headers.setdefault(name, value)
+        return response
+
+    def get_conditional_headers(self, wfs_operation: base.WFSOperation) -> dict[str, str]:
+        """Generate the ``ETag`` and ``Last-Modified`` headers for the request.
+
+        This only happens for GET requests, when the operation and all its
+        feature types provide a data version (see :meth:`FeatureType.get_data_version()
+        <gisserver.features.FeatureType.get_data_version>`).
+        """
+        if self.request.method not in ("GET", "HEAD"):
+            return {}
+
+        data_versions = wfs_operation.get_data_versions()
+        if data_versions is None:
+            return {}
+
+        fingerprint = repr((self.get_request_fingerprint(), data_versions))
+        headers = {"ETag": quote_etag(hashlib.sha256(fingerprint.encode()).hexdigest())}
+
+        # When all versions are timestamps, the latest is also the "Last-Modified" value.
+        if all(isinstance(version, datetime) for name, version in data_versions):
+            last_modified = max(version for name, version in data_versions)
+            headers["Last-Modified"] = http_date(last_modified.timestamp())
+        return headers
+
+    def get_request_fingerprint(self) -> tuple:
+        """Give a normalized representation of the request, that is part of the ``ETag``.
+
+        This can be overwritten to include more information, for example the user
+        when the querysets return different results per user.
+        """
+        # Parameters are case-insensitive, and their order doesn't matter.
+        params = sorted((key.upper(), values) for key, values in self.request.GET.lists())
+        # The response of a different Content-Encoding needs a different ETag
+        accept_encoding = (
+            self.request.headers.get("Accept-Encoding")
+            if conf.GISSERVER_COMPRESS_STREAMING
+            else None
+        )
+        return (self.request.path, params, accept_encoding)
 
     def get_service_description(self, service: str | None = None) -> ServiceDescription:
         """Provide the (dynamically generated) service description."""
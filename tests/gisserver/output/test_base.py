@@ -1,7 +1,10 @@
+from io import BytesIO
+
 import pytest
 from django.core.exceptions import ImproperlyConfigured
 
-from gisserver.output.base import to_qname
+from gisserver.output import base
+from gisserver.output.base import ChunkStats, CollectionOutputRenderer, to_qname
 
 
 def test_to_qname():
@@ -11,3 +14,88 @@ def test_to_qname():
 
     with pytest.raises(ImproperlyConfigured):
         assert to_qname("http://example.com/foo", "test", {"http://example.org": "ns0"})
+
+
+class FlushTestRenderer(CollectionOutputRenderer):
+    chunk_size = 100
+    chunk_max_delay = 1.0
+    chunk_size_range = (10, 1000)
+
+    def apply_projection(self):
+        pass  # no collection to render
+
+
+def test_chunk_stats():
+    """Prove that the chunk statistics are recorded."""
+    stats = ChunkStats()
+    stats.add(50)
+    stats.add(10)
+    stats.add(30)
+    assert stats == ChunkStats(count=3, total_size=90, min_size=10, max_size=50)
+
+
+def test_flush_policy(monkeypatch):
+    """Prove that output is flushed by size or delay, and that the chunk size is tuned."""
+    now = 1000.0
+    monkeypatch.setattr(base.time, "monotonic", lambda: now)
+    renderer = FlushTestRenderer(operation=None, collection=None)
+    output = BytesIO()
+    assert not renderer.is_flush_needed(output)
+
+    # The time to execute the query is not measured, only the time since the first row.
+    now += 5.0
+    output.write(b"x" * 10)
+    assert not renderer.is_flush_needed(output)
+
+    # Flush by size, at 1000 chars per second the target is 100 chars per 0.1 sec.
+    output.write(b"x" * 115)
+    now += 0.125
+    assert renderer.is_flush_needed(output)
+    assert renderer.flush_output(output) == b"x" * 125
+    assert output.tell() == 0
+    assert renderer._flush_size == 100
+
+    # Flush by time, which also reduces the chunk size for slow output.
+    output.write(b"x" * 10)
+    assert not renderer.is_flush_needed(output)
+    now += renderer.chunk_max_delay
+    assert renderer.is_flush_needed(output)
+    renderer.flush_output(output)
+    assert renderer._flush_size == 50
+    assert renderer.chunk_stats == ChunkStats(count=2, total_size=135, min_size=10, max_size=125)
+
+
+def test_flush_settings(settings):
+    """Prove that the chunk settings are used, unless the renderer class defines these."""
+    settings.GISSERVER_CHUNK_SIZE = 500
+    settings.GISSERVER_CHUNK_MAX_DELAY = 2.0
+    settings.GISSERVER_CHUNK_ADAPTIVE = False
+    renderer = FlushTestRenderer(operation=None, collection=None)
+    assert renderer._flush_size == 100
+    assert renderer._max_delay == 1.0
+    assert not renderer._adaptive
+
+    class DefaultsRenderer(FlushTestRenderer):
+        chunk_size = None
+        chunk_max_delay = None
+
+    renderer = DefaultsRenderer(operation=None, collection=None)
+    assert renderer._flush_size == 500
+    assert renderer._max_delay == 2.0
+
+
+def test_flush_timer(monkeypatch):
+    """Prove that flushes before the timer is started don't tune the chunk size."""
+    now = 1000.0
+    monkeypatch.setattr(base.time, "monotonic", lambda: now)
+    renderer = FlushTestRenderer(operation=None, collection=None)
+
+    # e.g. the spooled GML output sends its header after reading all results.
+    now += 5.0
+    renderer.record_flush(100)
+    assert renderer._flush_size == 100
+
+    renderer.start_flush_timer()
+    now += 0.125
+    renderer.record_flush(250)
+    assert renderer._flush_size == 150
@@ -0,0 +1,36 @@
+import pytest
+from django.contrib.gis.geos import LinearRing, LineString
+
+from gisserver.output import gml32
+from gisserver.output.gml32 import render_pos_list
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "struct"])
+def use_numpy(request, monkeypatch):
+    """Test both the vectorized and pure-Python decoding."""
+    if request.param:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(gml32, "numpy", False)
+    return request.param
+
+
+@pytest.mark.usefixtures("use_numpy")
+class TestRenderPosList:
+    def test_line_string(self):
+        """Prove that the WKB decoding gives the same output as value.tuple."""
+        value = LineString((4.908, 52.363), (4.909, 52.364), (4.9105, 52.3655))
+        assert render_pos_list(value, 2) == "4.908 52.363 4.909 52.364 4.9105 52.3655"
+
+    def test_linear_ring_swap_xy(self):
+        """Prove that the axis can be swapped while writing."""
+        value = LinearRing((0, 1), (2, 3), (4, 5), (0, 1))
+        assert render_pos_list(value, 2, swap_xy=True) == "1.0 0.0 3.0 2.0 5.0 4.0 1.0 0.0"
+
+    def test_3d_swap_xy(self):
+        """Prove that the z-coordinate is kept in place."""
+        value = LineString((1, 2, 3), (4, 5, 6))
+        assert render_pos_list(value, 3, swap_xy=True) == "2.0 1.0 3.0 5.0 4.0 6.0"
+
+    def test_empty(self):
+        assert render_pos_list(LineString(), 2) == ""
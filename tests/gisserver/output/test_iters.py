@@ -1,8 +1,18 @@
+import calendar
+import threading
+
 import django
 import pytest
+from django.db import connection
 from django.db.models import Prefetch
+from django.db.models.functions import Length
 
-from gisserver.output.iters import ChunkedQuerySetIterator, CountingIterator
+from gisserver.output.iters import (
+    ChunkedQuerySetIterator,
+    CountingIterator,
+    FeatureRowIterable,
+    ReadAheadIterator,
+)
 from tests.test_gisserver.models import City, OpeningHour, Restaurant, RestaurantReview
 from tests.utils import get_sql
 
@@ -72,12 +82,16 @@ class TestChunkedQuerySetIterator:
             "Perform additional prefetches for 2 objects",
             "Creating cache for prefetches of 'city'",
             "Restoring prefetches for 'city'",
+            "Resizing prefetch cache for 'city' to 2 items (hit ratio 1.00)",
             "Restored all prefetches from cache",  # Bingo!!
             "Restoring prefetches for 'city'",
+            "Resizing prefetch cache for 'city' to 1 items (hit ratio 0.00)",
             "Perform additional prefetches for 2 objects",  # city2
             "Restoring prefetches for 'city'",
             "Restored all prefetches from cache",  # None to restore.
         ]
+        assert it.cache_hits == 2
+        assert it.cache_misses == 2
         sql = get_sql(queries)
         assert sql == [
             (
@@ -185,3 +199,221 @@ class TestChunkedQuerySetIterator:
                 f'ORDER BY "test_gisserver_restaurant"."id" ASC'
             ),
         ]
+
+    def test_many_to_many(self, django_assert_num_queries, caplog):
+        """Prove that many-to-many objects are restored from cache in the next chunk."""
+        weekend = OpeningHour.objects.bulk_create(
+            [OpeningHour(weekday=calendar.SATURDAY), OpeningHour(weekday=calendar.SUNDAY)]
+        )
+        monday = OpeningHour.objects.create(weekday=calendar.MONDAY)
+        restaurants = Restaurant.objects.bulk_create(
+            [Restaurant(name=f"Restaurant {i}") for i in range(5)]
+        )
+        for restaurant in restaurants[:4]:
+            restaurant.opening_hours.set(weekend)
+        restaurants[4].opening_hours.set([monday, *weekend])
+
+        qs = (
+            Restaurant.objects.only("id", "name")
+            .prefetch_related(
+                Prefetch("opening_hours", queryset=OpeningHour.objects.only("id", "weekday"))
+            )
+            .order_by("name")
+        )
+        it = ChunkedQuerySetIterator(qs, chunk_size=2, cache_size=2)
+
+        # Without the cache, each of the 3 chunks would perform a prefetch query.
+        with django_assert_num_queries(3) as queries:
+            restaurants = list(it)
+
+        assert caplog.messages == [
+            "QuerySet selects the keys of: ['opening_hours']",
+            "Restoring prefetches for 'opening_hours'",
+            "Creating cache for prefetches of 'opening_hours'",
+            "Perform additional prefetches for 2 'opening_hours' objects",
+            "Restoring prefetches for 'opening_hours'",  # Bingo!!
+            "Resizing prefetch cache for 'opening_hours' to 4 items (hit ratio 1.00)",
+            "Restoring prefetches for 'opening_hours'",
+            "Perform additional prefetches for 1 'opening_hours' objects",  # monday
+        ]
+        assert it.cache_hits == 4
+        assert it.cache_misses == 1
+        sql = get_sql(queries)
+        assert f'"test_gisserver_openinghour"."id" IN ({monday.id})' in sql[2]
+
+        # Compare this with the original results from the ORM, including the ordering.
+        plain_django_restaurants = list(qs)
+        with django_assert_num_queries(0):
+            for original, retrieved in zip(plain_django_restaurants, restaurants):
+                assert [o.weekday for o in retrieved.opening_hours.all()] == [
+                    o.weekday for o in original.opening_hours.all()
+                ]
+
+    def test_foreign_key_cache_resize(self, django_assert_num_queries, caplog):
+        """Prove that the foreign key cache adapts its size to the hit ratio of each chunk."""
+        original_restaurants = Restaurant.objects.bulk_create(
+            [Restaurant(name=f"Restaurant {i}") for i in range(2)]
+        )
+        RestaurantReview.objects.bulk_create(
+            [
+                RestaurantReview(restaurant=restaurant, review=f"Yum {x}")
+                for restaurant in original_restaurants
+                for x in range(4)
+            ]
+        )
+
+        with django_assert_num_queries(0):
+            qs = (
+                RestaurantReview.objects.only("id", "review", "restaurant")
+                .prefetch_related(
+                    Prefetch("restaurant", queryset=Restaurant.objects.only("id", "name"))
+                )
+                .order_by("restaurant_id", "review")
+            )
+            it = ChunkedQuerySetIterator(qs, chunk_size=2)
+
+        with django_assert_num_queries(3):  # 1 for main object, 1 prefetch per restaurant
+            reviews = list(it)
+
+        assert caplog.messages == [
+            "Perform additional prefetches for 2 objects",
+            "Creating cache for prefetches of 'restaurant'",
+            "Restoring prefetches for 'restaurant'",
+            "Resizing prefetch cache for 'restaurant' to 2 items (hit ratio 1.00)",
+            "Restored all prefetches from cache",
+            "Restoring prefetches for 'restaurant'",
+            "Resizing prefetch cache for 'restaurant' to 1 items (hit ratio 0.00)",
+            "Perform additional prefetches for 2 objects",  # next restaurant
+            "Restoring prefetches for 'restaurant'",
+            "Resizing prefetch cache for 'restaurant' to 2 items (hit ratio 1.00)",
+            "Restored all prefetches from cache",
+        ]
+        assert it.cache_hits == 4
+        assert it.cache_misses == 2
+        assert it.cache_sizes == {"restaurant": 2}
+
+        with django_assert_num_queries(0):
+            assert len(reviews) == 8
+            for review in reviews:
+                assert review.restaurant.pk == review.restaurant_id
+
+    @pytest.mark.django_db(transaction=True)
+    def test_read_ahead(self, django_assert_num_queries):
+        """Prove that reading chunks in a background thread gives the same results."""
+        original_restaurants = Restaurant.objects.bulk_create(
+            [Restaurant(name=f"Restaurant {i}") for i in range(5)]
+        )
+        RestaurantReview.objects.bulk_create(
+            [
+                RestaurantReview(restaurant=restaurant, review="Yum")
+                for restaurant in original_restaurants
+            ]
+        )
+
+        qs = Restaurant.objects.only("id", "name").prefetch_related("reviews").order_by("name")
+        it = ChunkedQuerySetIterator(qs, chunk_size=2, read_ahead=True)
+        with django_assert_num_queries(0):  # all queries happen on the connection of the thread
+            restaurants = list(it)
+
+        assert it.number_returned == 5
+        assert [r.name for r in restaurants] == [r.name for r in original_restaurants]
+        with django_assert_num_queries(0):
+            assert all(len(r.reviews.all()) == 1 for r in restaurants)
+
+    def test_read_ahead_transaction(self, django_assert_num_queries):
+        """Prove that results are not read ahead inside a transaction,
+        as the connection of the thread can't see the uncommitted data."""
+        Restaurant.objects.bulk_create([Restaurant(name=f"Restaurant {i}") for i in range(5)])
+
+        qs = Restaurant.objects.only("id", "name").order_by("name")
+        it = ChunkedQuerySetIterator(qs, chunk_size=2, read_ahead=True)
+        with django_assert_num_queries(1):
+            restaurants = list(it)
+
+        assert len(restaurants) == 5
+
+    def test_keyset_chunks(self, monkeypatch, django_assert_num_queries):
+        """Prove that keyset pagination is used to read chunks when server-side cursors are disabled."""
+        monkeypatch.setitem(connection.settings_dict, "DISABLE_SERVER_SIDE_CURSORS", True)
+        Restaurant.objects.bulk_create(
+            [Restaurant(name=name) for name in ["A", "B", "B", "B", "C", "D", "E"]]
+        )
+        expected = list(Restaurant.objects.order_by("-name", "pk")[1:6])
+
+        qs = Restaurant.objects.only("id", "name").order_by("-name")[1:6]
+        it = ChunkedQuerySetIterator(qs, sql_chunk_size=2)
+        with django_assert_num_queries(3) as captured:
+            restaurants = list(it)
+
+        assert restaurants == expected
+        assert it.number_returned == 5
+        sql = [query["sql"] for query in captured.captured_queries]
+        assert "OFFSET 1" in sql[0]
+        assert "OFFSET" not in sql[1]
+        assert "LIMIT 1" in sql[2]
+
+
+@pytest.mark.django_db
+class TestReadAheadIterator:
+    """Prove that the background thread is properly managed."""
+
+    def test_chunks(self):
+        """Prove that all chunks are returned in order."""
+        chunks = (list(range(i, i + 3)) for i in range(0, 30, 3))
+        assert list(ReadAheadIterator(chunks, using="default")) == [
+            list(range(i, i + 3)) for i in range(0, 30, 3)
+        ]
+
+    def test_error(self):
+        """Prove that errors in the thread are raised in the consumer."""
+
+        def _chunks():
+            yield [1]
+            raise ValueError("failed reading")
+
+        with pytest.raises(ValueError, match="failed reading"):
+            list(ReadAheadIterator(_chunks(), using="default"))
+
+    def test_stop_early(self):
+        """Prove that the thread stops and closes the generator when the consumer stops."""
+        closed = threading.Event()
+
+        def _chunks():
+            try:
+                for i in range(1000):
+                    yield [i]
+            finally:
+                closed.set()
+
+        it = iter(ReadAheadIterator(_chunks(), using="default"))
+        assert next(it) == [0]
+        it.close()
+        assert closed.is_set()
+
+
+@pytest.mark.django_db
+class TestFeatureRowIterable:
+    """Prove that rows can be read like model instances."""
+
+    def test_rows(self, restaurant, django_assert_num_queries):
+        """Prove that the selected fields and annotations are available by name."""
+        qs = Restaurant.objects.only("id", "name", "city", "tags").annotate(
+            _as_name_length=Length("name")
+        )
+        qs._iterable_class = FeatureRowIterable
+
+        with django_assert_num_queries(1):
+            rows = list(qs)
+
+        row = rows[0]
+        assert not isinstance(row, Restaurant)
+        assert row.pk == row.id == restaurant.pk
+        assert row.name == "Café Noir"
+        assert row.city_id == restaurant.city_id
+        assert row.tags == ["cafe", "black"]
+        assert row._as_name_length == 9
+        assert row._meta is Restaurant._meta
+
+        # Deferred fields are not loaded
+        with pytest.raises(AttributeError):
+            _ = row.rating
@@ -0,0 +1,48 @@
+import pytest
+
+from gisserver import conf
+from gisserver.output.results import SimpleFeatureCollection
+from tests.test_gisserver.models import Restaurant
+
+
+@pytest.mark.django_db
+class TestSimpleFeatureCollection:
+    """Prove that the results of a page are read as expected."""
+
+    @pytest.mark.parametrize("prefetch", [False, True])
+    def test_iter_page_without_sentinel(self, monkeypatch, prefetch, django_assert_num_queries):
+        """Prove that streaming a page returns only that page when a COUNT is used.
+        The extra sentinel row is only read when it replaces the COUNT query.
+        """
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED", 1)
+        Restaurant.objects.bulk_create([Restaurant(name=f"Restaurant {i}") for i in range(3)])
+        queryset = Restaurant.objects.order_by("pk")
+        if prefetch:
+            # Reads the results with the chunked iterator
+            queryset = queryset.prefetch_related("reviews")
+
+        collection = SimpleFeatureCollection(
+            source_query=None, feature_types=[], queryset=queryset, start=0, stop=2
+        )
+        with django_assert_num_queries(2 if prefetch else 1) as captured:
+            names = [restaurant.name for restaurant in collection]
+
+        assert names == ["Restaurant 0", "Restaurant 1"]
+        assert collection.number_returned == 2
+        assert "LIMIT 2" in captured.captured_queries[0]["sql"]
+
+    def test_iter_page_with_sentinel(self, monkeypatch):
+        """Prove that the sentinel row detects the next page, but is not returned."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED", 0)
+        Restaurant.objects.bulk_create([Restaurant(name=f"Restaurant {i}") for i in range(3)])
+
+        collection = SimpleFeatureCollection(
+            source_query=None,
+            feature_types=[],
+            queryset=Restaurant.objects.order_by("pk"),
+            start=0,
+            stop=2,
+        )
+        assert [restaurant.name for restaurant in collection] == ["Restaurant 0", "Restaurant 1"]
+        assert collection.number_returned == 2
+        assert collection.has_next
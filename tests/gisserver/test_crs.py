@@ -128,6 +128,17 @@ class TestCRS:
         wgs84_point2 = WGS84.apply_to(wgs84_point, clone=True)
         assert wgs84_point == wgs84_point2
 
+    def test_is_axis_swap_only(self):
+        """Prove that an axis swap is detected, so renderers can skip the transformation."""
+        db_point = Point(4.8936582, 52.3731716, srid=WGS84.srid)  # in storage ordering.
+        assert WGS84.is_axis_swap_only(db_point)
+        assert not WGS84.is_axis_swap_only(db_point, axis_order=AxisOrder.TRADITIONAL)
+
+        # Already tagged as y/x, or in a different CRS
+        wgs84_point = WGS84.apply_to(db_point, clone=True)
+        assert not WGS84.is_axis_swap_only(wgs84_point)
+        assert not WGS84.is_axis_swap_only(Point(121400, 487400, srid=28992))
+
     def test_axis_order_crs(self, settings):
         rd_point = Point(121400, 487400, srid=28992)
 
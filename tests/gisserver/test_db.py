@@ -0,0 +1,66 @@
+import threading
+from functools import partial
+
+import pytest
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from gisserver.db import get_estimated_count, run_concurrently
+from tests.test_gisserver import models
+
+
+@pytest.mark.django_db(transaction=True)
+class TestEstimatedCount:
+    """Prove that the number of results can be estimated from the table statistics."""
+
+    @pytest.mark.parametrize(
+        "db_table", ["test_gisserver_restaurant", 'public"."test_gisserver_restaurant']
+    )
+    def test_table_statistics(self, monkeypatch, many_restaurants, db_table):
+        """Prove that the table is found, also when the db_table includes the schema."""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE test_gisserver_restaurant")
+
+        monkeypatch.setattr(models.Restaurant._meta, "db_table", db_table)
+        with CaptureQueriesContext(connection) as captured:
+            count = get_estimated_count(models.Restaurant.objects.all())
+
+        assert count == 1500
+        assert "to_regclass" in captured.captured_queries[0]["sql"]
+        assert not any("COUNT(" in query["sql"] for query in captured.captured_queries)
+
+    def test_exact_below(self, many_restaurants):
+        """Prove that small estimates are counted exactly."""
+        with CaptureQueriesContext(connection) as captured:
+            count = get_estimated_count(models.Restaurant.objects.all(), exact_below=1_000_000)
+
+        assert count == 1500
+        assert "COUNT(" in captured.captured_queries[-1]["sql"]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRunConcurrently:
+    """Prove that database operations can run in the shared thread pool."""
+
+    def test_run_concurrently(self, settings, many_restaurants):
+        """Prove that the results are returned in order, and connections follow CONN_MAX_AGE."""
+        settings.GISSERVER_QUERY_THREADS = 2
+
+        def count(name):
+            result = models.Restaurant.objects.filter(name__startswith=name).count()
+            return result, threading.current_thread(), connections["default"]
+
+        results = run_concurrently(
+            [partial(count, "obj#1"), partial(count, "obj#2")], using=["default", "default"]
+        )
+        assert [result for result, _, _ in results] == [
+            models.Restaurant.objects.filter(name__startswith="obj#1").count(),
+            models.Restaurant.objects.filter(name__startswith="obj#2").count(),
+        ]
+        assert all(thread is not threading.current_thread() for _, thread, _ in results)
+
+        # With CONN_MAX_AGE=0, the connection of the pool thread is closed after each call.
+        # Other connections of the thread (and the main thread) are not affected.
+        assert connection.settings_dict["CONN_MAX_AGE"] == 0
+        assert all(thread_connection.connection is None for _, _, thread_connection in results)
+        assert connection.connection is not None
@@ -1,5 +1,7 @@
 import django
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from gisserver.features import FeatureField, FeatureType
 from gisserver.output import XmlSchemaRenderer
@@ -106,3 +108,49 @@ class TestGeneratedFields:
         assert ft.main_geometry_element.orm_path == "geometry_translated"
         assert ft.main_geometry_element.source_srid == 4326
         assert ft.main_geometry_element.type.is_geometry
+
+
+@pytest.mark.django_db(transaction=True)
+class TestFeatureTypeBoundingBox:
+    """Prove that the bounding box can be calculated exactly, or from table statistics."""
+
+    def test_estimated_extent(self, restaurant, bad_restaurant):
+        ft = FeatureType(models.Restaurant.objects.all(), estimated_extent=True)
+        exact = FeatureType(models.Restaurant.objects.all()).get_bounding_box()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {models.Restaurant._meta.db_table}")
+
+        with CaptureQueriesContext(connection) as captured:
+            bbox = ft.get_bounding_box()
+        assert any("ST_EstimatedExtent" in query["sql"] for query in captured.captured_queries)
+        assert bbox.min_x == pytest.approx(exact.min_x, abs=0.001)
+        assert bbox.min_y == pytest.approx(exact.min_y, abs=0.001)
+        assert bbox.max_x == pytest.approx(exact.max_x, abs=0.001)
+        assert bbox.max_y == pytest.approx(exact.max_y, abs=0.001)
+
+    def test_estimated_extent_filtered(self, restaurant, bad_restaurant):
+        """Prove that a filtered queryset still calculates the exact extent."""
+        ft = FeatureType(models.Restaurant.objects.filter(pk=restaurant.pk), estimated_extent=True)
+        with CaptureQueriesContext(connection) as captured:
+            bbox = ft.get_bounding_box()
+        assert not any("ST_EstimatedExtent" in query["sql"] for query in captured.captured_queries)
+        assert bbox.min_x == bbox.max_x
+
+    @pytest.mark.skipif(
+        django.VERSION < (5, 0), reason="GeneratedField is only available in Django >= 5"
+    )
+    def test_estimated_extent_not_analyzed(self, generated_field):
+        """Prove that a table without statistics falls back to the exact extent."""
+        queryset = models.ModelWithGeneratedFields.objects.all()
+        ft = FeatureType(queryset, geometry_field_name="geometry", estimated_extent=True)
+        exact = FeatureType(queryset, geometry_field_name="geometry").get_bounding_box()
+
+        with CaptureQueriesContext(connection) as captured:
+            bbox = ft.get_bounding_box()
+
+        # The estimate is tried first, but that table was never analyzed.
+        sql = [query["sql"] for query in captured.captured_queries]
+        assert "ST_EstimatedExtent" in sql[0]
+        assert len(sql) == 2
+        assert bbox == exact
@@ -2,8 +2,15 @@ import re
 from urllib.parse import quote_plus
 
 import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+from django.utils.translation import get_language
 from lxml import etree
 
+from gisserver.cache import clear_feature_type_cache
+from gisserver.operations.wfs20 import GetCapabilities
 from gisserver.parsers.xml import xmlns
 from tests.requests import Get, Post, Url, parametrize_response
 from tests.utils import (
@@ -162,6 +169,62 @@ class TestGetCapabilities:
         xml_doc = validate_xsd(response.content, WFS_20_XSD)
         assert xml_doc.attrib["version"] == "2.0.0"
 
+    def test_cached(self, client, restaurant, settings):
+        """Prove that the document and bounding boxes are cached, until they're invalidated."""
+        settings.GISSERVER_CAPABILITIES_CACHE_TIMEOUT = 60
+        settings.GISSERVER_BOUNDING_BOX_CACHE_TIMEOUT = 600
+        settings.ALLOWED_HOSTS = ["testserver", "example.com"]
+        cache.clear()
+        url = "/v1/wfs/?SERVICE=WFS&REQUEST=GetCapabilities&ACCEPTVERSIONS=2.0.0"
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert captured.captured_queries
+        content = response.content
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert response["content-type"] == "text/xml; charset=utf-8"
+        assert response.content == content
+        assert not captured.captured_queries
+
+        # Another server URL gives another document, but reuses the bounding boxes.
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url, HTTP_HOST="example.com")
+        assert response.status_code == 200
+        assert b"http://example.com/v1/wfs/" in response.content
+        assert not captured.captured_queries
+
+        # Invalidating recalculates the bounding box of that feature type only.
+        clear_feature_type_cache("restaurant")
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        assert response.content == content
+        assert len(captured.captured_queries) == 1
+
+    def test_cached_per_language(self, client, restaurant, settings, monkeypatch):
+        """Prove that each language has its own cached document."""
+        settings.GISSERVER_CAPABILITIES_CACHE_TIMEOUT = 60
+        cache.clear()
+        url = "/v1/wfs/?SERVICE=WFS&REQUEST=GetCapabilities&ACCEPTVERSIONS=2.0.0"
+        rendered = []
+        get_context_data = GetCapabilities.get_context_data
+        monkeypatch.setattr(
+            GetCapabilities,
+            "get_context_data",
+            lambda self: rendered.append(get_language()) or get_context_data(self),
+        )
+
+        for language in ("en", "nl", "en", "nl"):
+            with translation.override(language):
+                response = client.get(url)
+            assert response.status_code == 200
+            assert response["content-type"] == "text/xml; charset=utf-8"
+
+        assert rendered == ["en", "nl"]
+
     def test_missing_parameters(self, client):
         """Prove that missing arguments are handled"""
         response = client.get("/v1/wfs/?SERVICE=WFS")
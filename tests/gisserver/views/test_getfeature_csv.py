@@ -2,6 +2,7 @@ import django
 import pytest
 
 from tests.requests import Get, Post, Url, parametrize_response
+from tests.test_gisserver import models
 from tests.utils import XML_NS, read_response
 
 # enable for all tests in this file
@@ -44,6 +45,47 @@ class TestGetFeature:
 """.lstrip()  # noqa: E501
         assert content == expect
 
+    def test_get_csv_db_copy(self, client, restaurant, bad_restaurant, coordinates, settings):
+        """Prove that exporting the CSV with COPY gives the same output."""
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = True
+        response = client.get(
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=csv&SORTBY=id"
+        )
+        assert response["content-type"] == "text/csv; charset=utf-8"
+        content = read_response(response)
+        assert response.status_code == 200, content
+
+        expect = f"""
+"id","name","city_id","location","rating","is_open","created","tags"
+"{restaurant.id}","Café Noir","{restaurant.city_id}","{coordinates.point1_ewkt}","5.0","True","2020-04-05 12:11:10+00:00","cafe,black"
+"{bad_restaurant.id}","Foo Bar","","{coordinates.point2_ewkt}","1.0","False","2020-04-05 20:11:10+00:00",""
+""".lstrip()  # noqa: E501
+        assert content == expect
+
+    def test_get_csv_db_copy_floats(self, client, settings):
+        """Prove that COPY writes floats like str(float) does."""
+        for rating in (1e15, 1e16, float("nan")):
+            models.Restaurant.objects.create(name=f"Rating {rating}", rating=rating)
+
+        url = (
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=csv&PROPERTYNAME=name,rating&SORTBY=id"
+        )
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = True
+        db_content = read_response(client.get(url))
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = False
+        python_content = read_response(client.get(url))
+
+        expect = """
+"name","rating"
+"Rating 1000000000000000.0","1000000000000000.0"
+"Rating 1e+16","1e+16"
+"Rating nan","nan"
+""".lstrip()
+        assert python_content == expect
+        assert db_content == expect
+
     @pytest.mark.skipif(
         django.VERSION < (5, 0), reason="GeneratedField is only available in Django >= 5"
     )
@@ -1,8 +1,20 @@
+import gzip
+import re
+from datetime import datetime, timezone
+from urllib.parse import quote_plus
+
 import django
 import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from gisserver import conf
+from gisserver.cache import clear_feature_type_cache
+from gisserver.features import FeatureType
 from tests.requests import Get, Post, Url, parametrize_response
+from tests.test_gisserver import models
+from tests.test_gisserver.views import PlacesWFSView
 from tests.utils import XML_NS, read_json, read_response
 
 # enable for all tests in this file
@@ -98,6 +110,99 @@ class TestGetFeatureGeoJson:
             ],
         }
 
+    def test_get_geojson_db_feature_rendering(self, rf, restaurant, bad_restaurant, settings):
+        """Prove that rendering the whole feature in the database gives the same output."""
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = True
+        view = PlacesWFSView.as_view(
+            feature_types=[
+                FeatureType(
+                    models.Restaurant.objects.all(),
+                    fields=["id", "name", "location", "rating", "is_open"],
+                    display_field_name="name",
+                )
+            ]
+        )
+        response = view(
+            rf.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                "&outputformat=geojson"
+            )
+        )
+        content = read_response(response)
+        assert response.status_code == 200, content
+        data = read_json(content)
+
+        # Floats are written like orjson does, which is hidden when comparing parsed JSON.
+        assert '"rating" : 5.0,' in content
+        assert '"rating" : 1.0,' in content
+
+        # Compare without geometry, as that is covered in other tests.
+        features = [
+            {key: value for key, value in feature.items() if key != "geometry"}
+            for feature in data["features"]
+        ]
+        assert [feature["geometry"]["type"] for feature in data["features"]] == ["Point", "Point"]
+        assert features == [
+            {
+                "type": "Feature",
+                "id": f"restaurant.{restaurant.id}",
+                "geometry_name": "Café Noir",
+                "properties": {
+                    "id": restaurant.id,
+                    "name": "Café Noir",
+                    "rating": 5.0,
+                    "is_open": True,
+                },
+            },
+            {
+                "type": "Feature",
+                "id": f"restaurant.{bad_restaurant.id}",
+                "geometry_name": "Foo Bar",
+                "properties": {
+                    "id": bad_restaurant.id,
+                    "name": "Foo Bar",
+                    "rating": 1.0,
+                    "is_open": False,
+                },
+            },
+        ]
+
+    def test_get_geojson_db_feature_rendering_same_output(self, rf, restaurant, settings):
+        """Prove that the database writes the features exactly like the Python rendering."""
+        for rating in (1e15, 1.5e15, 1e16, 1e-5, 1.5e-7, float("nan"), float("inf")):
+            models.Restaurant.objects.create(
+                name=f"Rating {rating}", location=restaurant.location, rating=rating
+            )
+
+        view = PlacesWFSView.as_view(
+            feature_types=[
+                FeatureType(
+                    models.Restaurant.objects.all(),
+                    fields=["id", "name", "location", "rating", "is_open"],
+                    display_field_name="name",
+                )
+            ]
+        )
+        url = (
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=geojson"
+        )
+
+        def get_content():
+            content = read_response(view(rf.get(url)))
+            # Only the timestamp and whitespace may differ.
+            content = re.sub(r'"timeStamp" *: *"[^"]*"', "", content)
+            return re.sub(r"\s+", "", content)
+
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = True
+        db_content = get_content()
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = False
+        python_content = get_content()
+
+        assert '"rating":1000000000000000.0,' in python_content
+        assert '"rating":null,' in python_content
+        assert db_content == python_content
+
     @pytest.mark.skipif(
         django.VERSION < (5, 0), reason="GeneratedField is only available in Django >= 5"
     )
@@ -210,6 +315,213 @@ class TestGetFeatureGeoJson:
             }
         ]
 
+    @pytest.mark.parametrize("use_count", [1, 0])
+    def test_get_geojson_keyset_pagination(
+        self, client, use_count, monkeypatch, many_restaurants, django_assert_max_num_queries
+    ):
+        """Prove that keyset pagination walks through all pages, without OFFSET queries."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED", use_count)
+        monkeypatch.setattr(conf, "GISSERVER_KEYSET_PAGINATION", True)
+
+        url = (
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=geojson&SORTBY=name DESC&COUNT=600"
+        )
+        features = []
+        for page in range(3):
+            with django_assert_max_num_queries(1 + use_count) as captured:
+                data = read_json(read_response(client.get(url)))
+
+            features.extend(data["features"])
+            if page:
+                assert "CURSOR=" in url
+                assert "OFFSET" not in captured.captured_queries[0]["sql"]
+
+            if page < 2:
+                assert len(data["features"]) == 600
+                url = data["links"][0]["href"]
+                assert f"STARTINDEX={600 * (page + 1)}" in url
+            else:
+                assert len(data["features"]) == 300
+                assert data["links"][0]["rel"] == "previous"
+                assert "CURSOR" not in data["links"][0]["href"]
+
+        # All features are returned once, in the same order as a single query would have.
+        expected = models.Restaurant.objects.order_by("-name", "pk")
+        assert [f["id"] for f in features] == [f"restaurant.{r.pk}" for r in expected]
+
+    @pytest.mark.parametrize("use_count", [1, 0])
+    def test_get_geojson_pagination_no_server_side_cursors(
+        self, client, use_count, monkeypatch, many_restaurants
+    ):
+        """Prove that pages are read with keyset queries when server-side cursors are disabled."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED", use_count)
+        monkeypatch.setitem(connection.settings_dict, "DISABLE_SERVER_SIDE_CURSORS", True)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                "&outputformat=geojson&SORTBY=name DESC&COUNT=600&STARTINDEX=600"
+            )
+            data = read_json(read_response(response))
+        assert response.status_code == 200, data
+
+        assert len(data["features"]) == 600
+        assert data["numberReturned"] == 600
+        assert [link["rel"] for link in data["links"]] == ["next", "previous"]
+
+        expected = models.Restaurant.objects.order_by("-name", "pk")[600:1200]
+        assert [f["id"] for f in data["features"]] == [f"restaurant.{r.pk}" for r in expected]
+        assert any(
+            "OFFSET 600" in query["sql"] and "_keyset_0" in query["sql"]
+            for query in captured.captured_queries
+        )
+
+    @pytest.mark.parametrize("threshold", [0, 1_000_000])
+    def test_get_geojson_estimated_count(self, client, threshold, monkeypatch, many_restaurants):
+        """Prove that numberMatched can be estimated, and is exact below the threshold."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED", 3)
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_ESTIMATE_THRESHOLD", threshold)
+
+        filter = """
+            <fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0">
+                <fes:PropertyIsLike wildCard="*" singleChar="?" escapeChar="!">
+                    <fes:ValueReference>name</fes:ValueReference>
+                    <fes:Literal>obj*</fes:Literal>
+                </fes:PropertyIsLike>
+            </fes:Filter>"""
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                "&outputformat=geojson&COUNT=100&FILTER=" + quote_plus(filter.strip())
+            )
+            data = read_json(read_response(response))
+
+        sql = [query["sql"] for query in captured.captured_queries]
+        assert len(data["features"]) == 100
+        assert data["links"][0]["rel"] == "next"  # detected by the sentinel record.
+        assert sql[1].startswith("EXPLAIN")
+        if threshold:
+            assert data["numberMatched"] == 1500
+            assert "COUNT(*)" in sql[2]
+        else:
+            # The planner estimate is not exact, but includes this page.
+            assert data["numberMatched"] >= 100
+            assert len(sql) == 2
+
+    @pytest.mark.parametrize("limit", [1000, 5000])
+    def test_get_geojson_count_limit(self, client, limit, monkeypatch, many_restaurants):
+        """Prove that counting stops at the limit, which is reported as a lower bound."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_NUMBER_MATCHED_LIMIT", limit)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                "&outputformat=geojson&COUNT=100"
+            )
+            data = read_json(read_response(response))
+
+        assert len(data["features"]) == 100
+        assert data["links"][0]["rel"] == "next"  # detected by the sentinel record.
+        assert f"LIMIT {limit + 1}" in captured.captured_queries[1]["sql"]
+        if limit < 1500:
+            assert data["numberMatched"] is None
+            assert data["numberMatchedLowerBound"] == limit
+        else:
+            assert data["numberMatched"] == 1500
+            assert "numberMatchedLowerBound" not in data
+
+    def test_get_geojson_count_cache(self, client, monkeypatch, many_restaurants):
+        """Prove that numberMatched is counted once for all pages, until it's invalidated."""
+        monkeypatch.setattr(conf, "GISSERVER_COUNT_CACHE_TIMEOUT", 60)
+        cache.clear()
+
+        def get_page(start):
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(
+                    "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                    f"&outputformat=geojson&COUNT=100&STARTINDEX={start}"
+                )
+                data = read_json(read_response(response))
+            assert data["numberMatched"] == 1500
+            return [query["sql"] for query in captured.captured_queries]
+
+        assert any("COUNT(*)" in sql for sql in get_page(0))
+        assert not any("COUNT(*)" in sql for sql in get_page(100))
+
+        clear_feature_type_cache("restaurant")
+        assert any("COUNT(*)" in sql for sql in get_page(200))
+
+    @pytest.mark.parametrize("accept_encoding", ["gzip", "identity"])
+    def test_get_geojson_compressed(self, client, restaurant, settings, accept_encoding):
+        """Prove that the streaming output is compressed when the client accepts it."""
+        settings.GISSERVER_COMPRESS_STREAMING = True
+        settings.GISSERVER_COMPRESSION_LEVELS = {"gzip": 6}
+        response = client.get(
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=geojson",
+            HTTP_ACCEPT_ENCODING=accept_encoding,
+        )
+        assert response.status_code == 200
+        assert "Accept-Encoding" in response["Vary"]
+
+        content = b"".join(response)
+        if accept_encoding == "gzip":
+            assert response["Content-Encoding"] == "gzip"
+            content = gzip.decompress(content)
+        else:
+            assert not response.has_header("Content-Encoding")
+
+        data = read_json(content)
+        assert data["numberReturned"] == 1
+        assert data["features"][0]["properties"]["name"] == "Café Noir"
+
+    def test_get_geojson_conditional(self, client, restaurant, monkeypatch):
+        """Prove that clients can revalidate their cached copy with the ETag."""
+        version = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        monkeypatch.setattr(FeatureType, "get_data_version", lambda self: version)
+        url = (
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=geojson"
+        )
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response["Last-Modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+        etag = response["ETag"]
+        read_response(response)
+
+        # The response is given before any query is made.
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not captured.captured_queries
+
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE="Wed, 01 Jan 2025 00:00:00 GMT")
+        assert response.status_code == 304
+
+        # Other parameters and new data give a different ETag.
+        response = client.get(f"{url}&COUNT=1", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        read_response(response)
+
+        version = datetime(2025, 1, 2, tzinfo=timezone.utc)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        read_response(response)
+
+    def test_get_geojson_invalid_cursor(self, client, monkeypatch):
+        """Prove that a tampered cursor is rejected."""
+        monkeypatch.setattr(conf, "GISSERVER_KEYSET_PAGINATION", True)
+        response = client.get(
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&outputformat=geojson&COUNT=10&CURSOR=foobar"
+        )
+        assert response.status_code == 400
+        assert b"Invalid cursor value." in response.content
+
     @parametrize_response(
         Get(
             "?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0"
@@ -2,7 +2,8 @@ from urllib.parse import quote_plus
 
 import django
 import pytest
-from django.db import OperationalError
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
 
 from gisserver import conf, output
 from tests.gisserver.views.input import GENERATED_FIELD_FILTER
@@ -885,6 +886,116 @@ class TestGetFeature:
         assert len(names) == 2
         assert names[0] != names[1]
 
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize("spooled", [False, True])
+    def test_pagination_concurrent_count(
+        self, client, restaurant, bad_restaurant, settings, spooled
+    ):
+        """Prove that the COUNT can run in a background thread, sharing the same snapshot."""
+        settings.GISSERVER_CONCURRENT_COUNT = True
+        settings.GISSERVER_GML_SPOOLED_OUTPUT = spooled
+
+        with CaptureQueriesContext(connection) as captured:
+            res = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                "&SORTBY=name&COUNT=1"
+            )
+            content = read_response(res)
+        assert res.status_code == 200, content
+
+        xml_doc = validate_xsd(content, WFS_20_XSD)
+        assert xml_doc.attrib["numberMatched"] == "2"
+        assert xml_doc.attrib["numberReturned"] == "1"
+        assert "next" in xml_doc.attrib
+
+        # The main connection exported the snapshot, the COUNT happened elsewhere.
+        sql = [query["sql"] for query in captured.captured_queries]
+        assert "SELECT pg_export_snapshot()" in sql
+        assert not any("COUNT(*)" in query for query in sql)
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize("spooled", [False, True])
+    def test_pagination_concurrent_count_multiple(
+        self, client, restaurant, bad_restaurant, settings, spooled
+    ):
+        """Prove that each query of a request is counted in the background."""
+        settings.GISSERVER_CONCURRENT_COUNT = True
+        settings.GISSERVER_GML_SPOOLED_OUTPUT = spooled
+
+        res = client.get(
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0"
+            "&TYPENAMES=(restaurant)(mini-restaurant)&SORTBY=name&COUNT=1"
+        )
+        content = read_response(res)
+        assert res.status_code == 200, content
+
+        xml_doc = validate_xsd(content, WFS_20_XSD)
+        assert xml_doc.attrib["numberMatched"] == "4"
+        assert xml_doc.attrib["numberReturned"] == "2"
+        sub_collections = xml_doc.findall(
+            "wfs:member/wfs:FeatureCollection", namespaces=NAMESPACES
+        )
+        assert [c.attrib["numberMatched"] for c in sub_collections] == ["2", "2"]
+
+    @pytest.mark.django_db(transaction=True)
+    def test_pagination_query_threads(self, client, restaurant, bad_restaurant, settings):
+        """Prove that multiple queries are counted and read in parallel."""
+        settings.GISSERVER_QUERY_THREADS = 2
+
+        with CaptureQueriesContext(connection) as captured:
+            res = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0"
+                "&TYPENAMES=(restaurant)(mini-restaurant)&SORTBY=name&COUNT=1"
+            )
+            content = read_response(res)
+        assert res.status_code == 200, content
+
+        xml_doc = validate_xsd(content, WFS_20_XSD)
+        assert xml_doc.attrib["numberMatched"] == "4"
+        assert xml_doc.attrib["numberReturned"] == "2"
+
+        # The collections are still written in the order of the queries.
+        collections = xml_doc.findall("wfs:member/wfs:FeatureCollection", namespaces=NAMESPACES)
+        assert len(collections) == 2
+        assert collections[0].find("wfs:member/app:restaurant", namespaces=NAMESPACES) is not None
+        assert (
+            collections[1].find("wfs:member/app:mini-restaurant", namespaces=NAMESPACES)
+            is not None
+        )
+
+        # All queries happened on the connections of the worker threads.
+        assert not captured.captured_queries
+
+    def test_pagination_spooled(self, client, restaurant, bad_restaurant, monkeypatch, settings):
+        """Prove that spooled output reads the results in a single pass."""
+        settings.GISSERVER_GML_SPOOLED_OUTPUT = True
+        monkeypatch.setattr(output.GML32Renderer, "chunk_size", 200)
+
+        def _fail(self):
+            raise AssertionError("results were fetched into memory")
+
+        monkeypatch.setattr(output.SimpleFeatureCollection, "fetch_results", _fail)
+
+        names = []
+        for start_index in range(2):
+            res = client.get(
+                "/v1/wfs/?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+                f"&SORTBY=name&COUNT=1&STARTINDEX={start_index}"
+            )
+            content = read_response(res)
+            assert res.status_code == 200, content
+
+            xml_doc = validate_xsd(content, WFS_20_XSD)
+            assert xml_doc.attrib["numberMatched"] == "2"
+            assert xml_doc.attrib["numberReturned"] == "1"
+            assert ("next" in xml_doc.attrib) == (start_index == 0)
+
+            restaurants = xml_doc.findall("wfs:member/app:restaurant", namespaces=NAMESPACES)
+            names.extend(res.find("app:name", namespaces=NAMESPACES).text for res in restaurants)
+
+        assert len(names) == 2
+        assert names[0] != names[1]
+
     @parametrize_response(
         Get(
             lambda: "?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0"
@@ -955,6 +1066,70 @@ class TestGetFeature:
         """,
         )
 
+    @parametrize_response(
+        Get(
+            lambda: "?SERVICE=WFS&REQUEST=GetFeature&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&PROPERTYNAME=name,city_id,location,is_open,created"
+        ),
+        Post(
+            lambda: f"""<GetFeature service="WFS" version="2.0.0" {XML_NS}>
+              <Query typeNames="restaurant">
+                <PropertyName>name</PropertyName>
+                <PropertyName>city_id</PropertyName>
+                <PropertyName>location</PropertyName>
+                <PropertyName>is_open</PropertyName>
+                <PropertyName>created</PropertyName>
+              </Query>
+            </GetFeature>
+            """
+        ),
+    )
+    def test_get_db_feature_rendering(
+        self, restaurant, empty_restaurant, coordinates, response, settings
+    ):
+        """Prove that rendering the whole feature in the database gives the same output."""
+        settings.GISSERVER_USE_DB_FEATURE_RENDERING = True
+        res = response()
+        content = read_response(res)
+        assert res.status_code == 200, content
+
+        xml_doc = validate_xsd(content, WFS_20_XSD)
+        timestamp = xml_doc.attrib["timeStamp"]
+        assert_xml_equal(
+            content,
+            f"""<wfs:FeatureCollection
+   xmlns:app="http://example.org/gisserver"
+   xmlns:gml="http://www.opengis.net/gml/3.2"
+   xmlns:wfs="http://www.opengis.net/wfs/2.0"
+   xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+   xsi:schemaLocation="http://example.org/gisserver http://testserver/v1/wfs/?SERVICE=WFS&amp;VERSION=2.0.0&amp;REQUEST=DescribeFeatureType&amp;TYPENAMES=app:restaurant http://www.opengis.net/wfs/2.0 http://schemas.opengis.net/wfs/2.0/wfs.xsd http://www.opengis.net/gml/3.2 http://schemas.opengis.net/gml/3.2.1/gml.xsd"
+   timeStamp="{timestamp}" numberMatched="2" numberReturned="2">
+
+    <wfs:member>
+      <app:restaurant gml:id="restaurant.{restaurant.id}">
+        <app:name>Café Noir</app:name>
+        <app:city_id>{restaurant.city_id}</app:city_id>
+        <app:location>
+          <gml:Point gml:id="Restaurant.{restaurant.id}.1" srsName="urn:ogc:def:crs:EPSG::4326">
+            <gml:pos srsDimension="2">{coordinates.point1_xml_wgs84}</gml:pos>
+          </gml:Point>
+        </app:location>
+        <app:is_open>true</app:is_open>
+        <app:created>2020-04-05T12:11:10+00:00</app:created>
+      </app:restaurant>
+    </wfs:member>
+    <wfs:member>
+      <app:restaurant gml:id="restaurant.{empty_restaurant.id}">
+        <app:name>Empty</app:name>
+        <app:city_id xsi:nil="true" />
+        <app:location xsi:nil="true" />
+        <app:is_open>false</app:is_open>
+        <app:created>2020-04-05T12:11:10+00:00</app:created>
+      </app:restaurant>
+    </wfs:member>
+</wfs:FeatureCollection>""",  # noqa: E501
+        )
+
 
 def _fail_on_next_call(monkeypatch, target, name, fail_at=2, exception=None):
     """Make a function fail after it's called at least once."""
@@ -2,6 +2,7 @@ from urllib.parse import quote_plus
 
 import pytest
 
+from gisserver.output.results import SimpleFeatureCollection
 from tests.gisserver.views.input import (
     FILTERS,
     INVALID_FILTERS,
@@ -539,6 +540,27 @@ class TestGetPropertyValue:
         assert len(names) == 2
         assert names[0] != names[1]
 
+    def test_pagination_streamed(self, client, restaurant, bad_restaurant, monkeypatch, settings):
+        """Prove that the results are streamed in a single pass, not read into memory first."""
+        settings.GISSERVER_GML_SPOOLED_OUTPUT = True
+
+        def _fail(self):
+            raise AssertionError("results were fetched into memory")
+
+        monkeypatch.setattr(SimpleFeatureCollection, "fetch_results", _fail)
+        res = client.get(
+            "/v1/wfs/?SERVICE=WFS&REQUEST=GetPropertyValue&VERSION=2.0.0&TYPENAMES=restaurant"
+            "&VALUEREFERENCE=name&SORTBY=name&COUNT=1"
+        )
+        content = read_response(res)
+        assert res.status_code == 200, content
+
+        xml_doc = validate_xsd(content, WFS_20_XSD)
+        assert xml_doc.attrib["numberMatched"] == "2"
+        assert xml_doc.attrib["numberReturned"] == "1"
+        assert "STARTINDEX=1" in xml_doc.attrib["next"]
+        assert len(xml_doc.findall("wfs:member", namespaces=NAMESPACES)) == 1
+
     @parametrize_response(
         *(
             [
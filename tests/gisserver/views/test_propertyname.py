@@ -184,34 +184,35 @@ class TestPropertyName:
 
         # Prove that only the needed elements are retrieved
         sql = get_sql(queries)
+        opening_hour_ids = sorted(restaurant_m2m.opening_hours.values_list("pk", flat=True))
         assert sql == [
             (
                 "SELECT"
                 ' "test_gisserver_restaurant"."id",'
                 ' "test_gisserver_restaurant"."name",'
-                ' "test_gisserver_restaurant"."city_id"'
+                ' "test_gisserver_restaurant"."city_id",'
+                ' ARRAY(SELECT U0."id" AS "pk" FROM "test_gisserver_openinghour" U0'
+                ' INNER JOIN "test_gisserver_restaurant_opening_hours" U1 ON (U0."id" = U1."openinghour_id")'
+                ' WHERE U1."restaurant_id" = ("test_gisserver_restaurant"."id")'
+                ' ORDER BY U0."weekday" ASC) AS "_prefetch_keys_opening_hours"'
                 ' FROM "test_gisserver_restaurant"'
                 ' ORDER BY "test_gisserver_restaurant"."id" ASC'
                 " LIMIT 5000"
             ),
             (
                 "SELECT"
-                ' "test_gisserver_city"."id",'
-                ' "test_gisserver_city"."name"'
-                ' FROM "test_gisserver_city"'
-                f' WHERE "test_gisserver_city"."id" IN ({restaurant_m2m.city_id})'
-            ),
-            (
-                "SELECT"
-                ' ("test_gisserver_restaurant_opening_hours"."restaurant_id") AS "_prefetch_related_val_restaurant_id",'
                 ' "test_gisserver_openinghour"."id",'
                 ' "test_gisserver_openinghour"."weekday",'
                 ' "test_gisserver_openinghour"."start_time"'
                 ' FROM "test_gisserver_openinghour"'
-                ' INNER JOIN "test_gisserver_restaurant_opening_hours"'
-                ' ON ("test_gisserver_openinghour"."id" = "test_gisserver_restaurant_opening_hours"."openinghour_id")'
-                f' WHERE "test_gisserver_restaurant_opening_hours"."restaurant_id" IN ({restaurant_m2m.id}, {bad_restaurant.id})'
-                ' ORDER BY "test_gisserver_openinghour"."weekday" ASC'
+                f' WHERE "test_gisserver_openinghour"."id" IN ({", ".join(map(str, opening_hour_ids))})'
+            ),
+            (
+                "SELECT"
+                ' "test_gisserver_city"."id",'
+                ' "test_gisserver_city"."name"'
+                ' FROM "test_gisserver_city"'
+                f' WHERE "test_gisserver_city"."id" IN ({restaurant_m2m.city_id})'
             ),
         ]
 